@@ -0,0 +1,181 @@
+"""
+Measures the duration of each stage of the CPACS 2 to 3.1 conversion on synthetic documents
+
+Usage: python benchmarks/bench_stages.py [--scale 1 2 4] [--repeat 3] [-o results.json] [--compare baseline.json]
+
+The documents are created by generate_cpacs.py. The results are stored as JSON,
+such that the results of different runs can be compared using --compare.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+from tixi3 import tixi3wrapper
+
+import cpacs2to3.tixi_helper as tixihelper
+from cpacs2to3 import rules
+from cpacs2to3.convert_coordinates import convert_geometry
+from cpacs2to3.cpacs_converter import (change_cpacs_version, convert_cpacs_xml, fix_empty_elements,
+                                       fix_guide_curve_profile_element_names, RULES_3_TO_31)
+from cpacs2to3.material import upgrade_material_cpacs_31
+from cpacs2to3.memory_usage import peak_rss_mb
+from cpacs2to3.uid_generator import uid_manager
+
+from generate_cpacs import generate_cpacs2, scaled_sizes, DEFAULT_SIZES
+
+STAGES = ['open', 'register_all_uids', 'fix_invalid_uids', 'convert_cpacs_xml', 'convert_geometry',
+          'upgrade_3_to_31', 'material_upgrade', 'save']
+
+
+class _StageTimer(object):
+    def __init__(self):
+        self.durations = OrderedDict()
+        self._start = time.perf_counter()
+
+    def stop(self, stage):
+        now = time.perf_counter()
+        self.durations[stage] = now - self._start
+        self._start = now
+
+
+def run_stages(document, output_file):
+    """
+    Converts the document to CPACS 3.1 stage by stage
+
+    :return: OrderedDict of stage name -> duration in seconds
+    """
+    timer = _StageTimer()
+
+    tixi = tixi3wrapper.Tixi3()
+    tixi.openString(document)
+    tixi.setCacheEnabled(1)
+    tixi.usePrettyPrint(1)
+    timer.stop('open')
+
+    uid_manager.register_all_uids(tixi)
+    timer.stop('register_all_uids')
+
+    uid_manager.fix_invalid_uids(tixi)
+    fix_empty_elements(tixi)
+    fix_guide_curve_profile_element_names(tixi)
+    timer.stop('fix_invalid_uids')
+
+    snapshot = tixihelper.DocumentSnapshot(tixi)
+    change_cpacs_version(tixi, "3.0")
+    convert_cpacs_xml(tixi)
+    timer.stop('convert_cpacs_xml')
+
+    convert_geometry(output_file, tixi, snapshot)
+    timer.stop('convert_geometry')
+
+    rules.apply_rules(tixi, RULES_3_TO_31)
+    timer.stop('upgrade_3_to_31')
+
+    upgrade_material_cpacs_31(tixi)
+    change_cpacs_version(tixi, "3.1")
+    timer.stop('material_upgrade')
+
+    tixi.save(output_file)
+    timer.stop('save')
+
+    tixi.close()
+    return timer.durations
+
+
+def bench(scales, repeat, sizes):
+    """
+    Runs all stages on documents of the given scales
+
+    :return: list of result dicts, one per scale. The duration of a stage is the minimum of all repetitions.
+    """
+    results = []
+    tmp_dir = tempfile.mkdtemp()
+    for scale in scales:
+        document_sizes = scaled_sizes(scale, **sizes)
+        document = generate_cpacs2(**document_sizes)
+        output_file = os.path.join(tmp_dir, 'synthetic_%d.xml' % scale)
+
+        durations = OrderedDict((stage, float('inf')) for stage in STAGES)
+        for _ in range(repeat):
+            for stage, duration in run_stages(document, output_file).items():
+                durations[stage] = min(durations[stage], duration)
+        os.remove(output_file)
+
+        results.append(OrderedDict([
+            ('scale', scale),
+            ('sizes', document_sizes),
+            ('document_bytes', len(document.encode('utf-8'))),
+            ('stages', durations),
+            ('total', sum(durations.values())),
+            ('peak_rss_mb', peak_rss_mb()),
+        ]))
+        print_result(results[-1])
+    os.rmdir(tmp_dir)
+    return results
+
+
+def print_result(result, baseline=None):
+    print("scale %d (%d kB):" % (result['scale'], result['document_bytes'] // 1024))
+    for stage, duration in list(result['stages'].items()) + [('total', result['total'])]:
+        line = "  %-20s %9.4f s" % (stage, duration)
+        if baseline is not None:
+            base = baseline['stages'].get(stage) if stage != 'total' else baseline['total']
+            if base:
+                line += "  (%.2fx)" % (duration / base)
+        print(line)
+
+
+def compare(results, baseline_file):
+    """
+    Prints the results relative to the results of a previous run with the same scales
+    """
+    with open(baseline_file) as f:
+        baseline = {result['scale']: result for result in json.load(f)['results']}
+
+    print("Compared to %s:" % baseline_file)
+    for result in results:
+        print_result(result, baseline.get(result['scale']))
+
+
+def main():
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description='Measures the duration of each conversion stage.')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 2, 4],
+                        help='Scales of the generated documents')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repetitions per scale')
+    parser.add_argument('-o', metavar='output_file', default=None, help='Store the results to this JSON file')
+    parser.add_argument('--compare', metavar='baseline_file', default=None,
+                        help='JSON file of a previous run to compare the results to')
+    for name, default in sorted(DEFAULT_SIZES.items()):
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=default)
+
+    args = parser.parse_args()
+
+    sizes = {name: getattr(args, name) for name in DEFAULT_SIZES}
+    results = bench(args.scale, args.repeat, sizes)
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+    if args.o is not None:
+        run = OrderedDict([
+            ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+            ('python', sys.version.split()[0]),
+            ('platform', platform.platform()),
+            ('repeat', args.repeat),
+            ('results', results),
+        ])
+        with open(args.o, 'w') as f:
+            json.dump(run, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
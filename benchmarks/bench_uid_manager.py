@@ -0,0 +1,44 @@
+"""
+Measures the registration and creation rates of the UIDManager
+
+Usage: python benchmarks/bench_uid_manager.py [n_uids]
+"""
+
+import sys
+import time
+
+from cpacs2to3.uid_generator import UIDManager
+
+
+def bench_registration(n_uids):
+    manager = UIDManager()
+    uids = ["wing_section%d_elem_transformation" % i for i in range(n_uids)]
+
+    start = time.perf_counter()
+    for uid in uids:
+        manager.register_uid(uid)
+    return time.perf_counter() - start
+
+
+def bench_creation(n_uids, n_prefixes=10):
+    manager = UIDManager()
+    prefixes = ["wing_section%d_transformation" % i for i in range(n_prefixes)]
+
+    start = time.perf_counter()
+    for i in range(n_uids):
+        manager.generate_uid(prefixes[i % n_prefixes])
+    return time.perf_counter() - start
+
+
+def main():
+    n_uids = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    duration = bench_registration(n_uids)
+    print("register_uid: %d uIDs in %.3f s (%.0f uIDs/s)" % (n_uids, duration, n_uids / duration))
+
+    duration = bench_creation(n_uids)
+    print("generate_uid: %d uIDs in %.3f s (%.0f uIDs/s)" % (n_uids, duration, n_uids / duration))
+
+
+if __name__ == '__main__':
+    main()
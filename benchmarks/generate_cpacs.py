@@ -0,0 +1,472 @@
+"""
+Generates synthetic CPACS 2 documents of scalable size, that validate against the CPACS 2.3.1 schema
+
+Usage: python benchmarks/generate_cpacs.py output_file [--wings 4] [--segments 8] [--scale 2] ...
+
+The documents contain all elements converted by cpacs2to3: wings with component segments,
+spars, ribs, cells with stringers, guide curves, materials and transformations.
+Duplicate and empty uIDs can be added to exercise fix_invalid_uids.
+"""
+
+import argparse
+import math
+from xml.etree import ElementTree
+
+
+# number of points of the generated airfoil and guide curve profiles
+N_AIRFOIL_POINTS = 41
+N_GUIDE_CURVE_POINTS = 5
+# number of different guide curve profiles shared by the guide curves
+N_GUIDE_CURVE_PROFILES = 3
+
+DEFAULT_SIZES = {
+    'configurations': 1,
+    'wings': 1,
+    'segments': 2,
+    'component_segments': 1,
+    'spars': 2,
+    'ribs': 2,
+    'stringers': 1,
+    'guide_curves': 0,
+    'materials': 2,
+    'fuselage_sections': 3,
+    'duplicate_uids': 0,
+    'empty_uids': 0,
+}
+
+
+def scaled_sizes(scale, **sizes):
+    """
+    Returns the sizes of a document, that is scale times as large as the document with the given sizes.
+    The number of wings is scaled, all other sizes are per wing and are kept.
+
+    :param scale: positive integer
+    :param sizes: sizes overriding DEFAULT_SIZES
+    """
+    result = dict(DEFAULT_SIZES)
+    result.update(sizes)
+    for name in ['wings', 'materials', 'duplicate_uids', 'empty_uids']:
+        result[name] *= scale
+    return result
+
+
+def _sub(parent, tag, text=None, **attrib):
+    element = ElementTree.SubElement(parent, tag, attrib)
+    if text is not None:
+        element.text = text
+    return element
+
+
+def _vector(values):
+    return ';'.join('%g' % value for value in values)
+
+
+def _add_point(parent, tag, x, y, z, **attrib):
+    point = _sub(parent, tag, **attrib)
+    _sub(point, 'x', '%g' % x)
+    _sub(point, 'y', '%g' % y)
+    _sub(point, 'z', '%g' % z)
+    return point
+
+
+def _add_transformation(parent, scaling=(1, 1, 1), translation=(0, 0, 0), ref_type='absLocal'):
+    transformation = _sub(parent, 'transformation')
+    _add_point(transformation, 'scaling', *scaling)
+    _add_point(transformation, 'rotation', 0, 0, 0)
+    _add_point(transformation, 'translation', *translation, refType=ref_type)
+    return transformation
+
+
+def _add_material_definition(parent, material_uid, thickness=0.002):
+    material = _sub(parent, 'material')
+    _sub(material, 'materialUID', material_uid)
+    _sub(material, 'thickness', '%g' % thickness)
+
+
+class _UidFactory(object):
+    """
+    Creates the uIDs of the elements, that can be made duplicate or empty
+    """
+
+    def __init__(self, n_duplicates, n_empty):
+        self.n_duplicates = n_duplicates
+        self.n_empty = n_empty
+
+    def positioning_uid(self, uid):
+        if self.n_empty > 0:
+            self.n_empty -= 1
+            return ''
+        if self.n_duplicates > 0:
+            self.n_duplicates -= 1
+            return 'DuplicatePositioning'
+        return uid
+
+
+def _add_fuselage(fuselages, model_prefix, n_sections, uids):
+    fuselage = _sub(fuselages, 'fuselage', uID=model_prefix + 'Fuselage')
+    _sub(fuselage, 'name', model_prefix + 'Fuselage')
+    _sub(fuselage, 'description', '')
+    _add_transformation(fuselage, ref_type='absGlobal')
+
+    sections = _sub(fuselage, 'sections')
+    for i in range(n_sections):
+        section = _sub(sections, 'section', uID='%sFuselage_Sec%d' % (model_prefix, i + 1))
+        _sub(section, 'name', 'Fuselage Section %d' % (i + 1))
+        _add_transformation(section)
+        element = _sub(_sub(section, 'elements'), 'element', uID='%sFuselage_Sec%d_El1' % (model_prefix, i + 1))
+        _sub(element, 'name', 'Fuselage Section %d Element' % (i + 1))
+        _sub(element, 'profileUID', 'FuselageCircle')
+        _add_transformation(element)
+
+    positionings = _sub(fuselage, 'positionings')
+    for i in range(n_sections):
+        positioning_uid = uids.positioning_uid('%sFuselage_Pos%d' % (model_prefix, i + 1))
+        positioning = _sub(positionings, 'positioning', uID=positioning_uid)
+        _sub(positioning, 'name', 'Fuselage Positioning %d' % (i + 1))
+        _sub(positioning, 'length', '0' if i == 0 else '2')
+        _sub(positioning, 'sweepAngle', '90')
+        _sub(positioning, 'dihedralAngle', '0')
+        if i > 0:
+            _sub(positioning, 'fromSectionUID', '%sFuselage_Sec%d' % (model_prefix, i))
+        _sub(positioning, 'toSectionUID', '%sFuselage_Sec%d' % (model_prefix, i + 1))
+
+    segments = _sub(fuselage, 'segments')
+    for i in range(1, n_sections):
+        segment = _sub(segments, 'segment', uID='%sFuselage_Seg%d' % (model_prefix, i))
+        _sub(segment, 'name', 'Fuselage Segment %d' % i)
+        _sub(segment, 'fromElementUID', '%sFuselage_Sec%d_El1' % (model_prefix, i))
+        _sub(segment, 'toElementUID', '%sFuselage_Sec%d_El1' % (model_prefix, i + 1))
+
+
+def _guide_curve_circumference(i_curve, n_curves):
+    # distributed over the upper and lower side of the profile, excluding the trailing edge
+    return -1. + 2. * (i_curve + 1) / (n_curves + 1)
+
+
+def _add_wing_segments(wing, prefix, n_segments, n_guide_curves):
+    segments = _sub(wing, 'segments')
+    for i in range(1, n_segments + 1):
+        segment = _sub(segments, 'segment', uID='%s_Seg%d' % (prefix, i))
+        _sub(segment, 'name', '%s Segment %d' % (prefix, i))
+        _sub(segment, 'fromElementUID', '%s_Sec%d_El1' % (prefix, i))
+        _sub(segment, 'toElementUID', '%s_Sec%d_El1' % (prefix, i + 1))
+
+        if n_guide_curves == 0:
+            continue
+        guide_curves = _sub(segment, 'guideCurves')
+        for j in range(n_guide_curves):
+            guide_curve = _sub(guide_curves, 'guideCurve', uID='%s_Seg%d_GuideCurve%d' % (prefix, i, j + 1))
+            _sub(guide_curve, 'name', '%s Segment %d Guide Curve %d' % (prefix, i, j + 1))
+            _sub(guide_curve, 'guideCurveProfileUID', 'GuideCurveProfile%d' % (j % N_GUIDE_CURVE_PROFILES + 1))
+            if i == 1:
+                _sub(guide_curve, 'fromRelativeCircumference', '%g' % _guide_curve_circumference(j, n_guide_curves))
+            else:
+                _sub(guide_curve, 'fromGuideCurveUID', '%s_Seg%d_GuideCurve%d' % (prefix, i - 1, j + 1))
+            _sub(guide_curve, 'toRelativeCircumference', '%g' % _guide_curve_circumference(j, n_guide_curves))
+
+
+def _add_shell(structure, tag, uid, n_cells, material_uids):
+    shell = _sub(structure, tag, uID=uid)
+    _add_material_definition(_sub(shell, 'skin'), material_uids[0])
+
+    stringer = _sub(shell, 'stringer')
+    _sub(stringer, 'stringerStructureUID', '')
+    _sub(stringer, 'pitch', '0.1')
+    _sub(stringer, 'angle', '0')
+
+    if n_cells == 0:
+        return
+
+    cells = _sub(shell, 'cells')
+    for i in range(n_cells):
+        cell = _sub(cells, 'cell', uID='%s_Cell%d' % (uid, i + 1))
+        _add_material_definition(_sub(cell, 'skin'), material_uids[(i + 1) % len(material_uids)])
+
+        stringer = _sub(cell, 'stringer')
+        _sub(stringer, 'stringerStructureUID', '')
+        _sub(stringer, 'pitch', '0.05')
+        _sub(stringer, 'angle', '0')
+
+        eta1, eta2 = float(i) / n_cells, float(i + 1) / n_cells
+        for tag, first, second, names in [('positioningLeadingEdge', 0.2, 0.2, ('xsi1', 'xsi2')),
+                                          ('positioningTrailingEdge', 0.7, 0.7, ('xsi1', 'xsi2')),
+                                          ('positioningInnerBorder', eta1, eta1, ('eta1', 'eta2')),
+                                          ('positioningOuterBorder', eta2, eta2, ('eta1', 'eta2'))]:
+            positioning = _sub(cell, tag)
+            _sub(positioning, names[0], '%g' % first)
+            _sub(positioning, names[1], '%g' % second)
+
+
+def _add_spars(structure, prefix, wing_prefix, n_spars, n_sections, material_uid):
+    spars = _sub(structure, 'spars')
+    positions = _sub(spars, 'sparPositions')
+    segments = _sub(spars, 'sparSegments')
+
+    for i in range(n_spars):
+        xsi = 0.15 + 0.6 * i / max(n_spars - 1, 1)
+        inner_uid = '%s_Spar%d_Inner' % (prefix, i + 1)
+        outer_uid = '%s_Spar%d_Outer' % (prefix, i + 1)
+
+        inner = _sub(positions, 'sparPosition', uID=inner_uid)
+        _sub(inner, 'eta', '0')
+        _sub(inner, 'xsi', '%g' % xsi)
+
+        # placed into a section element, which has to be converted using the wing segments
+        outer = _sub(positions, 'sparPosition', uID=outer_uid)
+        _sub(outer, 'elementUID', '%s_Sec%d_El1' % (wing_prefix, n_sections))
+        _sub(outer, 'xsi', '%g' % xsi)
+
+        segment = _sub(segments, 'sparSegment', uID='%s_Spar%d' % (prefix, i + 1))
+        _sub(segment, 'name', 'Spar %d' % (i + 1))
+        _sub(segment, 'description', 'Spar %d of %s' % (i + 1, prefix))
+        position_uids = _sub(segment, 'sparPositionUIDs')
+        _sub(position_uids, 'sparPositionUID', inner_uid)
+        _sub(position_uids, 'sparPositionUID', outer_uid)
+        cross_section = _sub(segment, 'sparCrossSection')
+        web = _sub(cross_section, 'web1')
+        _add_material_definition(web, material_uid)
+        _sub(web, 'relPos', '0.5')
+        _sub(cross_section, 'rotation', '90')
+
+
+def _add_ribs(structure, prefix, wing_prefix, n_ribs, n_sections, material_uid):
+    definitions = _sub(structure, 'ribsDefinitions')
+    for i in range(n_ribs):
+        definition = _sub(definitions, 'ribsDefinition', uID='%s_Ribs%d' % (prefix, i + 1))
+        _sub(definition, 'name', 'Ribs %d' % (i + 1))
+
+        positioning = _sub(definition, 'ribsPositioning')
+        _sub(positioning, 'ribReference', 'leadingEdge')
+        if i % 2 == 0:
+            _sub(positioning, 'etaStart', '%g' % (0.1 * i / n_ribs))
+            _sub(positioning, 'etaEnd', '%g' % (0.1 * i / n_ribs + 0.5))
+        else:
+            # placed into section elements, which have to be converted using the wing segments
+            _sub(positioning, 'elementStartUID', '%s_Sec1_El1' % wing_prefix)
+            _sub(positioning, 'elementEndUID', '%s_Sec%d_El1' % (wing_prefix, n_sections))
+        _sub(positioning, 'ribStart', 'leadingEdge')
+        _sub(positioning, 'ribEnd', 'trailingEdge')
+        _sub(positioning, 'numberOfRibs', '5')
+        _sub(positioning, 'ribCrossingBehaviour', 'cross')
+        _sub(_sub(positioning, 'ribRotation'), 'z', '90')
+
+        _add_material_definition(_sub(definition, 'ribCrossSection'), material_uid)
+
+
+def _add_wing(wings, model_prefix, index, sizes, material_uids, uids):
+    prefix = '%sWing%d' % (model_prefix, index + 1)
+    n_segments = sizes['segments']
+    n_sections = n_segments + 1
+
+    wing = _sub(wings, 'wing', uID=prefix, symmetry='x-z-plane')
+    _sub(wing, 'name', prefix)
+    _sub(wing, 'parentUID', model_prefix + 'Fuselage')
+    _sub(wing, 'description', '')
+    _add_transformation(wing, translation=(2. * index, 0, 0.5 * index), ref_type='absGlobal')
+
+    sections = _sub(wing, 'sections')
+    for i in range(1, n_sections + 1):
+        section = _sub(sections, 'section', uID='%s_Sec%d' % (prefix, i))
+        _sub(section, 'name', '%s Section %d' % (prefix, i))
+        _add_transformation(section)
+        element = _sub(_sub(section, 'elements'), 'element', uID='%s_Sec%d_El1' % (prefix, i))
+        _sub(element, 'name', '%s Section %d Element' % (prefix, i))
+        _sub(element, 'airfoilUID', 'Airfoil')
+        scale = 1. - 0.5 * (i - 1) / n_segments
+        _add_transformation(element, scaling=(scale, scale, scale), translation=(0.5 * (1 - scale), 0, 0))
+
+    positionings = _sub(wing, 'positionings')
+    for i in range(1, n_sections + 1):
+        positioning = _sub(positionings, 'positioning', uID=uids.positioning_uid('%s_Pos%d' % (prefix, i)))
+        _sub(positioning, 'name', '%s Positioning %d' % (prefix, i))
+        _sub(positioning, 'length', '0' if i == 1 else '%g' % (4. / n_segments))
+        _sub(positioning, 'sweepAngle', '5')
+        _sub(positioning, 'dihedralAngle', '3')
+        if i > 1:
+            _sub(positioning, 'fromSectionUID', '%s_Sec%d' % (prefix, i - 1))
+        _sub(positioning, 'toSectionUID', '%s_Sec%d' % (prefix, i))
+
+    _add_wing_segments(wing, prefix, n_segments, sizes['guide_curves'])
+
+    if sizes['component_segments'] == 0:
+        return
+
+    component_segments = _sub(wing, 'componentSegments')
+    for i in range(sizes['component_segments']):
+        cs_prefix = '%s_CS%d' % (prefix, i + 1)
+        component_segment = _sub(component_segments, 'componentSegment', uID=cs_prefix)
+        _sub(component_segment, 'name', cs_prefix)
+        _sub(component_segment, 'fromElementUID', '%s_Sec1_El1' % prefix)
+        _sub(component_segment, 'toElementUID', '%s_Sec%d_El1' % (prefix, n_sections))
+
+        structure = _sub(component_segment, 'structure')
+        _add_shell(structure, 'upperShell', cs_prefix + '_UpperShell', sizes['stringers'], material_uids)
+        _add_shell(structure, 'lowerShell', cs_prefix + '_LowerShell', sizes['stringers'], material_uids)
+        if sizes['ribs'] > 0:
+            _add_ribs(structure, cs_prefix, prefix, sizes['ribs'], n_sections, material_uids[0])
+        if sizes['spars'] > 0:
+            _add_spars(structure, cs_prefix, prefix, sizes['spars'], n_sections, material_uids[-1])
+
+
+
+def _add_model(aircraft, index, sizes, material_uids, uids):
+    # the uIDs of the first model have no prefix
+    model_prefix = 'Model%d_' % (index + 1) if index > 0 else ''
+
+    model = _sub(aircraft, 'model', uID=model_prefix + 'SyntheticModel')
+    _sub(model, 'name', model_prefix + 'Synthetic')
+    reference = _sub(model, 'reference')
+    _sub(reference, 'area', '1')
+    _sub(reference, 'length', '1')
+    _add_point(reference, 'point', 0, 0, 0)
+
+    _add_fuselage(_sub(model, 'fuselages'), model_prefix, sizes['fuselage_sections'], uids)
+
+    wings = _sub(model, 'wings')
+    for i in range(sizes['wings']):
+        _add_wing(wings, model_prefix, i, sizes, material_uids, uids)
+
+
+def _add_profiles(vehicles, sizes):
+    profiles = _sub(vehicles, 'profiles')
+
+    # symmetric NACA 0012 profile from the trailing edge over the lower side to the upper side
+    airfoil = _sub(_sub(profiles, 'wingAirfoils'), 'wingAirfoil', uID='Airfoil')
+    _sub(airfoil, 'name', 'NACA0012')
+    n_half = N_AIRFOIL_POINTS // 2
+    x = [1. - 0.5 * (1 - math.cos(math.pi * i / n_half)) for i in range(n_half + 1)]
+    x = x + x[-2::-1]
+
+    def thickness(t):
+        return 0.6 * (0.2969 * math.sqrt(t) - 0.126 * t - 0.3516 * t ** 2 + 0.2843 * t ** 3 - 0.1036 * t ** 4)
+
+    z = [-thickness(t) for t in x[:n_half + 1]] + [thickness(t) for t in x[n_half + 1:]]
+    point_list = _sub(airfoil, 'pointList')
+    _sub(point_list, 'x', _vector(x), mapType='vector')
+    _sub(point_list, 'y', _vector([0.] * len(x)), mapType='vector')
+    _sub(point_list, 'z', _vector(z), mapType='vector')
+
+    fuselage_profile = _sub(_sub(profiles, 'fuselageProfiles'), 'fuselageProfile', uID='FuselageCircle')
+    _sub(fuselage_profile, 'name', 'Circle')
+    angles = [2. * math.pi * i / 16 for i in range(17)]
+    point_list = _sub(fuselage_profile, 'pointList')
+    _sub(point_list, 'x', _vector([0.] * len(angles)), mapType='vector')
+    _sub(point_list, 'y', _vector([math.sin(a) for a in angles]), mapType='vector')
+    _sub(point_list, 'z', _vector([math.cos(a) for a in angles]), mapType='vector')
+
+    if sizes['guide_curves'] == 0:
+        return
+
+    guide_curve_profiles = _sub(profiles, 'guideCurves')
+    for i in range(N_GUIDE_CURVE_PROFILES):
+        profile = _sub(guide_curve_profiles, 'guideCurveProfile', uID='GuideCurveProfile%d' % (i + 1))
+        _sub(profile, 'name', 'Guide Curve Profile %d' % (i + 1))
+        t = [float(j + 1) / (N_GUIDE_CURVE_POINTS + 1) for j in range(N_GUIDE_CURVE_POINTS)]
+        point_list = _sub(profile, 'pointList')
+        _sub(point_list, 'rX', _vector([0.] * len(t)), mapType='vector')
+        _sub(point_list, 'rY', _vector(t), mapType='vector')
+        _sub(point_list, 'rZ', _vector([0.02 * (i + 1) * math.sin(math.pi * s) for s in t]), mapType='vector')
+
+
+def _add_materials(vehicles, n_materials):
+    materials = _sub(vehicles, 'materials')
+    for i in range(n_materials):
+        uid = 'Material%d' % (i + 1)
+        material = _sub(materials, 'material', uID=uid)
+        _sub(material, 'name', uid)
+        _sub(material, 'rho', '%g' % (2800 - i))
+        if i % 2 == 0:
+            # isotropic
+            for tag, value in [('k11', 80956121647.4), ('k12', 26715520143.6), ('sig11', 359000000.0),
+                               ('tau12', 207000000.0)]:
+                _sub(material, tag, '%.12g' % value)
+        else:
+            # transversal isotropic
+            for tag, value in [('k11', 135866237991), ('k12', 4398471527), ('k22', 10420757731),
+                               ('k23', 3410913740), ('k66', 6274228870), ('sig11t', 1427214699),
+                               ('sig11c', 1503057026), ('sig22t', 39024324), ('sig22c', 206842710),
+                               ('tau12', 76531802), ('tau23', 76531802)]:
+                _sub(material, tag, '%.12g' % value)
+
+
+def _indent(element, level=0):
+    whitespace = '\n' + level * '  '
+    if len(element):
+        if not element.text or not element.text.strip():
+            element.text = whitespace + '  '
+        for child in element:
+            _indent(child, level + 1)
+        if not child.tail or not child.tail.strip():
+            child.tail = whitespace
+    if level and (not element.tail or not element.tail.strip()):
+        element.tail = whitespace
+
+
+def generate_cpacs2(**sizes):
+    """
+    Generates a CPACS 2 document
+
+    :param configurations: number of aircraft models. All models share the profiles and materials
+    :param wings: number of wings per model
+    :param segments: number of segments per wing
+    :param component_segments: number of component segments per wing
+    :param spars: number of spars per component segment
+    :param ribs: number of rib definitions per component segment
+    :param stringers: number of cells with stringers per shell
+    :param guide_curves: number of guide curves per wing segment
+    :param materials: number of materials
+    :param fuselage_sections: number of fuselage sections
+    :param duplicate_uids: number of positionings sharing the same uID
+    :param empty_uids: number of positionings with an empty uID
+    :return: the document as string
+    """
+    unknown = set(sizes) - set(DEFAULT_SIZES)
+    if unknown:
+        raise ValueError("Unknown sizes: %s" % ', '.join(sorted(unknown)))
+    values = dict(DEFAULT_SIZES)
+    values.update(sizes)
+    if values['materials'] < 1:
+        raise ValueError("At least one material is required")
+
+    uids = _UidFactory(values['duplicate_uids'], values['empty_uids'])
+
+    cpacs = ElementTree.Element('cpacs', {'xmlns:xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+                                          'xsi:noNamespaceSchemaLocation': 'cpacs_2.3.1.xsd'})
+    header = _sub(cpacs, 'header')
+    _sub(header, 'name', 'Synthetic')
+    _sub(header, 'description', ', '.join('%s=%d' % item for item in sorted(values.items())))
+    _sub(header, 'creator', 'cpacs2to3 benchmarks')
+    _sub(header, 'timestamp', '2020-01-01T00:00:00')
+    _sub(header, 'version', '1.0')
+    _sub(header, 'cpacsVersion', '2.3')
+
+    vehicles = _sub(cpacs, 'vehicles')
+    aircraft = _sub(vehicles, 'aircraft')
+    material_uids = ['Material%d' % (i + 1) for i in range(values['materials'])]
+    for i in range(values['configurations']):
+        _add_model(aircraft, i, values, material_uids, uids)
+
+    _add_profiles(vehicles, values)
+    _add_materials(vehicles, values['materials'])
+
+    _indent(cpacs)
+    return '<?xml version="1.0" encoding="utf-8"?>\n' + ElementTree.tostring(cpacs, encoding='unicode') + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates a synthetic CPACS 2 document.')
+    parser.add_argument('output_file')
+    parser.add_argument('--scale', type=int, default=1,
+                        help='Multiplies the number of wings, materials and invalid uIDs')
+    for name, default in sorted(DEFAULT_SIZES.items()):
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=default)
+
+    args = parser.parse_args()
+
+    sizes = scaled_sizes(args.scale, **{name: getattr(args, name) for name in DEFAULT_SIZES})
+    with open(args.output_file, 'w') as f:
+        f.write(generate_cpacs2(**sizes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Checks, that the runtime of each conversion pass grows at most linearly with the document size
+
+Usage: python benchmarks/scaling.py [--scale 1 2 4 8] [--dimensions wings segments] [--max-exponent 1.3]
+                                    [--stage-exponent convert_geometry=1.5] [-o results.json]
+
+Each pass is profiled on generated documents of growing size. The growth exponents of the
+runtime and of the number of TiXI/TiGL calls are fitted on a log-log scale against the scale of
+the document. The script fails, if a pass grows faster than the allowed exponent.
+
+The size of the documents is scaled in one dimension at a time (e.g. the number of wings or the
+number of segments per wing). Fitting against the scaled size instead of the total number of elements
+avoids false alarms for passes, that are linear in a part of the document, that grows faster than the rest.
+"""
+
+import argparse
+import json
+import logging
+import math
+import sys
+from collections import OrderedDict
+
+from tixi3 import tixi3wrapper
+
+from cpacs2to3 import profiling
+from cpacs2to3.cpacs_converter import upgrade_document, VersionUpdater
+
+from generate_cpacs import generate_cpacs2, scaled_sizes, DEFAULT_SIZES
+
+
+class _Args(object):
+    """
+    Command line args of the conversion of a generated document
+    """
+
+    def __init__(self, target_version):
+        self.input_file = 'synthetic.xml'
+        self.target_version = target_version
+        self.fix_errors = True
+        self.configurations = None
+        self.geometry_jobs = 1
+        self.fixed_file = None
+
+
+def fit_exponent(sizes, values):
+    """
+    Fits values = c * sizes ^ exponent by least squares on a log-log scale
+
+    :return: the exponent or None, if there are less than two positive values
+    """
+    points = [(math.log(size), math.log(value)) for size, value in zip(sizes, values) if value > 0]
+    if len(points) < 2:
+        return None
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def profile_conversion(document, target_version, version_updater, repeat):
+    """
+    Converts the document with an active profiler
+
+    :return: tuple (number of elements, OrderedDict of stage -> (minimum wall time, library calls))
+    """
+    stages = OrderedDict()
+    n_nodes = None
+    for _ in range(repeat):
+        cpacs_file = tixi3wrapper.Tixi3()
+        cpacs_file.openString(document)
+
+        profiler = profiling.start()
+        try:
+            upgrade_document(cpacs_file, _Args(target_version), version_updater)
+        finally:
+            profiling.stop()
+        cpacs_file.close()
+
+        n_nodes = profiler.node_counts['input']
+
+        # stages, that occur several times (e.g. for each configuration), are summed up
+        totals = OrderedDict()
+        for stage in profiler.stages:
+            wall, calls = totals.get(stage['stage'], (0., 0))
+            totals[stage['stage']] = (wall + stage['wall_s'], calls + stage['library_calls'])
+
+        for name, (wall, calls) in totals.items():
+            if name in stages:
+                wall = min(wall, stages[name][0])
+            stages[name] = (wall, calls)
+
+    return n_nodes, stages
+
+
+def measure_scaling(dimension, scales, base_sizes, target_version, repeat):
+    """
+    Profiles the conversion of documents, whose size in the given dimension grows with the scales
+
+    :param dimension: name of a size of generate_cpacs2. 'wings' scales the whole document
+    :return: tuple (list of element counts, OrderedDict of stage -> list of (wall time, library calls))
+    """
+    version_updater = VersionUpdater()
+
+    n_nodes = []
+    measurements = OrderedDict()
+    for scale in scales:
+        if dimension == 'wings':
+            sizes = scaled_sizes(scale, **base_sizes)
+        else:
+            sizes = dict(base_sizes)
+            sizes[dimension] = base_sizes[dimension] * scale
+
+        nodes, stages = profile_conversion(generate_cpacs2(**sizes), target_version, version_updater, repeat)
+        n_nodes.append(nodes)
+        for name, value in stages.items():
+            measurements.setdefault(name, []).append(value)
+
+    # passes, that don't run on all scales, cannot be fitted
+    measurements = OrderedDict((name, values) for name, values in measurements.items()
+                               if len(values) == len(scales))
+    return n_nodes, measurements
+
+
+def check_scaling(scales, measurements, max_exponent, stage_exponents, min_time):
+    """
+    Fits the growth exponents of all stages and compares them to the allowed exponents
+
+    :param stage_exponents: dict of stage name -> allowed exponent, overriding max_exponent.
+                            The name is matched against the last part of the stage path.
+    :param min_time: runtime exponents of stages faster than this (in seconds) on the largest document are not checked,
+                     because they are dominated by noise
+    :return: list of result dicts
+    """
+    results = []
+    for name, values in measurements.items():
+        walls = [wall for wall, _ in values]
+        calls = [n for _, n in values]
+        allowed = stage_exponents.get(name.split('/')[-1], stage_exponents.get(name, max_exponent))
+
+        time_exponent = fit_exponent(scales, walls)
+        call_exponent = fit_exponent(scales, calls)
+
+        violations = []
+        if call_exponent is not None and call_exponent > allowed:
+            violations.append('calls')
+        if time_exponent is not None and walls[-1] >= min_time and time_exponent > allowed:
+            violations.append('time')
+
+        results.append(OrderedDict([
+            ('stage', name),
+            ('wall_s', walls),
+            ('library_calls', calls),
+            ('time_exponent', time_exponent),
+            ('call_exponent', call_exponent),
+            ('allowed_exponent', allowed),
+            ('violations', violations),
+        ]))
+    return results
+
+
+def _format_exponent(exponent):
+    return '   -' if exponent is None else '%4.2f' % exponent
+
+
+def print_results(dimension, n_nodes, results):
+    print("Scaling of the number of %s (%s elements):" % (dimension, ', '.join(str(n) for n in n_nodes)))
+    print("  %-70s %6s %6s %7s" % ('stage', 'time', 'calls', 'allowed'))
+    for result in results:
+        print("  %-70s %6s %6s %7.2f %s" % (result['stage'], _format_exponent(result['time_exponent']),
+                                            _format_exponent(result['call_exponent']), result['allowed_exponent'],
+                                            'SUPERLINEAR (%s)' % ', '.join(result['violations'])
+                                            if result['violations'] else ''))
+
+
+def _parse_stage_exponent(text):
+    name, _, value = text.rpartition('=')
+    if not name:
+        raise argparse.ArgumentTypeError("expected stage=exponent, got '%s'" % text)
+    return name, float(value)
+
+
+def main():
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.WARNING)
+
+    parser = argparse.ArgumentParser(description='Detects conversion passes with superlinear runtime.')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Scales of the generated documents')
+    parser.add_argument('--dimensions', nargs='+', default=['wings', 'segments', 'stringers', 'guide_curves'],
+                        choices=sorted(DEFAULT_SIZES), help='Sizes of the document, that are scaled one after another')
+    parser.add_argument('--target-version', default='3.2')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repetitions per document')
+    parser.add_argument('--max-exponent', type=float, default=1.3,
+                        help='Allowed growth exponent of the runtime and the number of calls of each pass')
+    parser.add_argument('--stage-exponent', type=_parse_stage_exponent, action='append', default=[],
+                        metavar='STAGE=EXPONENT', help='Allowed growth exponent of a single pass')
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='Runtimes of passes faster than this on the largest document are not checked')
+    parser.add_argument('-o', metavar='output_file', default=None, help='Store the results to this JSON file')
+    for name, default in sorted(DEFAULT_SIZES.items()):
+        parser.add_argument('--' + name.replace('_', '-'), type=int, default=default,
+                            help='Size of the smallest document')
+
+    args = parser.parse_args()
+    if len(args.scale) < 2:
+        parser.error('at least two scales are required to fit the exponents')
+
+    base_sizes = {name: getattr(args, name) for name in DEFAULT_SIZES}
+    # sizes of 0 cannot be scaled. If guide curves are scaled, all documents get some
+    if base_sizes['guide_curves'] == 0 and 'guide_curves' in args.dimensions:
+        base_sizes['guide_curves'] = 1
+
+    stage_exponents = dict(args.stage_exponent)
+
+    all_results = OrderedDict()
+    n_violations = 0
+    for dimension in args.dimensions:
+        if base_sizes[dimension] == 0:
+            logging.warning("Skipping %s, its base size is 0" % dimension)
+            continue
+
+        n_nodes, measurements = measure_scaling(dimension, args.scale, base_sizes, args.target_version, args.repeat)
+        results = check_scaling(args.scale, measurements, args.max_exponent, stage_exponents, args.min_time)
+        print_results(dimension, n_nodes, results)
+
+        all_results[dimension] = OrderedDict([('scales', args.scale), ('elements', n_nodes), ('stages', results)])
+        n_violations += sum(1 for result in results if result['violations'])
+
+    if args.o is not None:
+        with open(args.o, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+    if n_violations > 0:
+        print("%d passes grow faster than allowed" % n_violations)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
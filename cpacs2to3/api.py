@@ -0,0 +1,155 @@
+"""
+Library interface to convert CPACS documents in memory.
+
+Example::
+
+    from cpacs2to3.api import convert, ConversionOptions
+
+    converted, report = convert(cpacs2_bytes, "3.2", ConversionOptions(fix_errors=True))
+
+The conversion does not need files. The loaded libraries and the VersionUpdater
+are reused by all conversions of the process.
+"""
+
+import logging
+import time
+
+from tixi3 import tixi3wrapper
+
+from cpacs2to3.cpacs_converter import VersionUpdater, get_cpacs_version, upgrade_document
+
+
+# shared by all conversions of this process
+_version_updater = None
+
+
+def _get_version_updater():
+    global _version_updater
+    if _version_updater is None:
+        _version_updater = VersionUpdater()
+    return _version_updater
+
+
+def warm_up():
+    """
+    Builds the shared VersionUpdater and loads the geometry stack,
+    such that the first conversion is not slower than the following ones
+    """
+    from cpacs2to3.convert_coordinates import preload_geometry_stack
+
+    _get_version_updater()
+    preload_geometry_stack()
+
+
+class ConversionOptions(object):
+    """
+    Options of a conversion
+
+    :param fix_errors: try to fix empty and duplicate uids/elements
+    :param configurations: list of configuration uIDs, whose geometry is converted. If None, all are converted
+    :param geometry_jobs: number of worker processes to convert the geometry of several configurations
+    :param cache_dir: directory of a persistent cache of geometry evaluations. If None, no cache is used
+    :param cache_size: size limit of the geometry cache in MB
+    :param element_index: keep an index of all elements to speed up queries on large documents
+    :param fixed_file: file to store the fixed CPACS 2 document to. If None, it is only returned in the report
+    :param name: name of the document used in log messages
+    :param memory_budget: memory budget in MB. If given, the conversion frees unused copies early, converts
+                          the geometry in this process and logs the memory usage after each stage
+    """
+
+    def __init__(self, fix_errors=False, configurations=None, geometry_jobs=1, cache_dir=None, cache_size=1024,
+                 element_index=False, fixed_file=None, name='<memory>', memory_budget=None):
+        self.fix_errors = fix_errors
+        self.configuration_list = configurations
+        self.geometry_jobs = geometry_jobs
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.element_index = element_index
+        self.fixed_file = fixed_file
+        self.name = name
+        self.memory_budget = memory_budget
+
+
+class ConversionReport(object):
+    """
+    Result information of a conversion
+
+    :ivar source_version: cpacs version of the input document
+    :ivar target_version: cpacs version of the converted document
+    :ivar fixed_document: the fixed CPACS 2 document, if fix_errors changed it, else None
+    :ivar messages: list of (level name, message) of all warnings and errors logged during the conversion
+    :ivar duration: duration of the conversion in seconds
+    """
+
+    def __init__(self):
+        self.source_version = None
+        self.target_version = None
+        self.fixed_document = None
+        self.messages = []
+        self.duration = 0.
+
+
+class _ReportHandler(logging.Handler):
+    def __init__(self, report):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.report = report
+
+    def emit(self, record):
+        self.report.messages.append((record.levelname, record.getMessage()))
+
+
+class _UpdateArgs(object):
+    """
+    Attributes of the command line args, that are used by the update steps
+    """
+
+    def __init__(self, options, target_version, report):
+        self.input_file = options.name
+        self.target_version = target_version
+        self.fix_errors = options.fix_errors
+        self.configurations = ','.join(options.configuration_list) if options.configuration_list else None
+        self.geometry_jobs = options.geometry_jobs
+        self.cache_dir = options.cache_dir
+        self.cache_size = options.cache_size
+        self.element_index = options.element_index
+        self.fixed_file = options.fixed_file
+        self.memory_budget = options.memory_budget
+        self.report = report
+
+
+def convert(document, target_version="3.2", options=None):
+    """
+    Converts a CPACS document to the target version
+
+    :param document: the CPACS document as bytes or str, or an opened TiXI 3 handle, which is converted in place
+    :param target_version: cpacs version to convert to
+    :param options: ConversionOptions. If None, the default options are used
+    :return: tuple (converted document as utf-8 encoded bytes, ConversionReport)
+    """
+    if options is None:
+        options = ConversionOptions()
+
+    report = ConversionReport()
+    report.target_version = target_version
+
+    if isinstance(document, (bytes, str)):
+        if isinstance(document, bytes):
+            document = document.decode('utf-8')
+        cpacs_file = tixi3wrapper.Tixi3()
+        cpacs_file.openString(document)
+    else:
+        cpacs_file = document
+
+    handler = _ReportHandler(report)
+    logging.getLogger().addHandler(handler)
+    start = time.time()
+    try:
+        report.source_version = get_cpacs_version(cpacs_file)
+        cpacs_file = upgrade_document(cpacs_file, _UpdateArgs(options, target_version, report),
+                                      _get_version_updater())
+        converted = cpacs_file.exportDocumentAsString()
+    finally:
+        report.duration = time.time() - start
+        logging.getLogger().removeHandler(handler)
+
+    return converted.encode('utf-8'), report
@@ -0,0 +1,170 @@
+"""
+Batch conversion of many CPACS files using a pool of worker processes.
+
+Each worker process loads TiXI and TiGL only once and keeps its VersionUpdater
+for all files it converts. This avoids paying the interpreter and library startup
+for every single file.
+"""
+
+import copy
+import glob
+import logging
+import multiprocessing
+import os
+import time
+
+from cpacs2to3.cpacs_converter import convert_file, VersionUpdater
+
+
+# state of the current worker process
+_worker_args = None
+_worker_updater = None
+
+
+def _is_glob_pattern(pattern):
+    return any(c in pattern for c in '*?[')
+
+
+def read_manifest(manifest_file):
+    """
+    Reads the list of input files from a manifest file.
+    Empty lines and lines starting with '#' are ignored.
+    Relative paths are interpreted relative to the manifest file.
+
+    :param manifest_file: path to the manifest
+    :return: list of file names
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    files = []
+    with open(manifest_file) as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            files.append(os.path.join(base_dir, line))
+    return files
+
+
+def collect_input_files(inputs, manifest_file=None):
+    """
+    Expands the list of inputs (files, directories and glob patterns) to a list of files
+
+    :param inputs: list of files, directories or glob patterns
+    :param manifest_file: optional manifest file with additional inputs
+    :return: list of file names without duplicates, in the order of the inputs
+    """
+    if manifest_file is not None:
+        inputs = list(inputs) + read_manifest(manifest_file)
+
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files.extend(sorted(glob.glob(os.path.join(item, '*.xml'))))
+        elif _is_glob_pattern(item):
+            files.extend(sorted(glob.glob(item)))
+        else:
+            files.append(item)
+
+    unique_files = []
+    seen = set()
+    for file in files:
+        key = os.path.abspath(file)
+        if key not in seen:
+            seen.add(key)
+            unique_files.append(file)
+    return unique_files
+
+
+def output_paths(files, output_dir):
+    """
+    Computes the output file of each input file.
+
+    The output files are named like the input files. If several input files from
+    different directories have the same name, the directories of all input files
+    relative to their common directory are mirrored in the output directory.
+
+    :param files: list of input files without duplicates
+    :param output_dir: output directory
+    :return: list of output file names
+    """
+    names = [os.path.basename(file) for file in files]
+    if len(set(names)) == len(names):
+        return [os.path.join(output_dir, name) for name in names]
+
+    abs_files = [os.path.abspath(file) for file in files]
+    common_dir = os.path.commonpath([os.path.dirname(file) for file in abs_files])
+    return [os.path.join(output_dir, os.path.relpath(file, common_dir)) for file in abs_files]
+
+
+def _init_worker(args):
+    global _worker_args, _worker_updater
+
+    logging.basicConfig(format='%(processName)s %(levelname)s: %(message)s', level=logging.DEBUG)
+    _worker_args = args
+    _worker_updater = VersionUpdater()
+
+
+def _convert_job(job):
+    """
+    Converts a single file inside a worker process
+
+    :return: tuple of (input file, error message or None, duration in seconds)
+    """
+    input_file, output_file = job
+    start = time.time()
+    try:
+        convert_file(input_file, output_file, _worker_args, _worker_updater)
+        return input_file, None, time.time() - start
+    except (Exception, SystemExit) as e:
+        # SystemExit must not kill the worker, otherwise the pool would wait forever for the result
+        logging.exception("Conversion of '%s' failed" % input_file)
+        return input_file, "%s: %s" % (type(e).__name__, e), time.time() - start
+
+
+def run_batch(args):
+    """
+    Converts all input files given in args into args.output_dir
+
+    :param args: command line args
+    :return: 0, if all files were converted successfully, 1 otherwise
+    """
+    files = collect_input_files(args.input_files, args.manifest)
+    if len(files) == 0:
+        logging.error("No input files found")
+        return 1
+
+    jobs = list(zip(files, output_paths(files, args.output_dir)))
+    for output_dir in set(os.path.dirname(output_file) for _, output_file in jobs):
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+    n_processes = max(1, min(args.jobs, len(jobs)))
+    if n_processes > 1 and getattr(args, 'geometry_jobs', 1) > 1:
+        # the workers are daemonic processes, which cannot start the geometry workers
+        logging.info("Converting the geometry of each file in its batch worker process")
+        args = copy.copy(args)
+        args.geometry_jobs = 1
+
+    logging.info("Converting %d files using %d worker processes" % (len(jobs), n_processes))
+    start = time.time()
+
+    if n_processes == 1:
+        _init_worker(args)
+        results = [_convert_job(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(n_processes, initializer=_init_worker, initargs=(args,)) as pool:
+            results = pool.map(_convert_job, jobs, chunksize=1)
+
+    n_failed = 0
+    logging.info("Summary:")
+    for input_file, error, duration in results:
+        if error is None:
+            logging.info("   OK      %s (%.1f s)" % (input_file, duration))
+        else:
+            n_failed += 1
+            logging.error("   FAILED  %s: %s" % (input_file, error))
+
+    logging.info("%d of %d files converted successfully in %.1f s"
+                 % (len(results) - n_failed, len(results), time.time() - start))
+
+    return 0 if n_failed == 0 else 1
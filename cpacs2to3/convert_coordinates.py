@@ -1,19 +1,136 @@
+"""
+Geometric conversions using TiGL 2 and TiGL 3.
+
+The geometry stack (TiGL, OCC and numpy) is imported only inside the functions that
+need it. Importing this module, e.g. by the converter for upgrades that don't touch the
+geometry, is therefore cheap.
+"""
+
 import logging
 import math
+import multiprocessing
+from collections import OrderedDict
 
-import numpy as np
-import tigl3.configuration
-try:
-    from OCC.TopoDS import topods
-except ImportError:
-    from OCC.Core.TopoDS import topods
-from tigl import tiglwrapper
-from tigl3 import tigl3wrapper
-from tigl3.configuration import transform_wing_profile_geometry
-from tigl3.geometry import get_length
+from tixi3 import tixi3wrapper
+from tixi3.tixi3wrapper import Tixi3Exception
 
+from cpacs2to3 import profiling
 from cpacs2to3 import tixi_helper as tixihelper
+from cpacs2to3.geometry_cache import GeometryCache, geometry_fingerprint
+from cpacs2to3.memory_usage import log_memory_usage
+from cpacs2to3.segment_index import SegmentIndex
 from cpacs2to3.tixi_helper import parent_path
+from cpacs2to3.uid_generator import uid_manager
+
+
+# eta values, that are converted from the old to the new component segment eta/xsi space
+ETA_XPATH = (
+    '//track/eta|' +
+    '//cutOutProfile/eta|' +
+    '//intermediateAirfoil/eta|'
+    # to convert eta/xsi values for wing cells, we have to convert them pairwise (eta and xsi together)
+    # but the cell borders might be described by spars and ribs, so we would have to interpret the borders on a spar or rib
+    # this is hard, so we skip this for now
+    #        '//positioningInnerBorder/eta1|' +
+    #        '//positioningOuterBorder/eta1|' +
+    #        '//positioningInnerBorder/eta2|' +
+    #        '//positioningOuterBorder/eta2|' +
+    # rib eta values depend on the reference line specified in ribReference or startReference/endReference
+    # those do not need to be converted
+    #        '//ribsPositioning/etaStart|' +
+    #        '//ribsPositioning/etaEnd|' +
+    #        '//ribExplicitPositioning/etaStart|' +
+    #        '//ribExplicitPositioning/etaEnd|' +
+    # similar problem as with wing cells
+    #        '//innerBorder/etaLE|' +
+    #        '//outerBorder/etaLE|' +
+    #        '//innerBorder/etaTE|' +
+    #        '//outerBorder/etaTE|' +
+    # we believe this is coupled with the xsiInside parameter
+    #        '//position/etaOutside|' +
+    # we do not have to convert these, as these are eta values on the spar (TODO: confirm this)
+    #        '//sparCell/fromEta|' +
+    #        '//sparCell/toEta'
+)
+
+# xsi values, that are converted from the old to the new component segment eta/xsi space
+XSI_XPATH = (''
+    #        '//stringer/innerBorderXsiLE|' +
+    #        '//stringer/innerBorderXsiTE|' +
+    #        '//stringer/outerBorderXsiLE|' +
+    #        '//stringer/outerBorderXsiTE|' +
+    #        '//innerBorder/xsiLE|' +
+    #        '//outerBorder/xsiLE|' +
+    #        '//innerBorder/xsiTE|' +
+    #        '//outerBorder/xsiTE|' +
+    #        '//position/xsiInside'
+)
+
+# eta/xsi pairs, that are converted from the old to the new component segment eta/xsi space
+ETA_XSI_XPATH = '//sparPosition/sparPositionEtaXsi|//stringer/refPoint'
+
+GUIDE_CURVE_XPATH = '//segments/segment/guideCurves/guideCurve'
+
+
+def preload_geometry_stack():
+    """
+    Imports TiGL 2, TiGL 3, OCC and numpy, which are otherwise only imported on their first use.
+    Used by long-running processes to pay the import cost before the first conversion.
+    """
+    import numpy
+    import tigl3.configuration
+    import tigl3.geometry
+    from tigl import tiglwrapper
+    from tigl3 import tigl3wrapper
+    try:
+        from OCC.TopoDS import topods
+    except ImportError:
+        from OCC.Core.TopoDS import topods
+
+
+class LazyTigl(object):
+    """
+    TiGL handle, that is only opened when it is used for the first time.
+    If all evaluations are taken from the geometry cache, TiGL is never opened.
+    """
+
+    def __init__(self, open_handle):
+        """
+        :param open_handle: function without arguments, that returns the opened TiGL handle
+        """
+        self._open_handle = open_handle
+        self._tigl = None
+
+    @property
+    def is_open(self):
+        return self._tigl is not None
+
+    def open(self, *args):
+        # a handle, that is not opened yet, will read the current document once it is used
+        if self._tigl is not None:
+            self._tigl.open(*args)
+
+    def close(self):
+        """
+        Closes the handle and frees its geometry. It is opened again, if it is used afterwards.
+        """
+        if self._tigl is not None:
+            self._tigl.close()
+            self._tigl = None
+
+    def __getattr__(self, name):
+        if self._tigl is None:
+            self._tigl = self._open_handle()
+        return getattr(self._tigl, name)
+
+
+def _cached(cache, kind, query, compute):
+    """
+    Returns the result of compute, using the geometry cache if there is one
+    """
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(kind, query, compute)
 
 
 def get_new_cs_coordinates(tigl2, tigl3, compseg_uid, eta_old, xsi_old):
@@ -26,61 +143,53 @@ def get_new_cs_coordinates(tigl2, tigl3, compseg_uid, eta_old, xsi_old):
     return tigl3.wingComponentSegmentPointGetEtaXsi(compseg_uid, px, py, pz)
 
 
-def convert_eta_xsi_values(tixi3, tigl2, tigl3, configuration=''):
+def evaluate_cs_coordinates(tigl2, tigl3, queries, cache=None):
+    """
+    Evaluates component segment coordinate queries in a batch. Each unique query is
+    evaluated only once, grouped by component segment.
+
+    :param queries: iterable of tuples (component segment uid, old eta, old xsi)
+    :param cache: optional GeometryCache
+    :return: dict, that maps each query to the new (eta, xsi) coordinates
+    """
+    queries_by_segment = OrderedDict()
+    for compseg_uid, eta, xsi in queries:
+        queries_by_segment.setdefault(compseg_uid, OrderedDict())[(eta, xsi)] = None
+
+    results = {}
+    for compseg_uid, points in queries_by_segment.items():
+        for eta, xsi in points:
+            results[(compseg_uid, eta, xsi)] = _cached(
+                cache, 'cs_coordinates', [compseg_uid, eta, xsi],
+                lambda: list(get_new_cs_coordinates(tigl2, tigl3, compseg_uid, eta, xsi)))
+    return results
+
+
+def convert_eta_xsi_values(tixi3, tigl2, tigl3, configuration='', cache=None):
     """
-    Converts all eta and xsi coordinates from the old component segment eta/xsi space to the new one
+    Converts all eta and xsi coordinates from the old component segment eta/xsi space to the new one.
+    All coordinates are collected first and evaluated in a batch, see evaluate_cs_coordinates.
     :param tixi3: TiXI 3 handle
     :param tigl2: TiGL 2 handle
     :param tigl3: TiGL 3 handle
+    :param configuration: uID of the configuration. If given, only the coordinates inside its model are converted
+    :param cache: optional GeometryCache
     """
 
+    model_xpath = _model_xpath(tixi3, configuration) if configuration else None
+
+    def scoped(xpath):
+        return xpath if model_xpath is None else _scoped_xpath(model_xpath, xpath)
+
     csUids = [tixi3.getTextAttribute(xpath, 'uID') for xpath in tixihelper.resolve_xpaths(tixi3, '//componentSegment[@uID]')]
     wingSegmentUids = [tixi3.getTextAttribute(xpath, 'uID') for xpath in
                        tixihelper.resolve_xpaths(tixi3, '//wing/segments/segment[@uID]')]
     tedUids = [tixi3.getTextAttribute(xpath, 'uID') for xpath in
                tixihelper.resolve_xpaths(tixi3, '//trailingEdgeDevice[@uID]')]
 
-    etaXpath = (
-        '//track/eta|' +
-        '//cutOutProfile/eta|' +
-        '//intermediateAirfoil/eta|'
-        # to convert eta/xsi values for wing cells, we have to convert them pairwise (eta and xsi together)
-        # but the cell borders might be described by spars and ribs, so we would have to interpret the borders on a spar or rib
-        # this is hard, so we skip this for now
-        #        '//positioningInnerBorder/eta1|' +
-        #        '//positioningOuterBorder/eta1|' +
-        #        '//positioningInnerBorder/eta2|' +
-        #        '//positioningOuterBorder/eta2|' +
-        # rib eta values depend on the reference line specified in ribReference or startReference/endReference
-        # those do not need to be converted
-        #        '//ribsPositioning/etaStart|' +
-        #        '//ribsPositioning/etaEnd|' +
-        #        '//ribExplicitPositioning/etaStart|' +
-        #        '//ribExplicitPositioning/etaEnd|' +
-        # similar problem as with wing cells
-        #        '//innerBorder/etaLE|' +
-        #        '//outerBorder/etaLE|' +
-        #        '//innerBorder/etaTE|' +
-        #        '//outerBorder/etaTE|' +
-        # we believe this is coupled with the xsiInside parameter
-        #        '//position/etaOutside|' +
-        # we do not have to convert these, as these are eta values on the spar (TODO: confirm this)
-        #        '//sparCell/fromEta|' +
-        #        '//sparCell/toEta'
-    )
-
-    # read all eta/uid definitions
-    for xpath in tixihelper.resolve_xpaths(tixi3, etaXpath):
-        eta = tixi3.getDoubleElement(xpath + '/eta')
-        uid = tixi3.getTextElement(xpath + '/referenceUID')
-
-        # TODO: determine xsi for all possible elements in etaXpath
-        # e.g. ribsPositioning/ribReference: leadingEdge = 0, trailingEdge = 1
-        xsi = 0
-
+    def references_compseg(uid):
         if uid in csUids:
-            newEta = get_new_cs_coordinates(tigl2, tigl3, uid, eta, xsi)[0]
-            tixi3.updateDoubleElement(xpath + '/eta', newEta, '%g')
+            return True
         elif uid in wingSegmentUids:
             # eta and xsi values in wing segments (which originated from wing sections) stay the same
             pass
@@ -90,21 +199,25 @@ def convert_eta_xsi_values(tixi3, tigl2, tigl3, configuration=''):
         else:
             print(
                 'ERROR: uid ' + uid + ' could not be resolved to a component segment, wing segment or trailing edge device')
+        return False
 
-    xsiXpath = (''
-                #        '//stringer/innerBorderXsiLE|' +
-                #        '//stringer/innerBorderXsiTE|' +
-                #        '//stringer/outerBorderXsiLE|' +
-                #        '//stringer/outerBorderXsiTE|' +
-                #        '//innerBorder/xsiLE|' +
-                #        '//outerBorder/xsiLE|' +
-                #        '//innerBorder/xsiTE|' +
-                #        '//outerBorder/xsiTE|' +
-                #        '//position/xsiInside'
-                )
+    # list of (xpath, names of the updated elements, query)
+    updates = []
+
+    # read all eta/uid definitions
+    for xpath in tixihelper.resolve_xpaths(tixi3, scoped(ETA_XPATH)):
+        eta = tixi3.getDoubleElement(xpath + '/eta')
+        uid = tixi3.getTextElement(xpath + '/referenceUID')
+
+        # TODO: determine xsi for all possible elements in etaXpath
+        # e.g. ribsPositioning/ribReference: leadingEdge = 0, trailingEdge = 1
+        xsi = 0
+
+        if references_compseg(uid):
+            updates.append((xpath, ('eta',), (uid, eta, xsi)))
 
     # read all xsi/uid definitions
-    for xpath in tixihelper.resolve_xpaths(tixi3, xsiXpath):
+    for xpath in tixihelper.resolve_xpaths(tixi3, scoped(XSI_XPATH)):
         xsi = tixi3.getDoubleElement(xpath + '/xsi')
         uid = tixi3.getTextElement(xpath + '/referenceUID')
 
@@ -112,38 +225,28 @@ def convert_eta_xsi_values(tixi3, tigl2, tigl3, configuration=''):
         # e.g. for wing cells we have to resolve inner and outer border, and if they point to ribs, we have to compute eta values for the ribs ...
         eta = 0
 
-        if uid in csUids:
-            newXsi = get_new_cs_coordinates(tigl2, tigl3, uid, eta, xsi)[1]
-            tixi3.updateDoubleElement(xpath + '/xsi', newXsi, '%g')
-        elif uid in wingSegmentUids:
-            # eta and xsi values in wing segments (which originated from wing sections) stay the same
-            pass
-        elif uid in tedUids:
-            # TODO has this even changed?
-            pass
-        else:
-            print(
-                'ERROR: uid ' + uid + ' could not be resolved to a component segment, wing segment or trailing edge device')
+        if references_compseg(uid):
+            updates.append((xpath, ('xsi',), (uid, eta, xsi)))
 
     # read all eta/xsi pairs
-    for xpath in tixihelper.resolve_xpaths(tixi3, '//sparPosition/sparPositionEtaXsi|//stringer/refPoint'):
+    for xpath in tixihelper.resolve_xpaths(tixi3, scoped(ETA_XSI_XPATH)):
         xsi = tixi3.getDoubleElement(xpath + '/xsi')
         eta = tixi3.getDoubleElement(xpath + '/eta')
         uid = tixi3.getTextElement(xpath + '/referenceUID')
 
-        if uid in csUids:
-            newEtaXsi = get_new_cs_coordinates(tigl2, tigl3, uid, eta, xsi)
+        if references_compseg(uid):
+            updates.append((xpath, ('eta', 'xsi'), (uid, eta, xsi)))
+
+    results = evaluate_cs_coordinates(tigl2, tigl3, (query for _, _, query in updates), cache)
+    logging.info("Evaluated {} unique of {} component segment coordinates".format(len(results), len(updates)))
+
+    # write back the new coordinates
+    for xpath, names, query in updates:
+        newEtaXsi = results[query]
+        if 'eta' in names:
             tixi3.updateDoubleElement(xpath + '/eta', newEtaXsi[0], '%g')
+        if 'xsi' in names:
             tixi3.updateDoubleElement(xpath + '/xsi', newEtaXsi[1], '%g')
-        elif uid in wingSegmentUids:
-            # eta and xsi values in wing segments (which originated from wing sections) stay the same
-            pass
-        elif uid in tedUids:
-            # TODO has this even changed?
-            pass
-        else:
-            print(
-                'ERROR: uid ' + uid + ' could not be resolved to a component segment, wing segment or trailing edge device')
 
     # reopen as we changed the TiXI document underneath
     # otherwise the changes to the TiXI document will be overwritten when TiGL saves the document
@@ -158,6 +261,12 @@ def get_chord_scale(wing, wing_connection):
     :param wing_connection:
     :return:
     """
+    try:
+        from OCC.TopoDS import topods
+    except ImportError:
+        from OCC.Core.TopoDS import topods
+    from tigl3.configuration import transform_wing_profile_geometry
+    from tigl3.geometry import get_length
 
     wing_transform = wing.get_transformation_matrix()
     inner_profile_wire = wing_connection.get_profile().get_chord_line_wire()
@@ -166,6 +275,8 @@ def get_chord_scale(wing, wing_connection):
 
 
 def get_inner_and_outer_scale(tigl3_h, wingUid, segmentUid):
+    import tigl3.configuration
+
     mgr = tigl3.configuration.CCPACSConfigurationManager_get_instance()
     config = mgr.get_configuration(tigl3_h._handle.value)
 
@@ -186,188 +297,673 @@ def get_inner_and_outer_scale(tigl3_h, wingUid, segmentUid):
     return get_chord_scale(wing, inner_connection), get_chord_scale(wing, outer_connection)
 
 
-def find_guide_curve_using_profile(tixi2, profileUid):
-    # check all guide curves of all fuselages and wings
+def map_guide_curve_profiles(tixi_handle):
+    """
+    Maps the uIDs of the guide curve profiles to the uIDs of the guide curves using them.
+    All guide curves of all fuselages and wings are read in a single pass.
+
+    :return: OrderedDict of profile uID -> list of guide curve uIDs. Fuselage guide curves come first.
+    """
+    profile_map = OrderedDict()
     for type in ['fuselage', 'wing']:
-        xpath = 'cpacs/vehicles/aircraft/model/{}s'.format(type)
-        if not tixi2.checkElement(xpath):
-            continue
-        n = tixi2.getNumberOfChilds(xpath)
-        for idx in range(0, n):
-            xpathSegments = xpath + '/{}[{}]/segments'.format(type, idx + 1)
-            nSegments = tixi2.getNumberOfChilds(xpathSegments)
-            for segmentIdx in range(0, nSegments):
-                xpathGuideCurves = xpathSegments + '/segment[{}]/guideCurves'.format(segmentIdx + 1)
-                if not tixi2.checkElement(xpathGuideCurves):
-                    continue
-                nCurves = tixi2.getNumberOfChilds(xpathGuideCurves)
-                for curveIdx in range(0, nCurves):
-                    xpathGuideCurve = xpathGuideCurves + '/guideCurve[{}]'.format(curveIdx + 1)
-                    currentProfileUid = tixi2.getTextElement(xpathGuideCurve + '/guideCurveProfileUID')
-
-                    if profileUid == currentProfileUid:
-                        return tixi2.getTextAttribute(xpathGuideCurve, 'uID')
-    return None
-
-
-def compute_new_guide_curve_points(tixi2, tigl2, tigl3, guide_curve_uid, n_profile_points):
+        xpath = '/cpacs/vehicles/aircraft/model/{0}s/{0}/segments/segment/guideCurves/guideCurve'.format(type)
+        for xpathGuideCurve in tixihelper.resolve_xpaths(tixi_handle, xpath):
+            profileUid = tixi_handle.getTextElement(xpathGuideCurve + '/guideCurveProfileUID')
+            guideCurveUid = tixi_handle.getTextAttribute(xpathGuideCurve, 'uID')
+            profile_map.setdefault(profileUid, []).append(guideCurveUid)
+    return profile_map
+
+
+def find_guide_curve_using_profile(tixi2, profileUid):
+    """
+    Returns the uID of the first guide curve using the given profile or None, if the profile is unused.
+    To look up several profiles, use map_guide_curve_profiles.
+    """
+    return map_guide_curve_profiles(tixi2).get(profileUid, [None])[0]
+
+
+def get_guide_curve_scales_and_axis(tixi2, tigl2, tigl3, guide_curve_uid, cache=None, segment_index=None):
+    """
+    Determines the scales at the start and the end of the segment of a guide curve and the x axis of its profile
+
+    :return: tuple (start scale, end scale, x axis) or None, if the guide curve is neither on a wing nor a fuselage
+    """
     guideCurveXPath = tixi2.uIDGetXPath(guide_curve_uid)
 
     # get start segment and end segment to determine the scale
     segmentXPath = parent_path(parent_path(guideCurveXPath))
 
-    rX = np.zeros([n_profile_points + 2, 1])
-    rY = np.zeros([n_profile_points + 2, 1])
-    rZ = np.zeros([n_profile_points + 2, 1])
-
     # check if the guideCurve is on a wing or a fuselage
     if 'wing' in guideCurveXPath:
         wingXPath = parent_path(parent_path(segmentXPath))
         wingUid = tixi2.getTextAttribute(wingXPath, 'uID')
         segmentUid = tixi2.getTextAttribute(segmentXPath, 'uID')
 
-        startScale, endScale = get_inner_and_outer_scale(tigl3, wingUid, segmentUid)
+        startScale, endScale = _cached(cache, 'inner_and_outer_scale', [wingUid, segmentUid],
+                                       lambda: get_inner_and_outer_scale(tigl3, wingUid, segmentUid))
 
         # CAUTION There is no user-defined x-axis in CPACS2 guide curves. We have to make a reasonable guess
         x = [1., 0., 0.]
     elif 'fuselage' in guideCurveXPath:
-        fromElementXPath = tixi2.uIDGetXPath(tixi2.getTextElement(segmentXPath + '/fromElementUID'))
-        startSectionXPath = parent_path(parent_path(fromElementXPath))
-        a = startSectionXPath.rfind('[') + 1
-        b = startSectionXPath.rfind(']')
-        startSectionIdx = int(startSectionXPath[a:b])
-
-        toElementXPath = tixi2.uIDGetXPath(tixi2.getTextElement(segmentXPath + '/toElementUID'))
-        endSectionXPath = parent_path(parent_path(toElementXPath))
-        a = endSectionXPath.rfind('[') + 1
-        b = endSectionXPath.rfind(']')
-        endSectionIdx = int(endSectionXPath[a:b])
-
-        startScale = tigl2.fuselageGetCircumference(1, startSectionIdx, 0) / math.pi
-        endScale = tigl2.fuselageGetCircumference(1, endSectionIdx - 1, 1) / math.pi
+        if segment_index is None:
+            segment_index = SegmentIndex(tixi2)
+        startSectionIdx = segment_index.section_index(tixi2.getTextElement(segmentXPath + '/fromElementUID'))
+        endSectionIdx = segment_index.section_index(tixi2.getTextElement(segmentXPath + '/toElementUID'))
+
+        startScale = _cached(cache, 'fuselageGetCircumference', [1, startSectionIdx, 0],
+                             lambda: tigl2.fuselageGetCircumference(1, startSectionIdx, 0)) / math.pi
+        endScale = _cached(cache, 'fuselageGetCircumference', [1, endSectionIdx - 1, 1],
+                           lambda: tigl2.fuselageGetCircumference(1, endSectionIdx - 1, 1)) / math.pi
         # CAUTION There is no user-defined x-axis in CPACS2 guide curves. We have to make a reasonable guess
         x = [0., 0., 1.]
     else:
         logging.error("Guide Curve Conversion is only implemented for fuselage and wing guide curves!")
         return None
 
+    return startScale, endScale, x
+
+
+def sample_guide_curve(tigl2, guide_curve_uid, n_points, cache=None):
+    """
+    Samples n_points points of a CPACS 2 guide curve using TiGL 2
+
+    :return: array of shape (3, n_points)
+    """
+    import numpy as np
+
     try:
-        px, py, pz = tigl2.getGuideCurvePoints(guide_curve_uid, n_profile_points + 2)
+        px, py, pz = _cached(cache, 'getGuideCurvePoints', [guide_curve_uid, n_points],
+                             lambda: [list(c) for c in tigl2.getGuideCurvePoints(guide_curve_uid, n_points)])
     except:
         logging.error("Cannot parse CPACS 2 Guide Curves using TiGL. Try running cpacs2to3 with -f option.")
         quit()
         return None
 
-    guideCurvePnts = np.zeros((3, n_profile_points + 2))
-    guideCurvePnts[0, :] = px
-    guideCurvePnts[1, :] = py
-    guideCurvePnts[2, :] = pz
+    return np.array([px, py, pz], dtype=float)
 
-    start = guideCurvePnts[:, 0]
-    end = guideCurvePnts[:, -1]
 
-    z = np.cross(x, end - start)
+def project_guide_curve_points(points, start_scale, end_scale, x):
+    """
+    Projects sampled guide curve points into the coordinate system of the CPACS 3 guide curve profiles.
+    All points, and optionally several stacked curves, are processed with whole-array operations.
+
+    :param points: array of shape (3, n) or (k, 3, n) for k stacked curves. The first and the last point are the
+                   ends of the curve
+    :param start_scale: scale at the start of the curve. Scalar or array of shape (k,)
+    :param end_scale: scale at the end of the curve. Scalar or array of shape (k,)
+    :param x: x axis of the profile
+    :return: tuple (rX, rY, rZ) of arrays of shape (n - 2,) or (k, n - 2), without the first and the last point.
+             The values of curves, whose first and last point coincide, are nan.
+    """
+    import numpy as np
 
-    znorm = np.linalg.norm(z)
-    if abs(znorm) < 1e-10:
-        logging.error(
-            "Error during guide curve profile point calculation: The last point and the first point seem to coincide!")
-        return None
+    points = np.asarray(points, dtype=float)
+    x = np.asarray(x, dtype=float).reshape(3, 1)
+    start_scale = np.asarray(start_scale, dtype=float)[..., np.newaxis]
+    end_scale = np.asarray(end_scale, dtype=float)[..., np.newaxis]
+
+    start = points[..., :, :1]
+    end = points[..., :, -1:]
+    direction = end - start
 
-    z = z / znorm
+    z = np.cross(x, direction, axis=-2)
+    znorm = np.linalg.norm(z, axis=-2, keepdims=True)
+    valid = znorm[..., 0, :] >= 1e-10
 
-    for i in range(0, np.size(guideCurvePnts, 1)):
-        current = guideCurvePnts[:, i]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = z / znorm
 
         # orthogonal projection
-        ny2 = np.dot(end - start, end - start)
-        rY[i] = np.dot(current - start, end - start) / ny2
+        ny2 = np.sum(direction * direction, axis=-2)
+        rY = np.sum((points - start) * direction, axis=-2) / ny2
 
-        scale = (1 - rY[i]) * startScale + rY[i] * endScale
-        midPoint = (1 - rY[i]) * start + rY[i] * end
+        scale = (1 - rY) * start_scale + rY * end_scale
+        midPoints = (1 - rY)[..., np.newaxis, :] * start + rY[..., np.newaxis, :] * end
 
-        rX[i] = np.dot(current - midPoint, x) / scale
-        rZ[i] = np.dot(current - midPoint, z) / scale
+        rX = np.sum((points - midPoints) * x, axis=-2) / scale
+        rZ = np.sum((points - midPoints) * z, axis=-2) / scale
+
+    rX = np.where(valid, rX, np.nan)
+    rY = np.where(valid, rY, np.nan)
+    rZ = np.where(valid, rZ, np.nan)
 
     # post-processing. Remove first and last point
-    rX = rX[1:-1]
-    rY = rY[1:-1]
-    rZ = rZ[1:-1]
+    return rX[..., 1:-1], rY[..., 1:-1], rZ[..., 1:-1]
+
+
+def _log_coinciding_guide_curve_ends():
+    logging.error(
+        "Error during guide curve profile point calculation: The last point and the first point seem to coincide!")
+
+
+def compute_new_guide_curve_points(tixi2, tigl2, tigl3, guide_curve_uid, n_profile_points, cache=None,
+                                   segment_index=None):
+    import numpy as np
+
+    scales_and_axis = get_guide_curve_scales_and_axis(tixi2, tigl2, tigl3, guide_curve_uid, cache, segment_index)
+    if scales_and_axis is None:
+        return None
+    startScale, endScale, x = scales_and_axis
+
+    guideCurvePnts = sample_guide_curve(tigl2, guide_curve_uid, n_profile_points + 2, cache)
+
+    rX, rY, rZ = project_guide_curve_points(guideCurvePnts, startScale, endScale, x)
+    if np.isnan(rY).any():
+        _log_coinciding_guide_curve_ends()
+        return None
 
     return rX, rY, rZ
 
 
+def compute_new_segment_guide_curve_points(tixi2, tigl2, tigl3, guide_curve_uids, n_profile_points, cache=None,
+                                           segment_index=None):
+    """
+    Computes the new profile points of several guide curves of the same segment as one stacked batch.
+    The scales of the segment are determined only once.
+
+    :param guide_curve_uids: uIDs of the guide curves, that must belong to the same segment
+    :param n_profile_points: number of profile points, which must be the same for all guide curves
+    :return: list with a tuple (rX, rY, rZ) for each guide curve, or None for curves that cannot be converted
+    """
+    import numpy as np
+
+    scales_and_axis = get_guide_curve_scales_and_axis(tixi2, tigl2, tigl3, guide_curve_uids[0], cache, segment_index)
+    if scales_and_axis is None:
+        return [None] * len(guide_curve_uids)
+    startScale, endScale, x = scales_and_axis
+
+    guideCurvePnts = np.stack([sample_guide_curve(tigl2, uid, n_profile_points + 2, cache)
+                               for uid in guide_curve_uids])
+
+    rX, rY, rZ = project_guide_curve_points(guideCurvePnts, startScale, endScale, x)
+
+    results = []
+    for i in range(len(guide_curve_uids)):
+        if np.isnan(rY[i]).any():
+            _log_coinciding_guide_curve_ends()
+            results.append(None)
+        else:
+            results.append((rX[i], rY[i], rZ[i]))
+    return results
+
+
+def _model_xpath(tixi3, configuration):
+    """
+    Returns the path of the model of the configuration or None, if the configuration cannot be found
+    """
+    try:
+        return tixi3.uIDGetXPath(configuration)
+    except Tixi3Exception:
+        return None
+
+
+def _scoped_xpath(model_xpath, xpath):
+    """
+    Restricts all parts of a union of descendant queries to the given model
+    """
+    return '|'.join(model_xpath + part.strip() for part in xpath.split('|') if part.strip() != '')
+
+
+def geometric_stages_needed(tixi3, configuration):
+    """
+    Cheap pre-scan, that decides which geometric conversion stages are needed for a configuration.
+    Only if any of them is needed, TiGL has to be loaded.
+
+    :param tixi3: TiXI 3 handle
+    :param configuration: uID of the configuration
+    :return: tuple (guide curves need to be converted, eta/xsi values need to be converted)
+    """
+    model_xpath = _model_xpath(tixi3, configuration)
+    if model_xpath is None:
+        logging.warning("Cannot find configuration `{}`. Running all geometric conversions.".format(configuration))
+        return True, True
+
+    convert_guide_curves = _guide_curve_stage_needed(tixi3, model_xpath, log=True)
+
+    convert_eta_xsi = True
+    if len(tixihelper.resolve_xpaths(tixi3, model_xpath + '//componentSegment[@uID]')) == 0:
+        logging.info("   Skipping eta/xsi conversion: no component segments")
+        convert_eta_xsi = False
+    else:
+        xpath = _scoped_xpath(model_xpath, ETA_XPATH + '|' + XSI_XPATH + '|' + ETA_XSI_XPATH)
+        if len(tixihelper.resolve_xpaths(tixi3, xpath)) == 0:
+            logging.info("   Skipping eta/xsi conversion: no component segment coordinates")
+            convert_eta_xsi = False
+
+    return convert_guide_curves, convert_eta_xsi
+
+
+def _guide_curve_stage_needed(tixi3, model_xpath, log=False):
+    """
+    Returns True, if the guide curves of the model have to be converted using TiGL
+    """
+    if not do_convert_guide_curves(tixi3):
+        reason = "disabled in the cpacs2to3 configuration"
+    elif not tixi3.checkElement("cpacs/vehicles/profiles/guideCurveProfiles") and \
+            not tixi3.checkElement("cpacs/vehicles/profiles/guideCurves"):
+        reason = "no guide curve profiles"
+    elif len(tixihelper.resolve_xpaths(tixi3, _scoped_xpath(model_xpath, GUIDE_CURVE_XPATH))) == 0:
+        reason = "no guide curves"
+    else:
+        return True
+
+    if log:
+        logging.info("   Skipping guide curve conversion: " + reason)
+    return False
+
+
+def tigl_might_be_needed(tixi_handle, configurations=None):
+    """
+    Pre-scan of the CPACS 2 document before its structural conversion, that decides whether
+    the geometric conversion might load TiGL. Only then, a snapshot of the CPACS 2 document is needed.
+
+    The structural conversion creates some of the eta/xsi elements, geometric_stages_needed looks for.
+    Hence, any component segment of a configuration is assumed to need the eta/xsi conversion.
+
+    :param tixi_handle: TiXI 3 handle of the CPACS 2 document
+    :param configurations: uIDs of the configurations to convert. All, if None or empty
+    :return: False, if geometric_stages_needed won't request any stage for the configurations
+    """
+    if configurations is None or len(configurations) == 0:
+        configurations = tixihelper.list_configurations(tixi_handle)
+
+    for configuration in configurations:
+        model_xpath = _model_xpath(tixi_handle, configuration)
+        if model_xpath is None or _guide_curve_stage_needed(tixi_handle, model_xpath):
+            return True
+        if len(tixihelper.resolve_xpaths(tixi_handle, model_xpath + '//componentSegment')) > 0:
+            return True
+    return False
+
+
 def do_convert_guide_curves(tixi_handle):
     # convert guide curves, if the curve_interp_xpath does not exist, or if if exists and is set to "1"
     curve_interp_xpath = "cpacs/header/update/cpacs2to3/configuration/convertGuideCurves"
     return (not tixi_handle.checkElement(curve_interp_xpath)) or tixi_handle.getTextElement(curve_interp_xpath) == "1"
 
-def convert_guide_curve_points(tixi3, tixi2, tigl2, tigl3, keep_unused_profiles=False):
+def prepare_guide_curve_profiles(tixi3, keep_unused_profiles=False):
+    """
+    Performs the structural changes of the guide curve profiles, that don't need TiGL:
+    Renames the profiles to the CPACS 3 names and removes unused profiles
+
+    :return: the map of profile uIDs to guide curve uIDs (see map_guide_curve_profiles)
+             or None, if there are no guide curve profiles to convert
+    """
 
     if not do_convert_guide_curves(tixi3):
-        return
+        return None
 
     # rename guideCurveProfiles to guideCurves
     if tixi3.checkElement("cpacs/vehicles/profiles/guideCurveProfiles"):
-        tixi3.renameElement("cpacs/vehicles/profiles", "guideCurveProfiles", "guideCurves")
+        uid_manager.rename_element(tixi3, "cpacs/vehicles/profiles", "guideCurveProfiles", "guideCurves")
 
     # check if there are any guide curves to convert
     xpath = "cpacs/vehicles/profiles/guideCurves"
     if not tixi3.checkElement(xpath):
-        return
+        return None
+
+    profile_map = map_guide_curve_profiles(tixi3)
+
+    unused_profiles = []
+    nProfiles = tixi3.getNumberOfChilds(xpath)
+    for idx in range(1, nProfiles + 1):
+        xpathProfile = xpath + '/guideCurveProfile[{}]'.format(idx)
+        profileUid = tixi3.getTextAttribute(xpathProfile, 'uID')
+
+        if profileUid not in profile_map:
+            # The guide curve profile appears to be unused
+            unused_profiles.append((xpathProfile, profileUid))
+        elif tixi3.checkElement(xpathProfile + "/pointList/x"):
+            # rename x to rX
+            uid_manager.rename_element(tixi3, xpathProfile + "/pointList", "x", "rX")
+
+    if not keep_unused_profiles and len(unused_profiles) > 0:
+        # If we don't need them, let's do some clean up
+        for _, profileUid in unused_profiles:
+            logging.info("   Removing unused guide curve profile {}".format(profileUid))
+        # remove from the back, so the paths of the remaining profiles stay valid
+        for xpathProfile, _ in reversed(unused_profiles):
+            uid_manager.remove_element(tixi3, xpathProfile)
+
+    return profile_map
+
+
+def snapshot_before_preparation(tixi3):
+    """
+    Takes a snapshot of the CPACS 3 document for TiGL 3, if prepare_guide_curve_profiles would change it.
+    TiGL 3 then reads the guide curve profiles as they were before the conversion, no matter when
+    its handle is opened.
+
+    :return: DocumentSnapshot or None, if there are no guide curve profiles to prepare
+    """
+    if not do_convert_guide_curves(tixi3):
+        return None
+    if not tixi3.checkElement("cpacs/vehicles/profiles/guideCurveProfiles") and \
+            not tixi3.checkElement("cpacs/vehicles/profiles/guideCurves"):
+        return None
+    return tixihelper.DocumentSnapshot(tixi3)
+
+
+def _write_guide_curve_profile_points(tixi3, xpathProfile, rX, rY, rZ):
+    tixi3.removeElement(xpathProfile + "/pointList")
+    tixi3.createElement(xpathProfile, "pointList")
+    tixi3.addFloatVector(xpathProfile + "/pointList", "rX", rX, len(rX), "%g")
+    tixi3.addFloatVector(xpathProfile + "/pointList", "rY", rY, len(rY), "%g")
+    tixi3.addFloatVector(xpathProfile + "/pointList", "rZ", rZ, len(rZ), "%g")
+
+
+def compute_guide_curve_points(tixi3, tixi2, tigl2, tigl3, keep_unused_profiles=False, cache=None,
+                               stack_segment_curves=True, configuration=None):
+    """
+    Computes the points of all used guide curve profiles in the CPACS 3 definition, without writing them.
+    Only the structural changes of prepare_guide_curve_profiles are applied to the document.
+
+    :param stack_segment_curves: if True, all guide curves of a segment with the same number of points
+                                 are converted in one stacked batch
+    :param configuration: uID of the configuration. If given, only the profiles, whose first guide curve
+                          belongs to its model, are computed. Hence, each profile is converted by exactly
+                          one configuration, even if it is shared by several of them.
+    :return: list of tuples (profile path, (rX, rY, rZ) or None, if the profile cannot be converted),
+             to be written with write_guide_curve_points
+    """
+
+    profile_map = prepare_guide_curve_profiles(tixi3, keep_unused_profiles)
+    if profile_map is None:
+        return []
 
     logging.info("Adapting guide curve profiles to CPACS 3 definition")
 
+    model_xpath = _model_xpath(tixi3, configuration) if configuration else None
+    segment_index = SegmentIndex(tixi2)
+
+    # group the profiles by the segment of their guide curve and their number of points
+    groups = OrderedDict()
+    xpath = "cpacs/vehicles/profiles/guideCurves"
     nProfiles = tixi3.getNumberOfChilds(xpath)
-    idx = 0
-    while idx < nProfiles:
-        idx += 1
+    for idx in range(1, nProfiles + 1):
         xpathProfile = xpath + '/guideCurveProfile[{}]'.format(idx)
         profileUid = tixi3.getTextAttribute(xpathProfile, 'uID')
 
-        guideCurveUid = find_guide_curve_using_profile(tixi3, profileUid)
+        if profileUid not in profile_map:
+            continue
+        guideCurveUid = profile_map[profileUid][0]
+        if model_xpath is not None and not tixi3.uIDGetXPath(guideCurveUid).startswith(model_xpath + '/'):
+            # converted by the configuration of its first guide curve
+            continue
 
-        if guideCurveUid is None:
-            # The guide curve profile appears to be unused
-            if not keep_unused_profiles:
-                # If we don't need it, let's do some clean up
-                logging.info("   Removing unused guide curve profile {}".format(profileUid))
-                tixi3.removeElement(xpathProfile)
-                idx -= 1
-                nProfiles -= 1
+        nProfilePoints = tixi3.getVectorSize(xpathProfile + "/pointList/rX")
+
+        if stack_segment_curves:
+            segmentXPath = parent_path(parent_path(tixi2.uIDGetXPath(guideCurveUid)))
+            key = (segmentXPath, nProfilePoints)
         else:
-            # rename x to rX
-            if tixi3.checkElement(xpathProfile + "/pointList/x"):
-                tixi3.renameElement(xpathProfile + "/pointList", "x", "rX")
-            nProfilePoints = tixi3.getVectorSize(xpathProfile + "/pointList/rX")
+            key = (xpathProfile, nProfilePoints)
+        groups.setdefault(key, []).append((xpathProfile, guideCurveUid))
+
+    points = []
+    for (_, nProfilePoints), profiles in groups.items():
+        guideCurveUids = [guideCurveUid for _, guideCurveUid in profiles]
+        if len(profiles) == 1:
+            results = [compute_new_guide_curve_points(tixi2, tigl2, tigl3, guideCurveUids[0], nProfilePoints, cache,
+                                                      segment_index)]
+        else:
+            results = compute_new_segment_guide_curve_points(tixi2, tigl2, tigl3, guideCurveUids, nProfilePoints,
+                                                             cache, segment_index)
+
+        points.extend((xpathProfile, result) for (xpathProfile, _), result in zip(profiles, results))
+    return points
+
+
+def write_guide_curve_points(tixi3, points):
+    """
+    Writes the profile points computed by compute_guide_curve_points.
+    Profiles, that could not be converted, are left unchanged.
+    """
+    for xpathProfile, result in points:
+        if result is not None:
+            rX, rY, rZ = result
+            _write_guide_curve_profile_points(tixi3, xpathProfile, rX, rY, rZ)
+
+
+def convert_guide_curve_points(tixi3, tixi2, tigl2, tigl3, keep_unused_profiles=False, cache=None,
+                               stack_segment_curves=True):
+    """
+    Converts the points of all used guide curve profiles to the CPACS 3 definition
+
+    All points are computed before the first profile is written. Otherwise, a TiGL 3 handle,
+    that is only opened on the first cache miss, would read partly converted profiles.
+
+    :param stack_segment_curves: if True, all guide curves of a segment with the same number of points
+                                 are converted in one stacked batch
+    """
+    points = compute_guide_curve_points(tixi3, tixi2, tigl2, tigl3, keep_unused_profiles, cache,
+                                        stack_segment_curves)
+    write_guide_curve_points(tixi3, points)
+
+
+def convert_configuration_geometry(filename, new_cpacs_file, old_cpacs_file, configuration, convert_eta_xsi=True,
+                                   cache=None, new_cpacs_snapshot=None):
+    """
+    Converts the guide curves and eta/xsi values of a single configuration using TiGL 2 and 3.
+    The TiGL handles are opened on their first use and closed at the end, such that the
+    geometry of only one configuration is kept in memory at a time.
+
+    :param filename: name of the converted file, used for logging
+    :param new_cpacs_file: TiXI 3 handle of the CPACS 3 document
+    :param old_cpacs_file: TiXI 2 handle of the CPACS 2 document
+    :param configuration: uID of the configuration
+    :param convert_eta_xsi: if False, the eta/xsi values are not converted
+    :param cache: optional GeometryCache with the geometry key of this configuration
+    :param new_cpacs_snapshot: optional snapshot_before_preparation of the CPACS 3 document, that is read by TiGL 3
+    :return: the guide curve profile points of this configuration. They must be written with
+             write_guide_curve_points after all configurations are converted, such that the TiGL 3
+             geometry of a configuration never depends on the other configurations
+    """
+    from tigl import tiglwrapper
+    from tigl3 import tigl3wrapper
+
+    def open_tigl2():
+        tigl2 = tiglwrapper.Tigl()
+        logging.info("Loading CPACS-2 file '" + filename + "' with TiGL 2")
+        tigl2.open(old_cpacs_file, configuration)
+        return profiling.wrap(tigl2, 'tigl2')
+
+    def open_tigl3():
+        logging.info("Loading CPACS-3 file with TiGL 3")
+        tigl3 = tigl3wrapper.Tigl3()
+        tigl3.open(new_cpacs_snapshot.tixi3 if new_cpacs_snapshot is not None else new_cpacs_file, configuration)
+        return profiling.wrap(tigl3, 'tigl3')
+
+    tigl2 = LazyTigl(open_tigl2)
+    tigl3 = LazyTigl(open_tigl3)
 
-            rX, rY, rZ = compute_new_guide_curve_points(tixi2, tigl2, tigl3, guideCurveUid, nProfilePoints)
+    try:
+        with profiling.stage('guide_curves'):
+            guide_curve_points = compute_guide_curve_points(new_cpacs_file, old_cpacs_file, tigl2, tigl3,
+                                                            cache=cache, configuration=configuration)
+        if convert_eta_xsi:
+            with profiling.stage('eta_xsi'):
+                convert_eta_xsi_values(new_cpacs_file, tigl2, tigl3, configuration=configuration, cache=cache)
+    finally:
+        tigl2.close()
+        tigl3.close()
+
+    # the guide curve profiles are written by the caller. Whether TiGL 3 is opened for the guide curves or only
+    # for the eta/xsi values depends on the cache, but it must always read the unconverted profiles. Hence,
+    # it reads the snapshot taken before prepare_guide_curve_profiles renamed them
+    return guide_curve_points
+
+
+def _convert_configuration_in_worker(job):
+    """
+    Converts a configuration inside a worker process, using private copies of both documents
+
+    :return: list of changes to the CPACS 3 document, that can be replayed with tixi_helper.replay_changes
+    """
+    from tixi import tixiwrapper
 
-            tixi3.removeElement(xpathProfile + "/pointList")
-            tixi3.createElement(xpathProfile, "pointList")
-            tixi3.addFloatVector(xpathProfile + "/pointList", "rX", rX, len(rX), "%g")
-            tixi3.addFloatVector(xpathProfile + "/pointList", "rY", rY, len(rY), "%g")
-            tixi3.addFloatVector(xpathProfile + "/pointList", "rZ", rZ, len(rZ), "%g")
+    filename, new_cpacs_xml, old_cpacs_xml, configuration, convert_eta_xsi, cache_settings = job
 
+    cache = None
+    if cache_settings is not None:
+        cache_directory, cache_size, geometry_key = cache_settings
+        cache = GeometryCache(cache_directory, cache_size)
+        cache.geometry_key = geometry_key
 
-def convert_geometry(filename, new_cpacs_file, old_cpacs_file, configurations=None):
+    new_cpacs_file = tixi3wrapper.Tixi3()
+    new_cpacs_file.openString(new_cpacs_xml)
+
+    # the copy is prepared like the main document, before any change is recorded
+    new_cpacs_snapshot = snapshot_before_preparation(new_cpacs_file)
+    prepare_guide_curve_profiles(new_cpacs_file)
+    recording_file = tixihelper.RecordingTixi(new_cpacs_file)
+
+    old_cpacs_file = tixiwrapper.Tixi()
+    old_cpacs_file.openString(old_cpacs_xml)
+
+    try:
+        guide_curve_points = convert_configuration_geometry(filename, recording_file, old_cpacs_file, configuration,
+                                                            convert_eta_xsi, cache, new_cpacs_snapshot)
+        write_guide_curve_points(recording_file, guide_curve_points)
+    except SystemExit:
+        # don't let the worker die, the pool would wait forever for its result
+        raise RuntimeError("Geometric conversion of configuration `{}` failed".format(configuration))
+    finally:
+        if new_cpacs_snapshot is not None:
+            new_cpacs_snapshot.close()
+
+    cache_statistics = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    return recording_file.changes, cache_statistics
+
+
+def convert_configurations_in_parallel(filename, new_cpacs_file, old_cpacs_snapshot, configurations, n_jobs,
+                                       cache=None):
+    """
+    Converts the geometry of several configurations concurrently in worker processes.
+
+    Each worker computes the changes of its configuration on a copy of the documents.
+    The changes are applied to the CPACS 3 document in the order of the configurations.
+    As each configuration only changes its own model and guide curve profiles, the result is the same
+    as of the conversion in a single process. If two configurations change the same element anyway,
+    a RuntimeError is raised.
+
+    :param configurations: list of tuples (configuration uID, convert eta/xsi values)
+    :param n_jobs: maximum number of worker processes
+    :param cache: optional GeometryCache
+    """
+    # the workers read the document before the structural changes of the guide curve profiles,
+    # that are done once for the main document and again by each worker on its copy
+    new_cpacs_xml = new_cpacs_file.exportDocumentAsString()
+    prepare_guide_curve_profiles(new_cpacs_file)
+
+    jobs = []
+    for configuration, convert_eta_xsi in configurations:
+        cache_settings = None
+        if cache is not None:
+            geometry_key = geometry_fingerprint(old_cpacs_snapshot.xml_string, configuration)
+            cache_settings = (cache.directory, cache.max_size / (1024 * 1024), geometry_key)
+        jobs.append((filename, new_cpacs_xml, old_cpacs_snapshot.xml_string, configuration, convert_eta_xsi,
+                     cache_settings))
+    # the serialised copy is only needed by the jobs
+    old_cpacs_snapshot.release_xml_string()
+
+    logging.info("Converting {} configurations using {} worker processes".format(len(jobs), n_jobs))
+    with multiprocessing.Pool(min(n_jobs, len(jobs))) as pool:
+        results = pool.map(_convert_configuration_in_worker, jobs, chunksize=1)
+
+    changed_by = {}
+    for (configuration, _), (changes, _) in zip(configurations, results):
+        for path in tixihelper.changed_paths(changes):
+            other = changed_by.setdefault(path, configuration)
+            if other != configuration:
+                raise RuntimeError("Configurations `{}` and `{}` both change `{}`".format(other, configuration, path))
+
+    for (configuration, _), (changes, (hits, misses)) in zip(configurations, results):
+        if cache is not None:
+            cache.hits += hits
+            cache.misses += misses
+        logging.info("Applying {} changes of configuration `{}`".format(len(changes), configuration))
+        tixihelper.replay_changes(new_cpacs_file, changes)
+
+
+def convert_geometry(filename, new_cpacs_file, old_cpacs_snapshot, configurations=None, n_jobs=1, cache=None,
+                     memory_budget=None):
     """
     Geometric conversion main routine
+    :param filename: name of the converted file, used for logging
+    :param new_cpacs_file: TiXI 3 handle of the CPACS 3 document
+    :param old_cpacs_snapshot: DocumentSnapshot of the CPACS 2 document. Might be None, if tigl_might_be_needed
+                               returned False for the configurations
+    :param configurations: uIDs of the configurations to convert. All, if None or empty
+    :param n_jobs: number of worker processes to convert several configurations concurrently
+    :param cache: optional GeometryCache to reuse TiGL evaluations of previous conversions
+    :param memory_budget: memory budget in MB. If given, the configurations are converted one after another
+                          and the memory usage is logged after each configuration
     :return:
     """
     logger = logging.getLogger(__name__)
     if configurations is None or len(configurations) == 0:
         logger.info('No configuration provided.')
-        configurations = tixihelper.list_configurations(old_cpacs_file)
+        configurations = tixihelper.list_configurations(new_cpacs_file)
         logger.info('Running conversion for {}'.format(', '.join(configurations)))
+
+    tigl_configurations = []
     for iconfig in configurations:
-        logger.info('Converting `{}`'.format(iconfig))
-        tigl2 = tiglwrapper.Tigl()
-        logging.info("Loading CPACS-2 file '" + filename + "' with TiGL 2")
-        tigl2.open(old_cpacs_file, iconfig)
-        logging.info("Loading CPACS-3 file with TiGL 3")
-        tigl3 = tigl3wrapper.Tigl3()
-        tigl3.open(new_cpacs_file, iconfig)
+        logger.info('Checking `{}`'.format(iconfig))
+        convert_guide_curves, convert_eta_xsi = geometric_stages_needed(new_cpacs_file, iconfig)
+
+        if not convert_guide_curves and not convert_eta_xsi:
+            logger.info('No geometric conversion required for `{}`. TiGL is not loaded.'.format(iconfig))
+        else:
+            tigl_configurations.append((iconfig, convert_eta_xsi))
+
+    if len(tigl_configurations) == 0:
+        # guide curve profiles might still need to be renamed or cleaned up, which doesn't need TiGL
+        prepare_guide_curve_profiles(new_cpacs_file)
+        return
+
+    if old_cpacs_snapshot is None:
+        raise RuntimeError("The geometric conversion needs TiGL, but no snapshot of the CPACS 2 document was taken")
 
-        convert_guide_curve_points(new_cpacs_file, old_cpacs_file, tigl2, tigl3)
-        convert_eta_xsi_values(new_cpacs_file, tigl2, tigl3, configuration=iconfig)
+    if n_jobs > 1 and multiprocessing.current_process().daemon:
+        # e.g. a worker of the batch conversion, daemonic processes must not have children
+        logger.info('Converting the configurations one after another inside a worker process')
+        n_jobs = 1
+
+    if n_jobs > 1 and len(tigl_configurations) > 1 and memory_budget is None:
+        convert_configurations_in_parallel(filename, new_cpacs_file, old_cpacs_snapshot, tigl_configurations, n_jobs,
+                                           cache)
+        return
+
+    geometry_keys = {}
+    if cache is not None:
+        for iconfig, _ in tigl_configurations:
+            geometry_keys[iconfig] = geometry_fingerprint(old_cpacs_snapshot.xml_string, iconfig)
+
+    # the TiXI 2 document replaces the serialised copy before any TiGL geometry is built
+    old_cpacs_snapshot.tixi2
+    old_cpacs_snapshot.release_xml_string()
+
+    new_cpacs_snapshot = snapshot_before_preparation(new_cpacs_file)
+    if new_cpacs_snapshot is not None:
+        new_cpacs_snapshot.tixi3
+        new_cpacs_snapshot.release_xml_string()
+
+    guide_curve_points = []
+    try:
+        for iconfig, convert_eta_xsi in tigl_configurations:
+            logger.info('Converting `{}`'.format(iconfig))
+            if cache is not None:
+                cache.geometry_key = geometry_keys[iconfig]
+            with profiling.stage(iconfig):
+                guide_curve_points += convert_configuration_geometry(filename, new_cpacs_file,
+                                                                     old_cpacs_snapshot.tixi2, iconfig,
+                                                                     convert_eta_xsi, cache, new_cpacs_snapshot)
+            if memory_budget is not None:
+                log_memory_usage("geometric conversion of `{}`".format(iconfig), memory_budget)
+    finally:
+        if new_cpacs_snapshot is not None:
+            new_cpacs_snapshot.close()
+
+    # all configurations have read the unconverted profiles, as the workers of the parallel conversion do
+    write_guide_curve_points(new_cpacs_file, guide_curve_points)
@@ -9,20 +9,25 @@ Currently is does:
 """
 
 import argparse
+import copy
 import logging
 import re
+import sys
 from datetime import datetime
 
-from tixi import tixiwrapper
 from tixi3 import tixi3wrapper
 from tixi3.tixi3wrapper import Tixi3Exception
 
 import cpacs2to3.tixi_helper as tixihelper
-from cpacs2to3.convert_coordinates import convert_geometry, do_convert_guide_curves
-from cpacs2to3.tixi_helper import parent_path, element_name, element_index
+from cpacs2to3.convert_coordinates import convert_geometry, do_convert_guide_curves, tigl_might_be_needed
+from cpacs2to3.tixi_helper import parent_path, element_name
 from cpacs2to3.uid_generator import uid_manager
+from cpacs2to3.geometry_cache import GeometryCache
 from cpacs2to3.graph import Graph, CPACS2Node, CPACS3Node
-from cpacs2to3.material import upgrade_material_cpacs_31
+from cpacs2to3.memory_usage import log_peak_memory, log_memory_usage
+from cpacs2to3 import profiling, rules
+from cpacs2to3.rules import Rename, Swap
+from cpacs2to3.segment_index import SegmentIndex
 
 
 def bump_version(vers, level):
@@ -85,11 +90,20 @@ def add_changelog(tixi3_handle, text, creator="cpacs2to3"):
     tixi3_handle.addTextElement(xpath, "cpacsVersion", cpacs_version)
 
 
-def add_uid(tixi3, xpath, uid):
+def add_uid(tixi3, xpath, uid=None):
+    """
+    Adds a uID to the element at xpath, if it exists and does not have a uID yet
+
+    :param uid: the uID to add. If None, a new uID is only created, if the element needs one
+    :return: True, if the uID was added
+    """
     if not tixi3.checkElement(xpath):
         return False
     if not tixi3.checkAttribute(xpath, "uID"):
+        if uid is None:
+            uid = uid_manager.create_uid(tixi3, xpath)
         tixi3.addTextAttribute(xpath, "uID", uid)
+        uid_manager.set_uid_path(xpath, uid)
         return True
     else:
         return False
@@ -106,11 +120,21 @@ def fix_empty_elements(tixi_handle):
     paths = tixihelper.resolve_xpaths(tixi_handle, xpath)
     for path in paths:
         if tixi_handle.getTextElement(path) == "":
-            tixi_handle.removeElement(path)
+            uid_manager.remove_element(tixi_handle, path)
             file_has_changed = True
 
     return file_has_changed
 
+# renames the guide curve profile elements to the names expected by TiGL 2
+GUIDE_CURVE_PROFILE_RULES_TIGL2 = [
+    Rename('/cpacs/vehicles/profiles', 'guideCurves', 'guideCurveProfiles'),
+] + [
+    Rename('/cpacs/vehicles/profiles/%s/guideCurveProfile/pointList' % container, old_name, new_name)
+    for container in ['guideCurves', 'guideCurveProfiles']
+    for old_name, new_name in [('rX', 'x'), ('rY', 'y'), ('rZ', 'z')]
+]
+
+
 def fix_guide_curve_profile_element_names(tixi_handle):
     """
     TiGL 2 uses a slight modification of the CPACS standard for guide curve profiles. If there are guide
@@ -122,46 +146,25 @@ def fix_guide_curve_profile_element_names(tixi_handle):
     if not do_convert_guide_curves(tixi_handle):
         return file_has_changed
 
-    # rename guideCurves to guideCurveProfiles
-    if tixi_handle.checkElement("cpacs/vehicles/profiles/guideCurves"):
-        tixi_handle.renameElement("cpacs/vehicles/profiles", "guideCurves", "guideCurveProfiles")
-        file_has_changed = True
-
-    xpath = "cpacs/vehicles/profiles/guideCurveProfiles"
-    if not tixi_handle.checkElement(xpath):
-        return file_has_changed
-
-    # rename rX to x, rY to y, rZ to z
-    nProfiles = tixi_handle.getNumberOfChilds(xpath)
-    idx = 0
-    while idx < nProfiles:
-        idx += 1
-        xpathProfile = xpath + '/guideCurveProfile[{}]'.format(idx)
-
-        if tixi_handle.checkElement(xpathProfile + "/pointList/rX"):
-            tixi_handle.renameElement(xpathProfile + "/pointList", "rX", "x")
-            file_has_changed = True
-        if tixi_handle.checkElement(xpathProfile + "/pointList/rY"):
-            tixi_handle.renameElement(xpathProfile + "/pointList", "rY", "y")
-            file_has_changed = True
-        if tixi_handle.checkElement(xpathProfile + "/pointList/rZ"):
-            tixi_handle.renameElement(xpathProfile + "/pointList", "rZ", "z")
-            file_has_changed = True
+    # rename guideCurves to guideCurveProfiles and rX to x, rY to y, rZ to z
+    n_changes = rules.apply_rules(tixi_handle, GUIDE_CURVE_PROFILE_RULES_TIGL2)
+    file_has_changed = n_changes > 0
 
     return file_has_changed
 
 
 def add_missing_uids(tixi3):
 
-    has_changed = False
+    n_inspected = 0
+    n_modified = 0
 
     logging.info("Add missing uIDs")
     paths = tixihelper.resolve_xpaths(tixi3, "//transformation")
     for path in paths:
-        has_changed = add_uid(tixi3, path, uid_manager.create_uid(tixi3, path)) or has_changed
-        has_changed = add_uid(tixi3, path + "/rotation", uid_manager.create_uid(tixi3, path + "/rotation")) or has_changed
-        has_changed = add_uid(tixi3, path + "/scaling", uid_manager.create_uid(tixi3, path + "/scaling")) or has_changed
-        has_changed = add_uid(tixi3, path + "/translation", uid_manager.create_uid(tixi3, path + "/translation")) or has_changed
+        for candidate in [path, path + "/rotation", path + "/scaling", path + "/translation"]:
+            n_inspected += 1
+            if add_uid(tixi3, candidate):
+                n_modified += 1
 
     def genMassPaths(path):
         return (
@@ -210,11 +213,15 @@ def add_missing_uids(tixi3):
     try:
         paths = tixihelper.resolve_xpaths(tixi3, xpath)
         for path in paths:
-            has_changed = add_uid(tixi3, path, uid_manager.create_uid(tixi3, path)) or has_changed
+            n_inspected += 1
+            if add_uid(tixi3, path):
+                n_modified += 1
     except Tixi3Exception:
         pass
 
-    return has_changed
+    logging.info("Inspected {} candidates for missing uIDs, added {} uIDs".format(n_inspected, n_modified))
+
+    return n_modified > 0
 
 
 def add_cpacs_transformation_node(tixi3, element_path):
@@ -232,13 +239,13 @@ def add_cpacs_transformation_node(tixi3, element_path):
         def add_trans_sub_node(node_name, x, y, z):
             node_path = transformation_path + "/" + node_name
             tixi3.createElement(transformation_path, node_name)
-            add_uid(tixi3, node_path, uid_manager.create_uid(tixi3, node_path))
+            add_uid(tixi3, node_path)
             tixi3.addDoubleElement(node_path, "x", x, "%g")
             tixi3.addDoubleElement(node_path, "y", y, "%g")
             tixi3.addDoubleElement(node_path, "z", z, "%g")
 
         tixi3.createElement(element_path, "transformation")
-        add_uid(tixi3, transformation_path, uid_manager.create_uid(tixi3, transformation_path))
+        add_uid(tixi3, transformation_path)
 
         add_trans_sub_node("scaling", 1., 1., 1.)
         add_trans_sub_node("rotation", 0., 0., 0.)
@@ -263,30 +270,31 @@ def get_parent_compseg_or_ted_uid(tixi3, xpath):
     """
     end = [it.end() for it in re.finditer('(componentSegment|trailingEdgeDevice)(\[\d+\])?/', xpath)][-1]
     csOrTedXPath = xpath[:end - 1]
-    uid = tixi3.getTextAttribute(csOrTedXPath, 'uID')
-    return uid
+    return uid_manager.get_uid(tixi3, csOrTedXPath)
+
 
+def get_segment_etauid_from_section_element(tixi3, elementUid, segment_index=None):
+    """
+    Finds the wing segment referencing the given section element and the eta of the element on this segment
+    :param tixi3: TiXI 3 handle
+    :param elementUid: uID of the section element
+    :param segment_index: SegmentIndex of the document. If None, a new one is built
+    """
+    if segment_index is None:
+        segment_index = SegmentIndex(tixi3)
 
-def get_segment_etauid_from_section_element(tixi3, elementUid):
-    # convert
-    wingSegments = tixihelper.resolve_xpaths(tixi3, '//wing/segments/segment[./toElementUID[text()=\'' + elementUid + '\']]')
-    if len(wingSegments) > 0:
-        eta = 1.0
-        uid = tixi3.getTextAttribute(wingSegments[0], 'uID')
+    segment = segment_index.segment_eta(elementUid, 'wing')
+    if segment is not None:
+        uid, eta = segment
     else:
-        wingSegments = tixihelper.resolve_xpaths(tixi3, '//wing/segments/segment[./fromElementUID[text()=\'' + elementUid + '\']]')
-        if len(wingSegments) > 0:
-            eta = 0.0
-            uid = tixi3.getTextAttribute(wingSegments[0], 'uID')
-        else:
-            logging.warning ('Failed to find a wing segment referencing the section element with uid' + elementUid + '. Manual correction is necessary')
-            eta = 0.0
-            uid = 'TODO'
+        logging.warning ('Failed to find a wing segment referencing the section element with uid' + elementUid + '. Manual correction is necessary')
+        eta = 0.0
+        uid = 'TODO'
 
     return uid, eta
 
 
-def convert_element_uid_to_eta_and_uid(tixi3, xpath, elementName, xsi):
+def convert_element_uid_to_eta_and_uid(tixi3, xpath, elementName, xsi, segment_index=None, child_positions=None):
     """
     Converts an elementUID element to an eta/xsi value and a referenceUID to a wing segment referencing the wing section element from elementUID.
     Removes the elementUID element and adds eta and referenceUID elements with new values
@@ -294,18 +302,22 @@ def convert_element_uid_to_eta_and_uid(tixi3, xpath, elementName, xsi):
     :param xpath: The xpath of the elementUID element
     :param elementName: Name of the element created at xpath which contains the computed eta and referenceUID elements
     :param xsi: xsi
+    :param segment_index: SegmentIndex of the document. If None, a new one is built
+    :param child_positions: ChildPositions cache of the document. If None, a new one is created
     """
+    if child_positions is None:
+        child_positions = tixihelper.ChildPositions(tixi3)
 
     # read and remove elementUid
     elementUid = tixi3.getTextElement(xpath)
-    index = element_index(tixi3, xpath)
-    tixi3.removeElement(xpath)
-    
-    uid, eta = get_segment_etauid_from_section_element(tixi3, elementUid)
+    index = child_positions.element_index(xpath)
+    child_positions.remove_element(xpath)
     
+    uid, eta = get_segment_etauid_from_section_element(tixi3, elementUid, segment_index)
+
     # write eta iso line
     parentXPath = parent_path(xpath)
-    tixi3.createElementAtIndex(parentXPath, elementName, index)
+    child_positions.create_element_at_index(parentXPath, elementName, index)
     newElementXPath = parentXPath + '/' + elementName
     tixi3.addDoubleElement(newElementXPath, 'eta', eta, '%g')
     tixi3.addDoubleElement(newElementXPath, 'xsi', xsi, '%g')
@@ -325,6 +337,7 @@ def convert_eta_xsi_iso_lines(tixi3):
         :param xpath: XPath matching multiple eta or xsi double values
         :param elementName: Name of the new element storing the eta/xsi value in the created iso line. Is either 'eta' or 'xsi'
         """
+        child_positions = tixihelper.ChildPositions(tixi3)
         for path in tixihelper.resolve_xpaths(tixi3, xpath):
             uid = get_parent_compseg_or_ted_uid(tixi3, path)
 
@@ -334,9 +347,9 @@ def convert_eta_xsi_iso_lines(tixi3):
                 value = float(value_str)
 
                 # recreate element to make sure it's empty and properly formatted
-                index = element_index(tixi3, path)
-                tixi3.removeElement(path)
-                tixi3.createElementAtIndex(parent_path(path), element_name(path), index)
+                index = child_positions.element_index(path)
+                child_positions.remove_element(path)
+                child_positions.create_element_at_index(parent_path(path), element_name(path), index)
 
                 # add sub elements for eta/xsi iso line
                 tixi3.addDoubleElement(path, elementName, value, '%g')
@@ -420,13 +433,14 @@ def rearrange_non_explicit_stringer(tixi3):
 
     In 3.1 angle should be after refPoint compared to 3.0
     """
-    for path in tixihelper.resolve_xpaths(tixi3, '//lowerShell/stringer|//upperShell/stringer|//cell/stringer'):
-        if not tixi3.checkElement(path + '/pitch'):
-            continue
-        tixi3.swapElements(path + '/angle', path + '/refPoint')
+    rules.apply_rules(tixi3, STRINGER_RULES_31)
+
 
 def convert_spar_positions(tixi3):
 
+    segment_index = SegmentIndex(tixi3)
+    child_positions = tixihelper.ChildPositions(tixi3)
+
     # convert sparPosition
     for path in tixihelper.resolve_xpaths(tixi3, '//sparPosition'):
         # get existing xsi value
@@ -448,10 +462,13 @@ def convert_spar_positions(tixi3):
             tixi3.addTextElement(path, 'referenceUID', uid)
         elif tixi3.checkElement(path + "/elementUID"):
             # in case of elementUID, find wing segment which references the element and convert to eta
-            convert_element_uid_to_eta_and_uid(tixi3, path + '/elementUID', "sparPositionEtaXsi", xsi)
+            convert_element_uid_to_eta_and_uid(tixi3, path + '/elementUID', "sparPositionEtaXsi", xsi, segment_index,
+                                               child_positions)
 
 
 def convert_ribs_positions(tixi3):
+    segment_index = SegmentIndex(tixi3)
+
     def replace_eta_with_curve_point(path, eta_node_name, new_node_name, reference_uid):
         if tixi3.checkElement(path + "/" + eta_node_name):
             eta_str = tixi3.getTextElement(path + '/' + eta_node_name)
@@ -477,7 +494,7 @@ def convert_ribs_positions(tixi3):
                                 "will be converted into eta/xsi coordinates. "
                                 "In case of a rib rotation, this conversion will result in a different rib.")
 
-                uid, eta = get_segment_etauid_from_section_element(tixi3, elementUID)
+                uid, eta = get_segment_etauid_from_section_element(tixi3, elementUID, segment_index)
 
                 tixi3.createElement(path, eta_xsi_point_name)
                 tixi3.addTextElement(path + '/' + eta_xsi_point_name, 'eta', str(eta))
@@ -511,71 +528,126 @@ def convert_cpacs_xml(tixi_handle):
     perform structural changes on XML
     """
     # add new nodes / uids
-    add_missing_uids(tixi_handle)
-    add_transformation_nodes(tixi_handle)
+    with profiling.stage('add_missing_uids'):
+        add_missing_uids(tixi_handle)
+    with profiling.stage('add_transformation_nodes'):
+        add_transformation_nodes(tixi_handle)
     # convert component segment structure
-    convert_eta_xsi_iso_lines(tixi_handle)
-    convert_eta_xsi_rel_height_points(tixi_handle)
+    with profiling.stage('convert_eta_xsi_iso_lines'):
+        convert_eta_xsi_iso_lines(tixi_handle)
+    with profiling.stage('convert_eta_xsi_rel_height_points'):
+        convert_eta_xsi_rel_height_points(tixi_handle)
+
+
+def _log_memory_budget(args, stage):
+    """
+    Logs the memory usage after the stage, if the conversion runs with a memory budget
+    """
+    memory_budget = getattr(args, 'memory_budget', None)
+    if memory_budget is not None:
+        log_memory_usage(stage, memory_budget)
 
 
 def upgrade_2_to_3(cpacs_handle, args):
     filename = args.input_file
 
+    file_has_changed = False
     if args.fix_errors:
-        file_has_changed = uid_manager.fix_invalid_uids(cpacs_handle)
-        file_has_changed = fix_empty_elements(cpacs_handle) or file_has_changed
-        file_has_changed = fix_guide_curve_profile_element_names(cpacs_handle) or file_has_changed
+        with profiling.stage('fix_invalid_uids'):
+            file_has_changed = uid_manager.fix_invalid_uids(cpacs_handle)
+        with profiling.stage('fix_empty_elements'):
+            file_has_changed = fix_empty_elements(cpacs_handle) or file_has_changed
+        with profiling.stage('fix_guide_curve_profile_element_names'):
+            file_has_changed = fix_guide_curve_profile_element_names(cpacs_handle) or file_has_changed
+        _log_memory_budget(args, "fixing errors")
+
+    configurations = args.configurations.split(',') if args.configurations is not None else []
 
-        if file_has_changed:
-            logging.info("A fixed cpacs2 file will be stored to '%s'" % (filename + ".fixed"))
-            with open(filename + ".fixed", "w") as text_file:
-                text_file.write(cpacs_handle.exportDocumentAsString())
+    # serialise the cpacs 2 document only once and only if it is needed. The same copy is used
+    # for the fixed file and to create the tixi 2 document for tigl 2, once the geometry conversion needs it
+    cpacs2_snapshot = None
+    store_fixed_file = args.fix_errors and file_has_changed
+    if store_fixed_file or tigl_might_be_needed(cpacs_handle, configurations):
+        with profiling.stage('snapshot'):
+            cpacs2_snapshot = tixihelper.DocumentSnapshot(cpacs_handle)
+    else:
+        logging.info("No geometric conversion needs TiGL. The CPACS 2 document is not copied.")
+
+    if store_fixed_file:
+        report = getattr(args, 'report', None)
+        if report is not None:
+            report.fixed_document = cpacs2_snapshot.xml_string
 
-    # copy cpacs file into tixi 2 to make tigl2 happy
-    old_cpacs_file = tixiwrapper.Tixi()
-    old_cpacs_file.openString(cpacs_handle.exportDocumentAsString())
+        # the fixed file is stored next to the input file, unless another file or None is given
+        fixed_file = getattr(args, 'fixed_file', filename + ".fixed")
+        if fixed_file is not None:
+            logging.info("A fixed cpacs2 file will be stored to '%s'" % fixed_file)
+            cpacs2_snapshot.save(fixed_file)
 
     change_cpacs_version(cpacs_handle, "3.0")
-    convert_cpacs_xml(cpacs_handle)
+    with profiling.stage('convert_cpacs_xml'):
+        convert_cpacs_xml(cpacs_handle)
+    _log_memory_budget(args, "structural conversion to CPACS 3.0")
 
-    configurations = args.configurations.split(',') if args.configurations is not None else []
+    cache = None
+    if getattr(args, 'cache_dir', None) is not None:
+        cache = GeometryCache(args.cache_dir, args.cache_size)
 
     # perform geometric conversions using tigl
-    convert_geometry(filename, cpacs_handle, old_cpacs_file, configurations=configurations)
+    with profiling.stage('convert_geometry'):
+        convert_geometry(filename, cpacs_handle, cpacs2_snapshot, configurations=configurations,
+                         n_jobs=getattr(args, 'geometry_jobs', 1), cache=cache,
+                         memory_budget=getattr(args, 'memory_budget', None))
 
+    # the cpacs 2 document is not needed anymore
+    if cpacs2_snapshot is not None:
+        cpacs2_snapshot.close()
+
+    if cache is not None:
+        cache.log_statistics()
+        cache.evict()
+
+    log_peak_memory("conversion to CPACS 3.0")
 
-def upgrade_3_to_31(cpacs_handle, args):
-    """
-    Upgrades a cpacs 3.0 dataset to 3.1
-    """
 
+# non-explicit stringers, the schema order of angle and refPoint changed in 3.1
+STRINGER_RULES_31 = [
+    Swap('//lowerShell/stringer', 'angle', 'refPoint', if_child='pitch'),
+    Swap('//upperShell/stringer', 'angle', 'refPoint', if_child='pitch'),
+    Swap('//cell/stringer', 'angle', 'refPoint', if_child='pitch'),
+]
+
+# structural changes from CPACS 3.0 to 3.1
+RULES_3_TO_31 = [
     # rename relDeflection to controlParameter
-    xpath = (
-            '//leadingEdgeDevice/path/steps/step|' +
-            '//spoiler/path/steps/step|' +
-            '//trailingEdgeDevice/path/steps/step'
-    )
-    for path in tixihelper.resolve_xpaths(cpacs_handle, xpath):
-        if cpacs_handle.checkElement(path + '/relDeflection'):
-            cpacs_handle.renameElement(path, "relDeflection", "controlParameter")
+    Rename('//leadingEdgeDevice/path/steps/step', 'relDeflection', 'controlParameter'),
+    Rename('//spoiler/path/steps/step', 'relDeflection', 'controlParameter'),
+    Rename('//trailingEdgeDevice/path/steps/step', 'relDeflection', 'controlParameter'),
+    Rename('//fuselage/structure/walls/wallSegments/wallSegment', 'negativeExtrusion', 'doubleSidedExtrusion'),
+] + STRINGER_RULES_31
 
-    xpath = (
-        '//fuselage/structure/walls/wallSegments/wallSegment'
-    )
 
-    for path in tixihelper.resolve_xpaths(cpacs_handle, xpath):
-        if cpacs_handle.checkElement(path + '/negativeExtrusion'):
-            cpacs_handle.renameElement(path, "negativeExtrusion", "doubleSidedExtrusion")
+def upgrade_3_to_31(cpacs_handle, args, apply_structural_rules=True):
+    """
+    Upgrades a cpacs 3.0 dataset to 3.1
+
+    :param apply_structural_rules: if False, RULES_3_TO_31 have already been applied by the VersionUpdater
+    """
+
+    from cpacs2to3.material import upgrade_material_cpacs_31
 
-    rearrange_non_explicit_stringer(cpacs_handle)
+    if apply_structural_rules:
+        with profiling.stage('structural_rules'):
+            rules.apply_rules(cpacs_handle, RULES_3_TO_31)
 
     # Upgrade material definition
-    upgrade_material_cpacs_31(cpacs_handle)
+    with profiling.stage('upgrade_material'):
+        upgrade_material_cpacs_31(cpacs_handle)
 
     change_cpacs_version(cpacs_handle, "3.1")
 
 
-def upgrade_31_to_32(cpacs_handle, args):
+def upgrade_31_to_32(cpacs_handle, args, apply_structural_rules=True):
     """
     Upgrades a cpacs 3.1 dataset to 3.2
 
@@ -603,14 +675,23 @@ class VersionUpdater:
         self.version.append(CPACS3Node("3.2"))
 
         self.__add_update_method("2.0", "3.0", upgrade_2_to_3)
-        self.__add_update_method("3.0", "3.1", upgrade_3_to_31)
-        self.__add_update_method("3.1", "3.2", upgrade_31_to_32)
+        self.__add_update_method("3.0", "3.1", upgrade_3_to_31, RULES_3_TO_31)
+        self.__add_update_method("3.1", "3.2", upgrade_31_to_32, [])
 
-    def __add_update_method(self, vold_str, vnew_str, updater):
+    def __add_update_method(self, vold_str, vnew_str, updater, structural_rules=None):
+        """
+        Registers an update step
+
+        :param updater: update method, called as updater(cpacs, args)
+        :param structural_rules: If None, the step is purely imperative. Otherwise, the list of
+                                 declarative rules of the step. In this case, the updater must accept
+                                 apply_structural_rules=False and then only perform its remaining changes,
+                                 which must not depend on the rules.
+        """
         old_version_node = self.__get_version_node(vold_str)
         new_version_node = self.__get_version_node(vnew_str)
 
-        self.update_graph.add_edge(old_version_node, new_version_node, update=updater)
+        self.update_graph.add_edge(old_version_node, new_version_node, update=updater, rules=structural_rules)
 
     def __get_version_node(self, version_str):
         for v in self.version:
@@ -619,17 +700,16 @@ class VersionUpdater:
 
         return None
 
-    def update(self, cpacs, args, target_version):
+    def update_steps(self, current_version, target_version):
         """
-        Updates the given cpacs file to given version
+        Returns the update methods, that have to be applied in order to
+        update a file from current_version to target_version
 
-        :param cpacs: cpacs file handle
-        :param args: command line args
+        :param current_version: cpacs version of the file
         :param target_version: target version to convert to
+        :return: list of update steps with the attributes update (the update method) and
+                 rules (the structural rules or None). Empty, if the versions are compatible
         """
-
-        current_version = get_cpacs_version(cpacs)
-
         version_old = self.__get_version_node(current_version)
         version_new = self.__get_version_node(target_version)
 
@@ -644,54 +724,197 @@ class VersionUpdater:
         if path is None:
             raise RuntimeError("Don't know how to upgrade from %s to %s" % (current_version, target_version))
 
-        if len(path) == 1:
-            print("%s is compatible to %s. No actions required... " % (current_version, target_version))
-            return
+        return [self.update_graph.get_edge(path[i], path[i + 1]) for i in range(len(path) - 1)]
 
-        logging.info("Upgrading CPACS %s file to CPACS version %s" % (current_version, target_version))
+    def update(self, cpacs, args, target_version):
+        """
+        Updates the given cpacs file to given version
 
-        for i in range(len(path) - 1):
-            updater = self.update_graph.get_edge(path[i], path[i + 1])
-            updater.update(cpacs, args)
+        :param cpacs: cpacs file handle
+        :param args: command line args
+        :param target_version: target version to convert to
+        """
 
+        current_version = get_cpacs_version(cpacs)
 
-def main():
-    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
+        steps = self.update_steps(current_version, target_version)
 
-    parser = argparse.ArgumentParser(description='Converts a CPACS file from Version 2 to Version 3.')
-    parser.add_argument('input_file', help='Input CPACS 2 file')
-    parser.add_argument('-o', metavar='output_file', help='Name of the output file.')
-    parser.add_argument('--fix-errors', '-f', help='try to fix empty and duplicate uids/elements',  action="store_true")
-    parser.add_argument('--target-version', '-v', default="3.2")
-    parser.add_argument('--configurations', '-c', default=None)
+        if len(steps) == 0:
+            print("%s is compatible to %s. No actions required... " % (current_version, target_version))
+            return
 
-    args = parser.parse_args()
-    filename = args.input_file
+        logging.info("Upgrading CPACS %s file to CPACS version %s" % (current_version, target_version))
 
-    cpacs_file = tixi3wrapper.Tixi3()
-    cpacs_file.open(filename)
+        # consecutive declarative steps apply their rules together in as few traversals as possible
+        i = 0
+        while i < len(steps):
+            if steps[i].rules is None:
+                with profiling.stage(steps[i].update.__name__):
+                    steps[i].update(cpacs, args)
+                _log_memory_budget(args, steps[i].update.__name__)
+                i += 1
+                continue
+
+            j = i
+            while j < len(steps) and steps[j].rules is not None:
+                j += 1
+
+            with profiling.stage('structural_rules'):
+                for batch in rules.fuse_rule_sets([step.rules for step in steps[i:j]]):
+                    rules.apply_rules(cpacs, batch)
+            for step in steps[i:j]:
+                with profiling.stage(step.update.__name__):
+                    step.update(cpacs, args, apply_structural_rules=False)
+                _log_memory_budget(args, step.update.__name__)
+            i = j
+
+
+def upgrade_document(cpacs_file, args, version_updater=None):
+    """
+    Upgrades an opened CPACS document to the target version given in args and adds a changelog entry
+
+    :param cpacs_file: TiXI 3 handle of the document
+    :param args: command line args or options with the same attributes
+    :param version_updater: VersionUpdater to use. A new one is created, if None
+    :return: the handle of the upgraded document. If args.element_index is set, it is wrapped by an IndexedTixi
+    """
     cpacs_file.setCacheEnabled(1)
     cpacs_file.usePrettyPrint(1)
 
+    if getattr(args, 'element_index', False):
+        cpacs_file = tixihelper.IndexedTixi(cpacs_file)
+    cpacs_file = profiling.wrap(cpacs_file, 'tixi3')
+    profiling.count_nodes('input', cpacs_file)
+
     # get all uids
-    uid_manager.register_all_uids(cpacs_file)
+    with profiling.stage('register_all_uids'):
+        uid_manager.register_all_uids(cpacs_file)
+    _log_memory_budget(args, "loading the document")
 
     version_new = args.target_version
 
-    vu = VersionUpdater()
-    vu.update(cpacs_file, args, version_new)
+    if version_updater is None:
+        version_updater = VersionUpdater()
+    version_updater.update(cpacs_file, args, version_new)
 
     add_changelog(cpacs_file, "Converted to CPACS %s using cpacs2to3" % version_new)
+    profiling.count_nodes('output', cpacs_file)
 
     logging.info("Done")
 
-    output_file = args.o
-    if output_file is not None:
-        logging.info("Saving file to '" + output_file + "'")
-        cpacs_file.save(output_file)
+    return cpacs_file
+
+
+def convert_file(filename, output_file, args, version_updater=None):
+    """
+    Converts a single CPACS file to the target version given in args and saves it
+
+    :param filename: Name of the input file
+    :param output_file: Name of the output file. If None, the converted document is logged
+    :param args: command line args
+    :param version_updater: VersionUpdater to use. A new one is created, if None
+    """
+    if getattr(args, 'streaming', False):
+        from cpacs2to3.streaming import stream_upgrade
+        stream_upgrade(filename, output_file, args.target_version, version_updater)
+        log_peak_memory("streaming upgrade")
+        return
+
+    # the upgrade steps read the input file name from the args
+    args = copy.copy(args)
+    args.input_file = filename
+
+    cpacs_file = tixi3wrapper.Tixi3()
+    with profiling.stage('open'):
+        cpacs_file.open(filename)
+
+    cpacs_file = upgrade_document(cpacs_file, args, version_updater)
+
+    with profiling.stage('save'):
+        if output_file is not None:
+            logging.info("Saving file to '" + output_file + "'")
+            cpacs_file.save(output_file)
+        else:
+            logging.info(cpacs_file.exportDocumentAsString())
+
+    if getattr(args, 'memory_budget', None) is not None:
+        _log_memory_budget(args, "saving")
+    else:
+        log_peak_memory("saving")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        from cpacs2to3.serve import main as serve_main
+        return serve_main(sys.argv[2:])
+
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
+
+    parser = argparse.ArgumentParser(description='Converts a CPACS file from Version 2 to Version 3.')
+    parser.add_argument('input_files', nargs='*', metavar='input_file',
+                        help='Input CPACS 2 file. In batch mode, also directories and glob patterns are allowed')
+    parser.add_argument('-o', metavar='output_file', help='Name of the output file.')
+    parser.add_argument('--fix-errors', '-f', help='try to fix empty and duplicate uids/elements',  action="store_true")
+    parser.add_argument('--target-version', '-v', default="3.2")
+    parser.add_argument('--configurations', '-c', default=None)
+    parser.add_argument('--geometry-jobs', type=int, default=1,
+                        help='Number of worker processes to convert the geometry of several configurations concurrently')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory of a persistent cache of geometry evaluations, reused by later conversions')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Size limit of the geometry cache in MB')
+    parser.add_argument('--element-index', action="store_true",
+                        help='Keep an index of all elements to speed up queries on large files')
+    parser.add_argument('--streaming', action="store_true",
+                        help='Upgrade CPACS 3.x files with constant memory by streaming them to the output file')
+    parser.add_argument('--output-dir', '-d', default=None,
+                        help='Batch mode: convert all input files and store them into this directory')
+    parser.add_argument('--manifest', '-m', default=None,
+                        help='Batch mode: text file containing one input file per line')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Batch mode: number of worker processes')
+    parser.add_argument('--memory-budget', type=float, default=None, metavar='MB',
+                        help='Convert with as little memory as possible: geometry is converted in this process one '
+                             'configuration at a time, unused copies are freed early and the memory usage after '
+                             'each stage is logged and compared to this budget')
+    parser.add_argument('--profile', metavar='profile_file', default=None,
+                        help='Store the duration of each conversion stage and the number of TiXI/TiGL calls '
+                             'to this JSON file')
+
+    args = parser.parse_args()
+
+    if args.memory_budget is not None and args.geometry_jobs > 1:
+        logging.info("Converting the geometry in a single process to stay within the memory budget")
+        args.geometry_jobs = 1
+
+    if args.output_dir is not None or args.manifest is not None:
+        if args.output_dir is None:
+            parser.error('batch mode requires an output directory (--output-dir)')
+        if args.o is not None:
+            parser.error('-o cannot be used in batch mode, use --output-dir instead')
+        if args.profile is not None:
+            parser.error('--profile cannot be used in batch mode')
+
+        from cpacs2to3.batch import run_batch
+        return run_batch(args)
+
+    if len(args.input_files) != 1:
+        parser.error('exactly one input file is required. Use --output-dir to convert multiple files')
+
+    if args.streaming and args.o is None:
+        parser.error('--streaming requires an output file (-o)')
+
+    if args.profile is not None:
+        profiler = profiling.start()
+        try:
+            with profiler.stage('total'):
+                convert_file(args.input_files[0], args.o, args)
+        finally:
+            # a failed conversion stores the profile up to the failure
+            profiling.stop().save(args.profile)
     else:
-        logging.info(cpacs_file.exportDocumentAsString())
+        convert_file(args.input_files[0], args.o, args)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
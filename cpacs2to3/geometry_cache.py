@@ -0,0 +1,184 @@
+"""
+Persistent on-disk cache for the results of TiGL evaluations.
+
+Converting the same aircraft again, after unrelated parts of the file have changed,
+does not need to evaluate the geometry again. The cache key consists of a hash of
+all geometry defining parts of the CPACS 2 document and the query itself.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from xml.etree import ElementTree
+
+# increase, if the format or the meaning of the cached values changes
+CACHE_VERSION = 1
+
+# subtrees of wings and fuselages, that don't influence the geometry
+_NON_GEOMETRIC_ELEMENTS = {'structure', 'controlSurfaces', 'name', 'description'}
+
+# temporary files older than this (in seconds) are left over from a crashed conversion
+STALE_TMP_AGE = 600
+
+
+def geometry_fingerprint(cpacs_xml, configuration):
+    """
+    Computes a hash of all parts of a CPACS document, that define the geometry of a configuration.
+    These are the wings and fuselages of the configuration without their structure, and the profiles.
+
+    :param cpacs_xml: serialised CPACS document
+    :param configuration: uID of the configuration
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(configuration.encode('utf-8'))
+
+    stack = []
+    in_configuration = False
+    # depth of the hashed subtree and of an excluded subtree inside of it
+    hashed_depth = None
+    skipped_depth = None
+
+    for event, element in ElementTree.iterparse(io.StringIO(cpacs_xml), events=('start', 'end')):
+        if event == 'start':
+            stack.append(element.tag)
+            depth = len(stack)
+
+            if depth == 4 and element.tag == 'model' and stack[1] == 'vehicles':
+                in_configuration = element.get('uID') == configuration
+
+            if hashed_depth is None:
+                if (depth == 3 and stack[1] == 'vehicles' and element.tag == 'profiles') or \
+                        (depth == 5 and in_configuration and element.tag in ('wings', 'fuselages')):
+                    hashed_depth = depth
+            elif skipped_depth is None and element.tag in _NON_GEOMETRIC_ELEMENTS:
+                skipped_depth = depth
+
+            if hashed_depth is not None and skipped_depth is None:
+                digest.update(('<%s %s>' % (element.tag, sorted(element.attrib.items()))).encode('utf-8'))
+        else:
+            depth = len(stack)
+            if hashed_depth is not None and skipped_depth is None:
+                digest.update(('%s</%s>' % ((element.text or '').strip(), element.tag)).encode('utf-8'))
+
+            if skipped_depth == depth:
+                skipped_depth = None
+            if hashed_depth == depth:
+                hashed_depth = None
+            if depth == 4 and element.tag == 'model':
+                in_configuration = False
+
+            # the element is completely processed, free its memory
+            element.clear()
+            stack.pop()
+
+    return digest.hexdigest()
+
+
+class GeometryCache(object):
+    """
+    Cache of TiGL evaluations, stored as one small JSON file per entry in a local directory.
+
+    If the size of the directory exceeds the limit, the least recently used entries are removed.
+    Before use, the geometry_key has to be set to the geometry_fingerprint of the converted configuration.
+    """
+
+    def __init__(self, directory, max_size_mb=1024):
+        self.directory = directory
+        self.max_size = max_size_mb * 1024 * 1024
+        self.geometry_key = None
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _entry_path(self, kind, query):
+        key = json.dumps([CACHE_VERSION, self.geometry_key, kind, query])
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get_or_compute(self, kind, query, compute):
+        """
+        Returns the cached result of a query or computes and stores it
+
+        :param kind: kind of the evaluation, e.g. the name of the TiGL function
+        :param query: JSON serialisable arguments of the evaluation
+        :param compute: function without arguments computing the JSON serialisable result
+        """
+        if self.geometry_key is None:
+            raise RuntimeError("The geometry key of the cache is not set")
+
+        path = self._entry_path(kind, query)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            # mark as recently used
+            os.utime(path, None)
+            self.hits += 1
+            return value
+        except (IOError, OSError, ValueError):
+            pass
+
+        self.misses += 1
+        value = compute()
+
+        # write atomically, other processes might use the same cache
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        return value
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is below its size limit.
+        Temporary files left over by crashed conversions are always removed.
+        Temporary files, that might still be written, count against the size limit.
+        """
+        entries = []
+        total_size = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(('.json', '.tmp')):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith('.tmp'):
+                if now - stat.st_mtime > STALE_TMP_AGE:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                else:
+                    total_size += stat.st_size
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+    def log_statistics(self):
+        total = self.hits + self.misses
+        if total > 0:
+            logging.info("Geometry cache: %d hits, %d misses (%.0f %% hit rate)"
+                         % (self.hits, self.misses, 100. * self.hits / total))
@@ -0,0 +1,69 @@
+"""
+Helpers to report the memory usage of the conversion
+"""
+
+import logging
+import sys
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the current process in MB,
+    or None, if it cannot be determined on this platform
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # reported in bytes on macOS, in kilobytes elsewhere
+        return peak / (1024. * 1024.)
+    return peak / 1024.
+
+
+def log_peak_memory(stage):
+    """
+    Logs the peak memory usage of the process up to the given stage
+    """
+    peak = peak_rss_mb()
+    if peak is not None:
+        logging.info("Peak memory usage after %s: %.1f MB" % (stage, peak))
+
+
+def current_rss_mb():
+    """
+    Returns the current resident set size of the process in MB,
+    or None, if it cannot be determined on this platform
+    """
+    try:
+        import os
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024. * 1024.)
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def log_memory_usage(stage, budget_mb=None):
+    """
+    Logs the current and the peak memory usage after the given stage
+
+    :param budget_mb: memory budget in MB. A warning is logged, if the peak memory usage exceeds it
+    """
+    current = current_rss_mb()
+    peak = peak_rss_mb()
+    if peak is None:
+        return
+
+    if current is not None:
+        # the peak is sampled by the kernel and might lag behind the current usage
+        peak = max(peak, current)
+        logging.info("Memory usage after %s: %.1f MB (peak %.1f MB)" % (stage, current, peak))
+    else:
+        logging.info("Peak memory usage after %s: %.1f MB" % (stage, peak))
+
+    if budget_mb is not None and peak > budget_mb:
+        logging.warning("The peak memory usage of %.1f MB after %s exceeds the memory budget of %.1f MB"
+                        % (peak, stage, budget_mb))
@@ -0,0 +1,204 @@
+"""
+Profiling of the conversion
+
+The profiler records the wall and CPU time of the upgrade steps and passes, the peak memory
+usage after each of them, and the number of calls and the time spent in each TiXI and TiGL
+method. If no profiler is active, stage() and wrap() do nothing, so the conversion is not slowed down.
+
+Calls made in the worker processes of the geometry conversion (--geometry-jobs) are not recorded.
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from cpacs2to3.memory_usage import peak_rss_mb
+from cpacs2to3.tixi_helper import TixiProxy
+
+# the profiler of the running conversion or None, if profiling is disabled
+_active_profiler = None
+
+
+class _Stage(object):
+    """
+    Records the duration of a stage of the profiler
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler._stack.append(self.name)
+        self.path = '/'.join(profiler._stack)
+        self.n_calls = profiler.n_calls
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        profiler = self.profiler
+        profiler._stack.pop()
+        profiler.stages.append(OrderedDict([
+            ('stage', self.path),
+            ('wall_s', time.perf_counter() - self.wall),
+            ('cpu_s', time.process_time() - self.cpu),
+            ('library_calls', profiler.n_calls - self.n_calls),
+            ('peak_rss_mb', peak_rss_mb()),
+        ]))
+
+
+class _NoStage(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+class CountingProxy(TixiProxy):
+    """
+    Wrapper around a TiXI or TiGL handle, that records the number and the duration of all method calls.
+    If the handle is wrapped by other proxies like IndexedTixi, only the methods of the library are counted.
+    """
+
+    def __init__(self, handle, profiler, library):
+        super(CountingProxy, self).__init__(handle)
+        self.profiler = profiler
+        self.library = library
+
+        library_handle = handle
+        while isinstance(library_handle, TixiProxy):
+            library_handle = library_handle.wrapped_handle
+        self._library_type = type(library_handle)
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped_handle, name)
+        if not callable(attr) or name.startswith('_') or not hasattr(self._library_type, name):
+            return attr
+
+        profiler = self.profiler
+        key = self.library + '.' + name
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                profiler.record_call(key, time.perf_counter() - start)
+
+        return call
+
+
+class Profiler(object):
+    """
+    Collects the stage durations and library calls of a conversion
+    """
+
+    def __init__(self):
+        self.stages = []
+        # method name -> [number of calls, total duration]
+        self.calls = {}
+        self.n_calls = 0
+        self.node_counts = OrderedDict()
+        self._stack = []
+
+    def stage(self, name):
+        """
+        Context manager measuring the stage with the given name. Stages can be nested.
+        """
+        return _Stage(self, name)
+
+    def record_call(self, name, duration):
+        entry = self.calls.get(name)
+        if entry is None:
+            entry = self.calls[name] = [0, 0.]
+        entry[0] += 1
+        entry[1] += duration
+        self.n_calls += 1
+
+    def count_nodes(self, label, tixi_handle):
+        """
+        Records the number of elements of the document
+        """
+        # the query is not counted as a library call
+        handle = tixi_handle
+        while isinstance(handle, TixiProxy):
+            handle = handle.wrapped_handle
+        self.node_counts[label] = handle.xPathEvaluateNodeNumber('//*')
+
+    def report(self):
+        """
+        :return: the profile as dict, that can be stored as JSON
+        """
+        calls = OrderedDict()
+        for name, (count, total) in sorted(self.calls.items(), key=lambda item: -item[1][1]):
+            calls[name] = OrderedDict([('calls', count), ('total_s', total)])
+
+        return OrderedDict([
+            ('stages', self.stages),
+            ('calls', calls),
+            ('node_counts', self.node_counts),
+            ('peak_rss_mb', peak_rss_mb()),
+        ])
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        logging.info("Profile stored to '%s'" % filename)
+
+
+def start():
+    """
+    Activates a new profiler for all following stages and wrapped handles
+
+    :return: the profiler
+    """
+    global _active_profiler
+    _active_profiler = Profiler()
+    return _active_profiler
+
+
+def stop():
+    """
+    Deactivates the profiler
+
+    :return: the profiler, that was active
+    """
+    global _active_profiler
+    profiler = _active_profiler
+    _active_profiler = None
+    return profiler
+
+
+def stage(name):
+    """
+    Context manager measuring a stage of the active profiler. Does nothing, if profiling is disabled.
+    """
+    if _active_profiler is None:
+        return _NO_STAGE
+    return _active_profiler.stage(name)
+
+
+def wrap(handle, library):
+    """
+    Wraps a TiXI or TiGL handle to count its method calls, if profiling is enabled
+
+    :param library: name of the library used in the report, e.g. 'tixi3' or 'tigl2'
+    :return: the wrapped handle or the handle itself, if profiling is disabled
+    """
+    if _active_profiler is None:
+        return handle
+    return CountingProxy(handle, _active_profiler, library)
+
+
+def count_nodes(label, tixi_handle):
+    """
+    Records the number of elements of the document, if profiling is enabled
+    """
+    if _active_profiler is not None:
+        _active_profiler.count_nodes(label, tixi_handle)
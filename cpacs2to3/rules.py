@@ -0,0 +1,203 @@
+"""
+Declarative rules for the purely structural changes of the upgrade steps.
+
+A rule consists of a path pattern of the elements it applies to and an action
+(rename or swap of child elements). Rules can be applied by TiXI, where all rules
+of one or more upgrade steps are applied in a single traversal, or to buffered
+ElementTree subtrees by the streaming engine.
+"""
+
+import abc
+
+from cpacs2to3 import tixi_helper
+from cpacs2to3.uid_generator import uid_manager
+
+
+def _pattern_names(pattern):
+    return tuple(pattern.strip('/').split('/'))
+
+
+def path_names(element_path):
+    """
+    Returns the element names of an element path like /cpacs/vehicles/aircraft/model[2]
+    """
+    return [tixi_helper.split_parent_child_path('/' + step)[1] for step in element_path.strip('/').split('/')]
+
+
+class Rule(abc.ABC):
+    """
+    Base class of all rules
+
+    :param parent: pattern of the elements, whose children are changed by the rule.
+                   Either an absolute path like '/cpacs/vehicles/profiles' or a
+                   descendant pattern like '//lowerShell/stringer'
+    """
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.absolute = not parent.startswith('//')
+        self.names = _pattern_names(parent)
+
+    def matches(self, names):
+        """
+        Returns True, if the element with the given list of element names from the root matches the pattern
+        """
+        if self.absolute:
+            return tuple(names) == self.names
+        return tuple(names[-len(self.names):]) == self.names
+
+    @property
+    def xpath(self):
+        return self.parent
+
+    @abc.abstractmethod
+    def used_names(self):
+        """
+        Names of the elements, that must be present in the input for the rule to match
+        """
+
+    @abc.abstractmethod
+    def created_names(self):
+        """
+        Names of the elements, that the rule creates
+        """
+
+    @abc.abstractmethod
+    def apply(self, tixi_handle, path):
+        """
+        Applies the rule to the element at path
+
+        :return: True, if the document was changed
+        """
+
+    @abc.abstractmethod
+    def apply_element(self, element):
+        """
+        Applies the rule to an ElementTree element
+        """
+
+
+class Rename(Rule):
+    """
+    Renames the child old_name of the matching elements to new_name
+    """
+
+    def __init__(self, parent, old_name, new_name):
+        super(Rename, self).__init__(parent)
+        self.old_name = old_name
+        self.new_name = new_name
+
+    def used_names(self):
+        return set(self.names) | {self.old_name}
+
+    def created_names(self):
+        return {self.new_name}
+
+    def apply(self, tixi_handle, path):
+        if not tixi_handle.checkElement(path + '/' + self.old_name):
+            return False
+        uid_manager.rename_element(tixi_handle, path, self.old_name, self.new_name)
+        return True
+
+    def apply_element(self, element):
+        child = element.find(self.old_name)
+        if child is not None:
+            child.tag = self.new_name
+
+
+class Swap(Rule):
+    """
+    Swaps the children first and second of the matching elements.
+    If if_child is given, only elements having a child of this name are changed.
+    """
+
+    def __init__(self, parent, first, second, if_child=None):
+        super(Swap, self).__init__(parent)
+        self.first = first
+        self.second = second
+        self.if_child = if_child
+
+    def used_names(self):
+        names = set(self.names) | {self.first, self.second}
+        if self.if_child is not None:
+            names.add(self.if_child)
+        return names
+
+    def created_names(self):
+        return set()
+
+    def apply(self, tixi_handle, path):
+        if self.if_child is not None and not tixi_handle.checkElement(path + '/' + self.if_child):
+            return False
+        if not tixi_handle.checkElement(path + '/' + self.first) or \
+                not tixi_handle.checkElement(path + '/' + self.second):
+            return False
+        uid_manager.swap_elements(tixi_handle, path, self.first, self.second)
+        return True
+
+    def apply_element(self, element):
+        if self.if_child is not None and element.find(self.if_child) is None:
+            return
+        first = element.find(self.first)
+        second = element.find(self.second)
+        if first is None or second is None:
+            return
+
+        # swap the elements, but keep the whitespace between them at its position
+        children = list(element)
+        i, j = children.index(first), children.index(second)
+        children[i], children[j] = second, first
+        first.tail, second.tail = second.tail, first.tail
+        element[:] = children
+
+
+def fuse_rule_sets(rule_sets):
+    """
+    Composes the rules of consecutive upgrade steps into as few batches as possible.
+    All rules of a batch can be applied in a single traversal, because none of them
+    depends on an element created by another rule of the same batch.
+
+    :param rule_sets: list of rule lists, one for each upgrade step in order
+    :return: list of rule lists
+    """
+    batches = []
+    created = set()
+    for rules in rule_sets:
+        if len(rules) == 0:
+            continue
+        used = set()
+        for rule in rules:
+            used |= rule.used_names()
+        if len(batches) == 0 or used & created:
+            batches.append([])
+            created = set()
+        batches[-1].extend(rules)
+        for rule in rules:
+            created |= rule.created_names()
+    return batches
+
+
+def apply_rules(tixi_handle, rules):
+    """
+    Applies all rules in a single traversal of the document.
+
+    All matching elements are collected by one query. The rules are applied in reverse
+    document order, such that changes of an element never invalidate the paths of
+    elements, that are not yet processed. Hence, all patterns refer to the element names
+    before any rule was applied.
+
+    :return: number of changes
+    """
+    if len(rules) == 0:
+        return 0
+
+    xpath = '|'.join(sorted(set(rule.xpath for rule in rules)))
+
+    n_changes = 0
+    for path in reversed(tixi_helper.resolve_xpaths(tixi_handle, xpath)):
+        names = path_names(path)
+        for rule in rules:
+            if rule.matches(names) and rule.apply(tixi_handle, path):
+                n_changes += 1
+
+    return n_changes
@@ -0,0 +1,75 @@
+"""
+Index of the connections between section elements and segments of wings and fuselages
+"""
+
+from cpacs2to3 import tixi_helper
+
+
+class SegmentIndex(object):
+    """
+    Maps the uIDs of section elements to the segments, that connect them,
+    and to the index of their section.
+
+    Each map is built with a single query over all segments or sections on its first use,
+    instead of querying the whole document for every element.
+    """
+
+    def __init__(self, tixi_handle):
+        self.tixi_handle = tixi_handle
+        self._to_element = None
+        self._from_element = None
+        self._section_indices = None
+
+    def _build_segment_maps(self):
+        self._to_element = {}
+        self._from_element = {}
+        for component in ('wing', 'fuselage'):
+            to_element = self._to_element.setdefault(component, {})
+            from_element = self._from_element.setdefault(component, {})
+
+            for path in tixi_helper.resolve_xpaths(self.tixi_handle, '//%s/segments/segment[@uID]' % component):
+                segment_uid = self.tixi_handle.getTextAttribute(path, 'uID')
+                if self.tixi_handle.checkElement(path + '/toElementUID'):
+                    to_element.setdefault(self.tixi_handle.getTextElement(path + '/toElementUID'), segment_uid)
+                if self.tixi_handle.checkElement(path + '/fromElementUID'):
+                    from_element.setdefault(self.tixi_handle.getTextElement(path + '/fromElementUID'), segment_uid)
+
+    def segment_eta(self, element_uid, component='wing'):
+        """
+        Finds the first segment ending or starting at the given section element.
+        Segments ending at the element are preferred.
+
+        :param element_uid: uID of the section element
+        :param component: either 'wing' or 'fuselage'
+        :return: tuple (segment uID, eta of the element on the segment) or None, if no segment references the element
+        """
+        if self._to_element is None:
+            self._build_segment_maps()
+
+        segment_uid = self._to_element[component].get(element_uid)
+        if segment_uid is not None:
+            return segment_uid, 1.0
+
+        segment_uid = self._from_element[component].get(element_uid)
+        if segment_uid is not None:
+            return segment_uid, 0.0
+
+        return None
+
+    def section_index(self, element_uid):
+        """
+        Returns the index of the section containing the given section element inside its wing or fuselage
+
+        :param element_uid: uID of the section element
+        :return: the index starting at 1 or None, if there is no such element
+        """
+        if self._section_indices is None:
+            self._section_indices = {}
+            xpath = '//wing/sections/section/elements/element[@uID]|//fuselage/sections/section/elements/element[@uID]'
+            for path in tixi_helper.resolve_xpaths(self.tixi_handle, xpath):
+                section_path = tixi_helper.parent_path(tixi_helper.parent_path(path))
+                step = tixi_helper.element_name(section_path)
+                index = int(step[step.index('[') + 1:-1]) if '[' in step else 1
+                self._section_indices[self.tixi_handle.getTextAttribute(path, 'uID')] = index
+
+        return self._section_indices.get(element_uid)
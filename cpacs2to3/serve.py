@@ -0,0 +1,352 @@
+"""
+Long-running conversion service.
+
+The service keeps a pool of worker processes, that have imported all libraries and built
+their VersionUpdater before the first request arrives. Documents are posted via HTTP,
+either on localhost or on a Unix socket:
+
+    $ cpacs2to3 serve --port 8765 --workers 4
+    $ curl --data-binary @aircraft.xml "http://127.0.0.1:8765/convert?target_version=3.2&fix_errors=1"
+
+The response is a JSON object with the converted document and the conversion report.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobTimeoutError(Exception):
+    pass
+
+
+class JobError(Exception):
+    pass
+
+
+def _worker_main(conn, initializer, job_function):
+    """
+    Main loop of a worker process. Receives jobs from the pipe until it receives None.
+    """
+    if initializer is not None:
+        initializer()
+
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        try:
+            result = ('ok', job_function(*job))
+        except (Exception, SystemExit) as e:
+            # SystemExit must not kill the worker, the pool would wait for the result until the timeout
+            logging.exception("Job failed")
+            result = ('error', "%s: %s" % (type(e).__name__, e))
+        conn.send(result)
+
+
+class _Worker(object):
+    def __init__(self, initializer, job_function):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main, args=(child_conn, initializer, job_function))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+        self.n_jobs = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, EOFError):
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool(object):
+    """
+    Pool of pre-initialised worker processes, that are shared by the threads submitting jobs
+
+    :param n_workers: number of worker processes
+    :param job_function: module level function, called as job_function(*job) inside the workers
+    :param initializer: module level function called once in each new worker before its first job
+    :param max_queue: number of jobs, that may wait for a free worker. Further jobs are rejected
+    :param max_jobs_per_worker: a worker is replaced by a new one after this number of jobs. 0 means never
+    """
+
+    def __init__(self, n_workers, job_function, initializer=None, max_queue=16, max_jobs_per_worker=0):
+        self.job_function = job_function
+        self.initializer = initializer
+        self.max_jobs_per_worker = max_jobs_per_worker
+
+        self._slots = threading.BoundedSemaphore(n_workers + max_queue)
+        self._available = threading.Semaphore(n_workers)
+        self._lock = threading.Lock()
+        self._idle = [self._new_worker() for _ in range(n_workers)]
+
+    def _new_worker(self):
+        return _Worker(self.initializer, self.job_function)
+
+    def _replace_worker(self, worker):
+        worker.kill()
+        return self._new_worker()
+
+    def submit(self, job, timeout=None):
+        """
+        Runs a job in a worker process and waits for its result
+
+        :param job: tuple of arguments of the job function
+        :param timeout: maximum time in seconds for the job, excluding the time waiting for a free worker.
+                        If it is exceeded, the worker is killed and replaced.
+        :return: the return value of the job function
+        :raises QueueFullError: if all workers are busy and the queue is full
+        :raises JobTimeoutError: if the job exceeded the timeout
+        :raises JobError: if the job function raised an exception
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("All workers are busy and the queue is full")
+        try:
+            self._available.acquire()
+            try:
+                with self._lock:
+                    worker = self._idle.pop()
+                try:
+                    worker, status, value = self._run(worker, job, timeout)
+                except BaseException:
+                    # the state of the worker is unknown, it must not be used again
+                    worker = self._replace_worker(worker)
+                    raise
+                finally:
+                    with self._lock:
+                        self._idle.append(worker)
+            finally:
+                self._available.release()
+        finally:
+            self._slots.release()
+
+        if status == 'timeout':
+            raise JobTimeoutError(value)
+        if status != 'ok':
+            raise JobError(value)
+        return value
+
+    def _run(self, worker, job, timeout):
+        """
+        Runs the job on the worker
+
+        :return: tuple (worker to put back into the pool, status, result or error message)
+        """
+        try:
+            worker.conn.send(job)
+        except OSError:
+            # e.g. the worker was killed by the system between two jobs
+            logging.warning("Worker %d died, replacing it" % worker.process.pid)
+            return self._replace_worker(worker), 'error', "The worker process died"
+
+        if not worker.conn.poll(timeout):
+            logging.warning("Job exceeded the timeout of %s s, replacing worker %d" % (timeout, worker.process.pid))
+            return self._replace_worker(worker), 'timeout', "Job exceeded the timeout of %s s" % timeout
+
+        try:
+            status, value = worker.conn.recv()
+        except (EOFError, OSError):
+            logging.warning("Worker %d died, replacing it" % worker.process.pid)
+            return self._replace_worker(worker), 'error', "The worker process died"
+
+        worker.n_jobs += 1
+        if 0 < self.max_jobs_per_worker <= worker.n_jobs:
+            logging.info("Recycling worker %d after %d jobs" % (worker.process.pid, worker.n_jobs))
+            worker.stop()
+            worker = self._new_worker()
+
+        return worker, status, value
+
+    def close(self):
+        """
+        Stops all idle workers
+        """
+        with self._lock:
+            for worker in self._idle:
+                worker.stop()
+            self._idle = []
+
+
+def _init_conversion_worker():
+    logging.basicConfig(format='%(processName)s %(levelname)s: %(message)s', level=logging.INFO)
+
+    from cpacs2to3 import api
+    api.warm_up()
+
+
+def _conversion_job(document, target_version, options):
+    """
+    Converts a document inside a worker process
+
+    :param options: keyword arguments of ConversionOptions
+    :return: tuple (converted document, report as dict)
+    """
+    from cpacs2to3 import api
+
+    converted, report = api.convert(document, target_version, api.ConversionOptions(**options))
+    return converted, vars(report)
+
+
+def _parse_options(query, cache_dir, cache_size):
+    """
+    Reads the ConversionOptions from the query parameters of a request
+    """
+    def flag(name):
+        return query.get(name, ['0'])[0].lower() in ('1', 'true', 'yes')
+
+    options = {
+        'fix_errors': flag('fix_errors'),
+        'element_index': flag('element_index'),
+        'cache_dir': cache_dir,
+        'cache_size': cache_size,
+    }
+    if 'configurations' in query:
+        options['configurations'] = query['configurations'][0].split(',')
+    if 'name' in query:
+        options['name'] = query['name'][0]
+    return options
+
+
+class _ConversionRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles POST /convert requests. The body is the CPACS document, the options are query parameters.
+    """
+
+    def _reply(self, code, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/convert':
+            self._reply(404, {'error': 'Unknown path %s' % url.path})
+            return
+
+        query = parse_qs(url.query)
+        target_version = query.get('target_version', ['3.2'])[0]
+        server = self.server
+        options = _parse_options(query, server.cache_dir, server.cache_size)
+
+        length = int(self.headers.get('Content-Length', 0))
+        document = self.rfile.read(length)
+
+        try:
+            converted, report = server.pool.submit((document, target_version, options), server.timeout_s)
+        except QueueFullError as e:
+            self._reply(503, {'error': str(e)})
+        except JobTimeoutError as e:
+            self._reply(504, {'error': str(e)})
+        except JobError as e:
+            self._reply(422, {'error': str(e)})
+        else:
+            self._reply(200, {'document': converted.decode('utf-8'), 'report': report})
+
+    def address_string(self):
+        # the client address of Unix sockets is not a tuple
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix-socket'
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s" % (self.address_string(), format % args))
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(pool, host='127.0.0.1', port=8765, socket_path=None, timeout=None, cache_dir=None,
+                  cache_size=1024):
+    """
+    Creates the HTTP server of the conversion service
+
+    :param pool: WorkerPool running _conversion_job
+    :param socket_path: if given, the server listens on this Unix socket instead of host and port
+    :param timeout: timeout of a single conversion in seconds
+    :param cache_dir: directory of the geometry cache shared by all conversions
+    """
+    if socket_path is not None:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _ThreadingUnixHTTPServer(socket_path, _ConversionRequestHandler)
+    else:
+        server = _ThreadingHTTPServer((host, port), _ConversionRequestHandler)
+
+    server.pool = pool
+    server.timeout_s = timeout
+    server.cache_dir = cache_dir
+    server.cache_size = cache_size
+    return server
+
+
+def main(argv=None):
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(prog='cpacs2to3 serve',
+                                     description='Runs a conversion service with pre-initialised worker processes.')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--socket', default=None, help='Listen on this Unix socket instead of host and port')
+    parser.add_argument('--workers', type=int, default=2, help='Number of worker processes')
+    parser.add_argument('--max-queue', type=int, default=16,
+                        help='Number of requests waiting for a free worker. Further requests are rejected')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='Timeout of a single conversion in seconds. The worker is replaced afterwards')
+    parser.add_argument('--max-jobs-per-worker', type=int, default=100,
+                        help='Replace a worker after this number of conversions to limit its memory growth')
+    parser.add_argument('--cache-dir', default=None,
+                        help='Directory of a persistent cache of geometry evaluations, shared by all conversions')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Size limit of the geometry cache in MB')
+
+    args = parser.parse_args(argv)
+
+    pool = WorkerPool(args.workers, _conversion_job, _init_conversion_worker,
+                      max_queue=args.max_queue, max_jobs_per_worker=args.max_jobs_per_worker)
+    server = create_server(pool, args.host, args.port, args.socket, args.timeout, args.cache_dir, args.cache_size)
+
+    if args.socket is not None:
+        logging.info("Listening on unix socket %s" % args.socket)
+    else:
+        logging.info("Listening on http://%s:%d" % (args.host, args.port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+    return 0
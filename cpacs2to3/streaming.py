@@ -0,0 +1,439 @@
+"""
+Streaming engine for the purely structural CPACS 3.x upgrade steps.
+
+The input file is read with an incremental (SAX) parser and the output is
+written while reading. Only subtrees, that have to be rewritten as a whole
+(the header, materials and stringers), are held in memory. Hence, the memory
+usage does not depend on the size of the file.
+"""
+
+import logging
+import os
+import tempfile
+import xml.sax
+import xml.sax.handler
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+from tixi3 import tixi3wrapper
+
+from cpacs2to3 import rules
+from cpacs2to3.cpacs_converter import (upgrade_3_to_31, upgrade_31_to_32, change_cpacs_version, add_changelog,
+                                       VersionUpdater)
+
+
+class _TreeBuilder(ElementTree.TreeBuilder):
+    """
+    TreeBuilder, that keeps comments and processing instructions as elements
+    """
+
+    def comment(self, text):
+        self.start(ElementTree.Comment, {})
+        self.data(text)
+        return self.end(ElementTree.Comment)
+
+    def pi(self, target, text=None):
+        self.start(ElementTree.PI, {})
+        self.data(target + ' ' + text if text else target)
+        return self.end(ElementTree.PI)
+
+
+def _is_namespace_declaration(name):
+    return name == 'xmlns' or name.startswith('xmlns:')
+
+
+def _namespace_declarations(element):
+    """
+    Returns all namespace declarations of the buffered element and its descendants as dict of prefix -> uri
+    """
+    namespaces = {}
+    for child in element.iter():
+        for name, value in child.attrib.items():
+            if _is_namespace_declaration(name):
+                namespaces[name[6:]] = value
+    return namespaces
+
+
+def _prefixed_name(name, prefixes):
+    """
+    Converts a name like {uri}local, as returned by the ElementTree parser, back to prefix:local
+    """
+    if name[:1] != '{':
+        return name
+    uri, local = name[1:].split('}', 1)
+    prefix = prefixes.get(uri, '')
+    return prefix + ':' + local if prefix else local
+
+
+def _restore_prefixes(element, namespaces, declarations):
+    """
+    Restores the namespace prefixes of a parsed element.
+    The declarations made inside the subtree are added to its root.
+    """
+    prefixes = dict((uri, prefix) for prefix, uri in namespaces.items())
+    prefixes.update((uri, prefix) for prefix, uri in declarations.items())
+
+    for child in element.iter():
+        if not isinstance(child.tag, str):
+            continue
+        child.tag = _prefixed_name(child.tag, prefixes)
+        attrib = [(_prefixed_name(name, prefixes), value) for name, value in child.attrib.items()]
+        child.attrib.clear()
+        child.attrib.update(attrib)
+
+    for prefix, uri in sorted(declarations.items()):
+        element.set('xmlns:' + prefix if prefix else 'xmlns', uri)
+
+
+class _SubtreeHook(object):
+    """
+    Imperative part of an upgrade step, applied to each buffered subtree matching the absolute path
+    """
+
+    def __init__(self, path, function):
+        self.names = tuple(path.strip('/').split('/'))
+        self.function = function
+
+    def matches(self, names):
+        return tuple(names) == self.names
+
+
+def _process_with_tixi(element, ancestors, namespaces, function):
+    """
+    Applies a function working on a TiXI handle to a single buffered subtree.
+    The subtree is embedded into its ancestors to keep the paths used by function valid.
+    The namespaces declared by the ancestors are declared again by the outermost ancestor.
+
+    :param namespaces: dict of prefix -> uri of the namespaces declared by the ancestors
+    :return: the processed element
+    """
+    declarations = ''.join(' %s=%s' % ('xmlns:' + prefix if prefix else 'xmlns', quoteattr(uri))
+                           for prefix, uri in sorted(namespaces.items()))
+    subtree_declarations = _namespace_declarations(element)
+
+    document = ''.join('<%s%s>' % (name, declarations if i == 0 else '') for i, name in enumerate(ancestors)) + \
+               ElementTree.tostring(element, encoding='unicode') + \
+               ''.join('</%s>' % name for name in reversed(ancestors))
+
+    tixi = tixi3wrapper.Tixi3()
+    tixi.openString(document)
+    tixi.usePrettyPrint(1)
+    function(tixi)
+    result = ElementTree.fromstring(tixi.exportDocumentAsString(), ElementTree.XMLParser(target=_TreeBuilder()))
+    tixi.close()
+
+    for _ in ancestors[1:]:
+        result = _first_element(result)
+    if ancestors:
+        result = _first_element(result)
+
+    _restore_prefixes(result, namespaces, subtree_declarations)
+    return result
+
+
+def _first_element(element):
+    # comments and processing instructions are children too
+    return next(child for child in element if isinstance(child.tag, str))
+
+
+def _replace_children(element, processed):
+    element.attrib.clear()
+    element.attrib.update(processed.attrib)
+    element.text = processed.text
+    element[:] = list(processed)
+
+
+def _upgrade_material(element, ancestors, namespaces):
+    from cpacs2to3.material import upgrade_material_cpacs_31
+
+    _replace_children(element, _process_with_tixi(element, ancestors, namespaces, upgrade_material_cpacs_31))
+
+
+# imperative parts of the upgrade steps, that can be applied to buffered subtrees.
+# The structural rules of the steps are taken from the VersionUpdater.
+STREAMING_HOOKS = {
+    upgrade_3_to_31: [_SubtreeHook('/cpacs/vehicles/materials/material', _upgrade_material)],
+    # only the version changes
+    upgrade_31_to_32: [],
+}
+
+_HEADER = ('cpacs', 'header')
+
+
+def can_stream(steps):
+    """
+    Returns True, if all given update steps can be applied by the streaming engine in one pass
+    """
+    if not all(step.rules is not None and step.update in STREAMING_HOOKS for step in steps):
+        return False
+    return len(rules.fuse_rule_sets([step.rules for step in steps])) <= 1
+
+
+class _XmlWriter(object):
+    """
+    Writes xml events to a binary stream
+    """
+
+    def __init__(self, out, encoding='utf-8'):
+        self.out = out
+        self.encoding = encoding
+        self._pending_start = False
+
+    def _write(self, text):
+        self.out.write(text.encode(self.encoding, 'xmlcharrefreplace'))
+
+    def _close_pending_start(self):
+        if self._pending_start:
+            self._write('>')
+            self._pending_start = False
+
+    def declaration(self):
+        self._write('<?xml version="1.0" encoding="%s"?>\n' % self.encoding)
+
+    def start(self, name, attrs):
+        self._close_pending_start()
+        self._write('<' + name)
+        for key, value in attrs.items():
+            self._write(' %s=%s' % (key, quoteattr(value)))
+        self._pending_start = True
+
+    def end(self, name):
+        if self._pending_start:
+            self._write('/>')
+            self._pending_start = False
+        else:
+            self._write('</%s>' % name)
+
+    def characters(self, content):
+        if content:
+            self._close_pending_start()
+            self._write(escape(content))
+
+    def comment(self, content):
+        self._close_pending_start()
+        self._write('<!--%s-->' % content)
+
+    def processing_instruction(self, target, data):
+        self._close_pending_start()
+        self._write('<?%s %s?>' % (target, data) if data else '<?%s?>' % target)
+
+    def element(self, element):
+        """
+        Writes an ElementTree element including its tail
+        """
+        if element.tag is ElementTree.Comment:
+            self.comment(element.text)
+        elif element.tag is ElementTree.ProcessingInstruction:
+            target, _, data = element.text.partition(' ')
+            self.processing_instruction(target, data)
+        else:
+            self.start(element.tag, element.attrib)
+            self.characters(element.text)
+            for child in element:
+                self.element(child)
+            self.end(element.tag)
+        self.characters(element.tail)
+
+
+class _StreamingUpgrader(xml.sax.handler.ContentHandler):
+    """
+    SAX handler, that applies the streaming steps while copying the document to the writer
+    """
+
+    def __init__(self, writer, target_version, version_updater):
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.writer = writer
+        self.target_version = target_version
+        self.version_updater = version_updater
+
+        self.steps = None
+        self.renames = []
+        self.subtree_functions = []
+        # names of the open elements in the input and in the output
+        self.names = []
+        self.output_names = []
+        # namespaces declared by each of the open elements, as dicts of prefix -> uri
+        self.namespaces = []
+
+        # state of the subtree, that is currently buffered
+        self.builder = None
+        self.buffer_depth = 0
+        self.buffer_functions = []
+
+    def _subtree_functions(self):
+        if tuple(self.names) == _HEADER:
+            return [self._upgrade_header]
+        if self.steps is None:
+            if len(self.names) > 1:
+                raise RuntimeError("The CPACS header must precede all other elements when streaming")
+            return []
+        return [function for matches, function in self.subtree_functions if matches(self.names)]
+
+    def _output_name(self, name):
+        for rule in self.renames:
+            if name == rule.old_name and rule.matches(self.names):
+                return rule.new_name
+        return name
+
+    @staticmethod
+    def _rule_function(rule):
+        def apply(element, ancestors, namespaces):
+            rule.apply_element(element)
+        return apply
+
+    def _namespaces_in_scope(self):
+        namespaces = {}
+        for declarations in self.namespaces:
+            namespaces.update(declarations)
+        return namespaces
+
+    def _upgrade_header(self, element, ancestors, namespaces):
+        current_version = element.findtext('cpacsVersion', '').strip()
+        steps = self.version_updater.update_steps(current_version, self.target_version)
+        if not can_stream(steps):
+            raise RuntimeError("The upgrade from %s to %s cannot be streamed" % (current_version, self.target_version))
+
+        if len(steps) == 0:
+            print("%s is compatible to %s. No actions required... " % (current_version, self.target_version))
+        else:
+            logging.info("Streaming upgrade of CPACS %s file to CPACS version %s" % (current_version, self.target_version))
+
+        self.steps = steps
+
+        # renames are applied to the tags while streaming, all other rules and hooks to buffered subtrees
+        self.renames = []
+        self.subtree_functions = []
+        for step in steps:
+            for rule in step.rules:
+                if isinstance(rule, rules.Rename):
+                    self.renames.append(rule)
+                else:
+                    self.subtree_functions.append((rule.matches, self._rule_function(rule)))
+            for hook in STREAMING_HOOKS[step.update]:
+                self.subtree_functions.append((hook.matches, hook.function))
+
+        target_version = self.target_version
+
+        def update_header(tixi):
+            if len(steps) > 0:
+                change_cpacs_version(tixi, target_version)
+            add_changelog(tixi, "Converted to CPACS %s using cpacs2to3" % target_version)
+
+        _replace_children(element, _process_with_tixi(element, ancestors, namespaces, update_header))
+
+    def startDocument(self):
+        self.writer.declaration()
+
+    def startElement(self, name, attrs):
+        output_name = self._output_name(name)
+        self.names.append(name)
+        self.output_names.append(output_name)
+        self.namespaces.append(dict((key[6:], value) for key, value in attrs.items()
+                                    if _is_namespace_declaration(key)))
+
+        if self.builder is not None:
+            self.buffer_depth += 1
+            self.builder.start(output_name, dict(attrs))
+            return
+
+        functions = self._subtree_functions()
+        if functions:
+            self.builder = _TreeBuilder()
+            self.buffer_depth = 1
+            self.buffer_functions = functions
+            self.builder.start(output_name, dict(attrs))
+        else:
+            self.writer.start(output_name, attrs)
+
+    def endElement(self, name):
+        output_name = self.output_names.pop()
+        self.names.pop()
+        self.namespaces.pop()
+
+        if self.builder is None:
+            self.writer.end(output_name)
+            return
+
+        self.builder.end(output_name)
+        self.buffer_depth -= 1
+        if self.buffer_depth == 0:
+            element = self.builder.close()
+            self.builder = None
+            namespaces = self._namespaces_in_scope()
+            for function in self.buffer_functions:
+                function(element, self.output_names, namespaces)
+            self.writer.element(element)
+
+    def characters(self, content):
+        if self.builder is not None:
+            self.builder.data(content)
+        else:
+            self.writer.characters(content)
+
+    def ignorableWhitespace(self, whitespace):
+        self.characters(whitespace)
+
+    def processingInstruction(self, target, data):
+        if self.builder is not None:
+            self.builder.pi(target, data)
+            return
+        self.writer.processing_instruction(target, data)
+        if not self.names:
+            # the parser does not report whitespace outside of the root element
+            self.writer.characters('\n')
+
+    def comment(self, content):
+        # called by the parser as lexical handler
+        if self.builder is not None:
+            self.builder.comment(content)
+            return
+        self.writer.comment(content)
+        if not self.names:
+            self.writer.characters('\n')
+
+    def startDTD(self, name, public_id, system_id):
+        pass
+
+    def endDTD(self):
+        pass
+
+    def startCDATA(self):
+        pass
+
+    def endCDATA(self):
+        pass
+
+
+def stream_upgrade(input_file, output_file, target_version, version_updater=None):
+    """
+    Upgrades a CPACS 3.x file to target_version without loading the whole document.
+
+    Only update steps with structural rules and an entry in STREAMING_HOOKS are supported,
+    i.e. upgrades between CPACS 3 versions.
+    The output file is only replaced, if the upgrade succeeded.
+
+    :param input_file: name of the input file
+    :param output_file: name of the output file
+    :param target_version: target version to convert to
+    :param version_updater: VersionUpdater to determine the update steps. A new one is created, if None
+    """
+    if version_updater is None:
+        version_updater = VersionUpdater()
+
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    fd, tmp_name = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            handler = _StreamingUpgrader(_XmlWriter(out), target_version, version_updater)
+            parser = xml.sax.make_parser()
+            parser.setContentHandler(handler)
+            parser.setProperty(xml.sax.handler.property_lexical_handler, handler)
+            parser.parse(input_file)
+            if handler.steps is None:
+                raise RuntimeError("No CPACS header found in '%s'" % input_file)
+        os.replace(tmp_name, output_file)
+    except:
+        os.remove(tmp_name)
+        raise
+
+    logging.info("Done")
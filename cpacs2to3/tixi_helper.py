@@ -1,5 +1,19 @@
+import re
+from xml.etree import ElementTree
+
 from tixi3.tixi3wrapper import Tixi3Exception
 
+# matches xpaths like //a or //a/b/c
+_SIMPLE_XPATH = re.compile(r'^//[A-Za-z_][\w.\-]*(/[A-Za-z_][\w.\-]*)*$')
+
+# matches a step of an element path like a or a[2]
+_PATH_STEP = re.compile(r'^([A-Za-z_][\w.\-]*)(\[(\d+)\])?$')
+
+# prefixes of TiXI methods, that don't change the document
+_READ_ONLY_PREFIXES = ('get', 'check', 'xPath', 'uIDGet', 'uIDCheck', 'export', 'save',
+                       'schemaValidate', 'dTDValidate', 'setCacheEnabled', 'usePrettyPrint')
+
+
 def resolve_xpaths(tixi_handle, xpath):
     """
     Returns all paths that match the given xpath
@@ -10,6 +24,22 @@ def resolve_xpaths(tixi_handle, xpath):
     if xpath == '':
         return []
 
+    # use the element index, if the handle provides one
+    resolve_simple_xpath = getattr(tixi_handle, 'resolve_simple_xpath', None)
+    if resolve_simple_xpath is not None:
+        paths = resolve_simple_xpath(xpath)
+        if paths is not None:
+            return paths
+
+    # evaluate the expression only once, if TiXI supports it
+    get_all_xpaths = _bulk_xpath_resolver(tixi_handle)
+    if get_all_xpaths is not None:
+        try:
+            return list(get_all_xpaths(xpath))
+        except Tixi3Exception:
+            return []
+
+    # each call of xPathExpressionGetXPath evaluates the expression again
     try:
         n_nodes = tixi_handle.xPathEvaluateNodeNumber(xpath)
         paths = []
@@ -20,6 +50,14 @@ def resolve_xpaths(tixi_handle, xpath):
         return []
 
 
+def _bulk_xpath_resolver(tixi_handle):
+    """
+    Returns the TiXI method, that evaluates an xpath expression once and returns
+    all matching paths in document order, or None, if the TiXI version does not provide it
+    """
+    return getattr(tixi_handle, 'xPathExpressionGetAllXPaths', None)
+
+
 def parent_path(xpath):
     """
     Removes the last element in an xpath, effectively yielding the xpath to the parent element
@@ -66,6 +104,104 @@ def element_index(tixi_handle, xpath):
     return count
 
 
+class ChildPositions(object):
+    """
+    Cache of the child element names of parent elements to look up the position of elements in their parent.
+
+    Each parent is read from TiXI only once. Elements under cached parents must be removed and
+    created through remove_element and create_element_at_index, which keep the cache up to date.
+    """
+
+    def __init__(self, tixi_handle):
+        self.tixi_handle = tixi_handle
+        # parent path -> list of child names
+        self._names = {}
+        # parent path -> dict of child name -> position of the first child with this name
+        self._first = {}
+
+    def _children(self, parent):
+        names = self._names.get(parent)
+        if names is None:
+            count = self.tixi_handle.getNumberOfChilds(parent)
+            names = [self.tixi_handle.getChildNodeName(parent, i + 1) for i in range(count)]
+            first = {}
+            for i in reversed(range(count)):
+                first[names[i]] = i + 1
+            self._names[parent] = names
+            self._first[parent] = first
+        return names
+
+    def element_index(self, xpath):
+        """
+        Same as element_index, but using the cache
+        """
+        parent = parent_path(xpath)
+        names = self._children(parent)
+        return self._first[parent].get(element_name(xpath), len(names))
+
+    def _position(self, xpath):
+        parent = parent_path(xpath)
+        names = self._children(parent)
+        match = _PATH_STEP.match(element_name(xpath))
+        if match is None:
+            return None
+        name, index = match.group(1), int(match.group(3) or 1)
+        position = self._first[parent].get(name)
+        while position is not None and index > 1:
+            index -= 1
+            try:
+                position = names.index(name, position) + 1
+            except ValueError:
+                position = None
+        return position
+
+    def remove_element(self, xpath):
+        """
+        Removes the element at xpath from the document and from the cache
+        """
+        parent = parent_path(xpath)
+        position = self._position(xpath) if parent in self._names else None
+        self.tixi_handle.removeElement(xpath)
+        if position is None:
+            self.invalidate(parent)
+            return
+
+        names = self._names[parent]
+        first = self._first[parent]
+        name = names.pop(position - 1)
+        for child_name, child_position in first.items():
+            if child_position > position:
+                first[child_name] = child_position - 1
+        if first[name] == position:
+            try:
+                first[name] = names.index(name, position - 1) + 1
+            except ValueError:
+                del first[name]
+
+    def create_element_at_index(self, parent, name, index):
+        """
+        Creates a new element at the given position in the document and in the cache
+        """
+        self.tixi_handle.createElementAtIndex(parent, name, index)
+        names = self._names.get(parent)
+        if names is None:
+            return
+
+        first = self._first[parent]
+        names.insert(index - 1, name)
+        for child_name, child_position in first.items():
+            if child_position >= index:
+                first[child_name] = child_position + 1
+        first[name] = min(first.get(name, index), index)
+
+    def invalidate(self, parent):
+        """
+        Must be called, if the children of parent were changed without this cache
+        """
+        self._names.pop(parent, None)
+        self._first.pop(parent, None)
+
+
 def next_parent_uid(tixi_handle, current_path):
     parent, elem = split_parent_child_path(current_path)
     while not tixi_handle.checkAttribute(parent, "uID"):
@@ -84,4 +220,502 @@ def next_parent_uid(tixi_handle, current_path):
 def list_configurations(tixih):
     models = resolve_xpaths(tixih, '//vehicles/*/model')
     configuration = [tixih.getTextAttribute(imodel, 'uID') for imodel in models]
-    return configuration
\ No newline at end of file
+    return configuration
+
+
+def child_names(tixi_handle, parent):
+    """
+    Returns the names of all child elements of the element at parent in document order
+    """
+    names = [tixi_handle.getChildNodeName(parent, i + 1) for i in range(tixi_handle.getNumberOfChilds(parent))]
+    # text and comment nodes are named like #text
+    return [name for name in names if not name.startswith('#')]
+
+
+def child_steps(names):
+    """
+    Returns the last steps of the paths of child elements with the given names, in the same format
+    as TiXI, i.e. with an index only if there are siblings of the same name
+
+    :param names: names of all children of an element in document order
+    """
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    occurrences = {}
+    steps = []
+    for name in names:
+        if counts[name] > 1:
+            occurrences[name] = occurrences.get(name, 0) + 1
+            steps.append("%s[%d]" % (name, occurrences[name]))
+        else:
+            steps.append(name)
+    return steps
+
+
+def iter_element_paths(tixi_handle):
+    """
+    Iterates over all elements of the document in a single traversal
+
+    :param tixi_handle: TiXI 3 handle
+    :return: iterator of tuples (ElementTree element, path of the element) in document order
+    """
+    root = ElementTree.fromstring(tixi_handle.exportDocumentAsString())
+    stack = [(root, '/' + _local_name(root.tag))]
+    while stack:
+        element, path = stack.pop()
+        yield element, path
+
+        children = [child for child in element if isinstance(child.tag, str)]
+        steps = child_steps([_local_name(child.tag) for child in children])
+        stack.extend(reversed([(child, path + '/' + step) for child, step in zip(children, steps)]))
+
+
+def find_uid_owners_and_references(tixi_handle, uids):
+    """
+    Finds the elements owning and referencing the given uIDs in a single traversal of the document
+
+    :param tixi_handle: TiXI 3 handle
+    :param uids: collection of uIDs
+    :return: tuple of two dicts, mapping each uID to the paths of the elements with this uID attribute
+             and to the paths of the elements having a text node equal to the uID. Paths are in document order.
+    """
+    uids = set(uids)
+    owners = dict((uid, []) for uid in uids)
+    references = dict((uid, []) for uid in uids)
+
+    for element, path in iter_element_paths(tixi_handle):
+        uid = element.get('uID')
+        if uid in uids:
+            owners[uid].append(path)
+
+        texts = [element.text] + [child.tail for child in element]
+        for text in set(texts):
+            if text in uids:
+                references[text].append(path)
+
+    return owners, references
+
+
+class DocumentSnapshot(object):
+    """
+    Serialised copy of a document, shared by all consumers of this state of the document.
+
+    The TiXI 2 and TiXI 3 documents, that are needed by TiGL 2 and TiGL 3, are only
+    created from the serialised copy when they are used for the first time.
+    """
+
+    def __init__(self, tixi_handle):
+        self.xml_string = tixi_handle.exportDocumentAsString()
+        self._tixi2 = None
+        self._tixi3 = None
+
+    def save(self, filename):
+        with open(filename, "w") as text_file:
+            text_file.write(self.xml_string)
+
+    @property
+    def tixi2(self):
+        """
+        TiXI 2 handle of the document
+        """
+        if self._tixi2 is None:
+            from tixi import tixiwrapper
+            from cpacs2to3 import profiling
+
+            self._tixi2 = tixiwrapper.Tixi()
+            self._tixi2.openString(self.xml_string)
+            self._tixi2 = profiling.wrap(self._tixi2, 'tixi2')
+        return self._tixi2
+
+    @property
+    def tixi3(self):
+        """
+        TiXI 3 handle of a copy of the document
+        """
+        if self._tixi3 is None:
+            from tixi3 import tixi3wrapper
+            from cpacs2to3 import profiling
+
+            self._tixi3 = tixi3wrapper.Tixi3()
+            self._tixi3.openString(self.xml_string)
+            self._tixi3 = profiling.wrap(self._tixi3, 'tixi3')
+        return self._tixi3
+
+    def release_xml_string(self):
+        """
+        Frees the serialised copy. Afterwards, only already opened TiXI documents can be used.
+        """
+        self.xml_string = None
+
+    def close(self):
+        """
+        Closes the TiXI documents and frees the serialised copy
+        """
+        if self._tixi2 is not None:
+            self._tixi2.close()
+            self._tixi2 = None
+        if self._tixi3 is not None:
+            self._tixi3.close()
+            self._tixi3 = None
+        self.xml_string = None
+
+
+def is_read_only_method(method_name):
+    """
+    Returns True, if the TiXI method with the given name does not modify the document
+    """
+    return method_name.startswith('_') or method_name.startswith(_READ_ONLY_PREFIXES)
+
+
+def is_structural_method(method_name):
+    """
+    Returns True, if the TiXI method with the given name might add, remove, rename or move elements.
+    Methods, that only change texts or attributes are not structural.
+    """
+    if is_read_only_method(method_name):
+        return False
+    return not (method_name.startswith('update') or method_name.endswith('Attribute'))
+
+
+class TixiProxy(object):
+    """
+    Base class for wrappers around a TiXI handle.
+
+    All attributes, that are not defined by the wrapper, are forwarded to the wrapped handle.
+    Hence, the wrapper can be used wherever a TiXI handle is expected, also by TiGL.
+    """
+
+    def __init__(self, tixi_handle):
+        self.wrapped_handle = tixi_handle
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped_handle, name)
+
+
+class RecordingTixi(TixiProxy):
+    """
+    TiXI handle wrapper, that records all calls modifying the document.
+    The recorded changes can be applied to another document using replay_changes.
+    """
+
+    def __init__(self, tixi_handle):
+        super(RecordingTixi, self).__init__(tixi_handle)
+        self.changes = []
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped_handle, name)
+        if not callable(attr) or is_read_only_method(name):
+            return attr
+
+        def call(*args):
+            result = attr(*args)
+            self.changes.append((name, args))
+            return result
+
+        return call
+
+
+def replay_changes(tixi_handle, changes):
+    """
+    Applies changes recorded by a RecordingTixi in the same order to the given document
+    """
+    for method_name, args in changes:
+        getattr(tixi_handle, method_name)(*args)
+
+
+def changed_paths(changes):
+    """
+    Returns the paths of the elements changed by changes recorded by a RecordingTixi.
+    Elements created or added below a parent are identified by the parent path and their name.
+    """
+    paths = set()
+    for method_name, args in changes:
+        if len(args) == 0:
+            continue
+        if method_name.startswith(('create', 'add')) and len(args) > 1:
+            paths.add(args[0].rstrip('/') + '/' + args[1])
+        else:
+            paths.add(args[0])
+    return paths
+
+
+def _parse_simple_xpath(xpath):
+    """
+    Splits a union of simple descendant queries like '//a/b|//c' into lists of element names
+
+    :return: list of element name lists or None, if the xpath is not of this form
+    """
+    patterns = []
+    for part in xpath.split('|'):
+        part = part.strip()
+        if _SIMPLE_XPATH.match(part) is None:
+            return None
+        patterns.append(part[2:].split('/'))
+    return patterns
+
+
+def _local_name(tag):
+    return tag[tag.rfind('}') + 1:]
+
+
+class _IndexNode(object):
+    __slots__ = ('name', 'parent', 'children')
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.children = []
+
+
+class ElementIndex(object):
+    """
+    Index of all elements of a TiXI document, built in a single traversal.
+
+    It maps element names to the elements and keeps the parent links to compute the
+    element paths in the same format as TiXI returns them, i.e. with an index only
+    if the element has siblings of the same name.
+
+    Changes of the document are patched into the index. They only invalidate the
+    cached steps of the changed parents, so the index is never rebuilt.
+    """
+
+    def __init__(self, tixi_handle):
+        element = ElementTree.fromstring(tixi_handle.exportDocumentAsString())
+        self.root = _IndexNode(_local_name(element.tag), None)
+        self._by_name = {}
+
+        stack = [(element, self.root)]
+        while stack:
+            element, node = stack.pop()
+            self._by_name.setdefault(node.name, set()).add(node)
+            children = [child for child in element if isinstance(child.tag, str)]
+            node.children = [_IndexNode(_local_name(child.tag), node) for child in children]
+            stack.extend(zip(children, node.children))
+            # free the element tree as we go
+            element.clear()
+
+        # parent -> {child: (path step, position)}
+        self._steps = {}
+        # caches of the paths and the document order keys, valid until the next change
+        self._paths = {}
+        self._keys = {}
+
+    def _changed(self, *parents):
+        for parent in parents:
+            self._steps.pop(parent, None)
+        self._paths = {}
+        self._keys = {}
+
+    def _add_subtree(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self._by_name.setdefault(node.name, set()).add(node)
+            stack.extend(node.children)
+
+    def _remove_subtree(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self._by_name[node.name].discard(node)
+            stack.extend(node.children)
+
+    def _step(self, node):
+        steps = self._steps.get(node.parent)
+        if steps is None:
+            counts = {}
+            for child in node.parent.children:
+                counts[child.name] = counts.get(child.name, 0) + 1
+            steps = {}
+            occurrences = {}
+            for position, child in enumerate(node.parent.children):
+                if counts[child.name] > 1:
+                    occurrences[child.name] = occurrences.get(child.name, 0) + 1
+                    steps[child] = ("%s[%d]" % (child.name, occurrences[child.name]), position)
+                else:
+                    steps[child] = (child.name, position)
+            self._steps[node.parent] = steps
+        return steps[node]
+
+    def path(self, node):
+        """
+        Returns the path of the node
+        """
+        path = self._paths.get(node)
+        if path is None:
+            if node.parent is None:
+                path = '/' + node.name
+            else:
+                path = self.path(node.parent) + '/' + self._step(node)[0]
+            self._paths[node] = path
+        return path
+
+    def _order_key(self, node):
+        """
+        Returns a key sorting the nodes in document order, i.e. the positions of the node and its ancestors
+        """
+        key = self._keys.get(node)
+        if key is None:
+            if node.parent is None:
+                key = ()
+            else:
+                key = self._order_key(node.parent) + (self._step(node)[1],)
+            self._keys[node] = key
+        return key
+
+    def find(self, path):
+        """
+        Returns the node of the given element path or None, if it cannot be found.
+        Only paths consisting of element names and indices are supported.
+        """
+        steps = path.strip('/').split('/')
+        match = _PATH_STEP.match(steps[0])
+        if match is None or match.group(1) != self.root.name or match.group(3) not in (None, '1'):
+            return None
+
+        node = self.root
+        for step in steps[1:]:
+            match = _PATH_STEP.match(step)
+            if match is None:
+                return None
+            name, index = match.group(1), int(match.group(3) or 1)
+            children = [child for child in node.children if child.name == name]
+            if index > len(children):
+                return None
+            node = children[index - 1]
+        return node
+
+    def resolve(self, xpath):
+        """
+        Resolves an xpath consisting of a union of simple descendant queries like '//a/b|//c'
+
+        :return: list of element paths in document order or None, if the xpath is not supported
+        """
+        patterns = _parse_simple_xpath(xpath)
+        if patterns is None:
+            return None
+
+        nodes = set()
+        for names in patterns:
+            for node in self._by_name.get(names[-1], ()):
+                if self._matches(node, names):
+                    nodes.add(node)
+
+        return [self.path(node) for node in sorted(nodes, key=self._order_key)]
+
+    @staticmethod
+    def _matches(node, names):
+        for name in reversed(names[:-1]):
+            node = node.parent
+            if node is None or node.name != name:
+                return False
+        return True
+
+    def insert(self, parent_path, name, index=None):
+        """
+        Adds a new element to the index. If index is None, it is appended to the children of its parent.
+
+        :return: True, if the index could be updated
+        """
+        parent = self.find(parent_path)
+        if parent is None or (index is not None and index < 1):
+            return False
+        node = _IndexNode(name, parent)
+        if index is None:
+            parent.children.append(node)
+        else:
+            parent.children.insert(index - 1, node)
+        self._add_subtree(node)
+        self._changed(parent)
+        return True
+
+    def remove(self, path):
+        node = self.find(path)
+        if node is None or node.parent is None:
+            return False
+        node.parent.children.remove(node)
+        self._remove_subtree(node)
+        self._changed(node.parent)
+        return True
+
+    def rename(self, parent_path, old_name, new_name):
+        node = self.find(parent_path.rstrip('/') + '/' + old_name)
+        if node is None:
+            return False
+        self._by_name[node.name].discard(node)
+        node.name = new_name
+        self._by_name.setdefault(new_name, set()).add(node)
+        self._changed(node.parent)
+        return True
+
+    def swap(self, path1, path2):
+        node1 = self.find(path1)
+        node2 = self.find(path2)
+        if node1 is None or node2 is None or node1.parent is None or node2.parent is None:
+            return False
+        parent1, parent2 = node1.parent, node2.parent
+        idx1, idx2 = parent1.children.index(node1), parent2.children.index(node2)
+        parent1.children[idx1], parent2.children[idx2] = node2, node1
+        node1.parent, node2.parent = parent2, parent1
+        self._changed(parent1, parent2)
+        return True
+
+
+class IndexedTixi(TixiProxy):
+    """
+    TiXI handle wrapper, that maintains an ElementIndex of the document.
+
+    resolve_xpaths answers simple queries like '//a/b' from the index instead of
+    scanning the whole document with TiXI. The index is built on the first query.
+    Element insertions, removals, renames and swaps are patched into the index without
+    rebuilding it. Any other structural change drops the index, it is rebuilt on the next query.
+    """
+
+    def __init__(self, tixi_handle):
+        super(IndexedTixi, self).__init__(tixi_handle)
+        self.element_index = None
+
+    def resolve_simple_xpath(self, xpath):
+        """
+        :return: list of element paths or None, if the xpath cannot be resolved with the index
+        """
+        if _parse_simple_xpath(xpath) is None:
+            return None
+        if self.element_index is None:
+            self.element_index = ElementIndex(self.wrapped_handle)
+        return self.element_index.resolve(xpath)
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped_handle, name)
+        if not callable(attr) or not is_structural_method(name):
+            return attr
+
+        def call(*args):
+            result = attr(*args)
+            self._update_index(name, args)
+            return result
+
+        return call
+
+    def _update_index(self, method_name, args):
+        index = self.element_index
+        if index is None:
+            return
+
+        if method_name.endswith('AtIndex'):
+            updated = index.insert(args[0], args[1], args[-1])
+        elif method_name == 'createElement' or \
+                (method_name.startswith('add') and method_name.endswith(('Element', 'Vector'))):
+            updated = index.insert(args[0], args[1])
+        elif method_name == 'removeElement':
+            updated = index.remove(args[0])
+        elif method_name == 'renameElement':
+            updated = index.rename(args[0], args[1], args[2])
+        elif method_name == 'swapElements':
+            updated = index.swap(args[0], args[1])
+        else:
+            updated = False
+
+        if not updated:
+            self.element_index = None
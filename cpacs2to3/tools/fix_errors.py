@@ -8,6 +8,7 @@ from tixi3 import tixi3wrapper
 import argparse
 from cpacs2to3.cpacs_converter import fix_empty_elements, add_missing_uids, add_changelog
 from cpacs2to3.uid_generator import uid_manager
+from cpacs2to3 import profiling
 import cpacs2to3.tixi_helper
 
 
@@ -64,34 +65,60 @@ def main():
     parser.add_argument('input_file', help='Input CPACS file')
     parser.add_argument('-o', metavar='output_file', help='Name of the output file.')
     parser.add_argument('-i', help='Modify file in place, i.e. overwrite the input file.', action="store_true")
+    parser.add_argument('--profile', metavar='profile_file', default=None,
+                        help='Store the duration of each pass and the number of TiXI calls to this JSON file')
 
     args = parser.parse_args()
 
+    if args.profile is not None:
+        profiler = profiling.start()
+        try:
+            with profiler.stage('total'):
+                fix_file(args)
+        finally:
+            # a failed conversion stores the profile up to the failure
+            profiling.stop().save(args.profile)
+    else:
+        fix_file(args)
+
+
+def fix_file(args):
+    """
+    Fixes the input file given in the command line args and saves it
+    """
     cpacs_file = tixi3wrapper.Tixi3()
 
     filename = args.input_file
     output_file = args.o
     in_place = args.i
 
-    cpacs_file.open(filename)
+    with profiling.stage('open'):
+        cpacs_file.open(filename)
     cpacs_file.setCacheEnabled(1)
     cpacs_file.usePrettyPrint(1)
+    cpacs_file = profiling.wrap(cpacs_file, 'tixi3')
+    profiling.count_nodes('input', cpacs_file)
 
-    uid_manager.register_all_uids(cpacs_file)
+    with profiling.stage('register_all_uids'):
+        uid_manager.register_all_uids(cpacs_file)
 
     changelog = ""
 
-    if uid_manager.fix_invalid_uids(cpacs_file):
-        changelog += "Fixed invalid uIDs. "
+    with profiling.stage('fix_invalid_uids'):
+        if uid_manager.fix_invalid_uids(cpacs_file):
+            changelog += "Fixed invalid uIDs. "
 
-    if fix_empty_elements(cpacs_file):
-        changelog += "Removed empty elements. "
+    with profiling.stage('fix_empty_elements'):
+        if fix_empty_elements(cpacs_file):
+            changelog += "Removed empty elements. "
 
-    if add_missing_uids(cpacs_file):
-        changelog += "Added missing UIDs. "
+    with profiling.stage('add_missing_uids'):
+        if add_missing_uids(cpacs_file):
+            changelog += "Added missing UIDs. "
 
-    if fix_wing_profiles(cpacs_file):
-        changelog += "Fixed order of wing profiles. "
+    with profiling.stage('fix_wing_profiles'):
+        if fix_wing_profiles(cpacs_file):
+            changelog += "Fixed order of wing profiles. "
 
     if changelog != "":
         add_changelog(cpacs_file, changelog.strip(), "fix_errors.py")
@@ -101,11 +128,14 @@ def main():
     if in_place:
         output_file = filename
 
-    if output_file is not None:
-        logging.info("Saving " + output_file)
-        cpacs_file.save(output_file)
-    else:
-        logging.info(cpacs_file.exportDocumentAsString())
+    profiling.count_nodes('output', cpacs_file)
+
+    with profiling.stage('save'):
+        if output_file is not None:
+            logging.info("Saving " + output_file)
+            cpacs_file.save(output_file)
+        else:
+            logging.info(cpacs_file.exportDocumentAsString())
 
 
 if __name__ == "__main__":
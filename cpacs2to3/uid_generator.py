@@ -1,8 +1,15 @@
+import bisect
 import logging
 import os
+import sys
+import weakref
+from collections import OrderedDict
 
 from . import tixi_helper
 
+# marks paths, that are missing in the map of element paths
+_UNKNOWN = object()
+
 
 class UIDManager(object):
     def __init__(self):
@@ -10,19 +17,40 @@ class UIDManager(object):
         self.invalid_uids = []
         self.empty_uid_paths = []
 
+        # next suffix to try for each proposed uid prefix
+        self._next_suffix = {}
+
+        # maps the paths of all elements to their uID or None, if they don't have a uID
+        self.path_uids = {}
+        self._path_uids_handle = None
+        # maps parent paths to the uID of their nearest element with uID
+        self._nearest_uid_cache = {}
+        # maps element paths to the cached parent paths, whose lookup passed the element
+        self._cache_dependents = {}
+
     def create_uid(self, tixi_handle, current_path):
-        parent_uid, elem = tixi_helper.next_parent_uid(tixi_handle, current_path)
+        parent_uid, elem = self.next_parent_uid(tixi_handle, current_path)
 
-        new_uid = self.__make_unique_uid("%s_%s" % (parent_uid, elem))
+        return self.generate_uid("%s_%s" % (parent_uid, elem))
+
+    def generate_uid(self, proposed_uid):
+        """
+        Creates and registers a new uid consisting of proposed_uid and the lowest free numeric suffix
+        """
+        new_uid = self.__make_unique_uid(proposed_uid)
         self.register_uid(new_uid)
         return new_uid
 
     def __make_unique_uid(self, proposed_uid):
-        counter = 1
+        # Registered uids are never released. Hence, all suffixes below the
+        # last one handed out for this prefix are still taken and probing
+        # can continue from there.
+        counter = self._next_suffix.get(proposed_uid, 1)
         new_uid = "%s%d" % (proposed_uid, counter)
         while self.uid_exists(new_uid):
             counter += 1
             new_uid = "%s%d" % (proposed_uid, counter)
+        self._next_suffix[proposed_uid] = counter + 1
         return new_uid
 
     def register_uid(self, uid):
@@ -36,25 +64,247 @@ class UIDManager(object):
         if self.uid_exists(uid):
             raise RuntimeError('Duplicate UID: "%s"' % uid)
 
-        self.uids.add(uid)
+        # interning shares the uid string with the map of paths and all other occurrences
+        self.uids.add(sys.intern(uid))
 
     def uid_exists(self, uid):
         return uid in self.uids
 
+    def _has_path_uids(self, tixi_handle):
+        return self._path_uids_handle is not None and self._path_uids_handle() is tixi_handle
+
+    def set_uid_path(self, path, uid):
+        """
+        Stores the uid of the element at path in the map of element paths to uIDs
+        """
+        self.path_uids[path] = sys.intern(uid)
+        # only the cached lookups, that passed this element, might stop here now
+        self._drop_cached_lookups(path)
+
+    def _drop_cached_lookups(self, path):
+        for parent in self._cache_dependents.pop(path, ()):
+            self._nearest_uid_cache.pop(parent, None)
+
+    def _map_path(self, path):
+        """
+        Returns the path of the element in the form used by the map or None, if the element is not in the map.
+        TiXI accepts name[1] for single children and name for the first of several siblings, the map does not.
+        """
+        if not path.startswith('/'):
+            path = '/' + path
+        if path in self.path_uids:
+            return path
+
+        known_path = ''
+        for step in path.strip('/').split('/'):
+            candidate = known_path + '/' + step
+            if candidate not in self.path_uids:
+                if step.endswith('[1]'):
+                    candidate = candidate[:-3]
+                elif not step.endswith(']'):
+                    candidate += '[1]'
+                if candidate not in self.path_uids:
+                    return None
+            known_path = candidate
+        return known_path
+
+    def _count_children(self, parent, name):
+        """
+        Returns the number of children of parent with the given name in the map
+        """
+        if parent + '/' + name in self.path_uids:
+            return 1
+        count = 0
+        while '%s/%s[%d]' % (parent, name, count + 1) in self.path_uids:
+            count += 1
+        return count
+
+    @staticmethod
+    def _subtree_paths(tixi_handle, path):
+        """
+        Returns the paths of the element at path and of all its descendants, relative to path
+        """
+        return [''] + [descendant[len(path):] for descendant in tixi_helper.resolve_xpaths(tixi_handle, path + '//*')]
+
+    def _move_subtrees(self, tixi_handle, moves):
+        """
+        Updates the map after elements were renamed or moved together with their descendants
+
+        :param moves: list of tuples (path before, path after) of the moved elements
+        """
+        entries = []
+        for old_path, new_path in moves:
+            entries.extend((old_path + relative_path, new_path + relative_path)
+                           for relative_path in self._subtree_paths(tixi_handle, new_path))
+
+        # all entries are removed first, as the new path of an element might be the old path of another one
+        moved_uids = []
+        for old_path, new_path in entries:
+            uid = self.path_uids.pop(old_path, _UNKNOWN)
+            if uid is not _UNKNOWN:
+                moved_uids.append((new_path, uid))
+            self._drop_cached_lookups(old_path)
+            self._drop_cached_lookups(new_path)
+        for new_path, uid in moved_uids:
+            self.path_uids[new_path] = uid
+
+    def _move_children(self, tixi_handle, parent, names, new_names, new_positions):
+        """
+        Updates the map after children of parent were renamed or reordered
+
+        :param names: names of the children before the change
+        :param new_names: names of the children after the change
+        :param new_positions: position of each child after the change
+        """
+        steps = tixi_helper.child_steps(names)
+        new_steps = tixi_helper.child_steps(new_names)
+        self._move_subtrees(tixi_handle, [(parent + '/' + steps[i], parent + '/' + new_steps[new_positions[i]])
+                                          for i in range(len(names)) if steps[i] != new_steps[new_positions[i]]])
+
+    def rename_element(self, tixi_handle, parent, old_name, new_name):
+        """
+        Renames the child old_name of parent with TiXI and updates the map of element paths
+        """
+        parent_path = self._map_path(parent) if self._has_path_uids(tixi_handle) else None
+        if parent_path is None:
+            tixi_handle.renameElement(parent, old_name, new_name)
+            return
+
+        if self._count_children(parent_path, old_name) == 1 and self._count_children(parent_path, new_name) == 0:
+            # only the renamed element changes its path
+            tixi_handle.renameElement(parent, old_name, new_name)
+            self._move_subtrees(tixi_handle, [(parent_path + '/' + old_name, parent_path + '/' + new_name)])
+            return
+
+        # the indices of the siblings with both names might change
+        names = tixi_helper.child_names(tixi_handle, parent_path)
+        tixi_handle.renameElement(parent, old_name, new_name)
+        new_names = tixi_helper.child_names(tixi_handle, parent_path)
+        self._move_children(tixi_handle, parent_path, names, new_names, list(range(len(names))))
+
+    def swap_elements(self, tixi_handle, parent, first, second):
+        """
+        Swaps the children first and second of parent with TiXI and updates the map of element paths
+        """
+        parent_path = self._map_path(parent) if self._has_path_uids(tixi_handle) else None
+        if parent_path is None or \
+                (self._count_children(parent_path, first) == 1 and self._count_children(parent_path, second) == 1):
+            # single children keep their paths
+            tixi_handle.swapElements(parent + '/' + first, parent + '/' + second)
+            return
+
+        # the indices of the siblings with the same names might change
+        names = tixi_helper.child_names(tixi_handle, parent_path)
+        tixi_handle.swapElements(parent + '/' + first, parent + '/' + second)
+        i, j = names.index(first), names.index(second)
+        new_names = list(names)
+        new_names[i], new_names[j] = names[j], names[i]
+        new_positions = list(range(len(names)))
+        new_positions[i], new_positions[j] = j, i
+        self._move_children(tixi_handle, parent_path, names, new_names, new_positions)
+
+    def remove_element(self, tixi_handle, path):
+        """
+        Removes the element at path with TiXI and updates the map of element paths
+        """
+        element_path = self._map_path(path) if self._has_path_uids(tixi_handle) else None
+        if element_path is None:
+            tixi_handle.removeElement(path)
+            return
+
+        parent, name = tixi_helper.split_parent_child_path(element_path)
+        count = self._count_children(parent, name)
+        removed_paths = [element_path + relative_path
+                         for relative_path in self._subtree_paths(tixi_handle, element_path)]
+
+        tixi_handle.removeElement(path)
+
+        for removed_path in removed_paths:
+            self.path_uids.pop(removed_path, None)
+            self._drop_cached_lookups(removed_path)
+
+        # the following siblings of the same name move up by one. A single remaining sibling loses its index
+        if count > 1:
+            index = int(element_path[element_path.rindex('[') + 1:-1])
+            new_steps = tixi_helper.child_steps([name] * (count - 1))
+            moves = []
+            for i in range(1, count + 1):
+                if i != index:
+                    old_step, new_step = '%s[%d]' % (name, i), new_steps[i - 1 if i < index else i - 2]
+                    if old_step != new_step:
+                        moves.append((parent + '/' + old_step, parent + '/' + new_step))
+            self._move_subtrees(tixi_handle, moves)
+
+    def get_uid(self, tixi_handle, path):
+        """
+        Returns the uID of the element at path
+        """
+        if self._has_path_uids(tixi_handle):
+            uid = self.path_uids.get(path)
+            if uid is not None:
+                return uid
+        return tixi_handle.getTextAttribute(path, 'uID')
+
+    def next_parent_uid(self, tixi_handle, current_path):
+        """
+        Returns the uID of the nearest parent element having a uID and the name of the element at current_path.
+        Uses the map of element paths to uIDs, which avoids reading the uIDs with TiXI.
+
+        Elements missing in the map were created after the map was built. As all uIDs are added
+        through set_uid_path, they don't have a uID.
+        """
+        if not self._has_path_uids(tixi_handle):
+            return tixi_helper.next_parent_uid(tixi_handle, current_path)
+
+        if not current_path.startswith('/'):
+            current_path = '/' + current_path
+        parent, elem = tixi_helper.split_parent_child_path(current_path)
+
+        parent_uid = self._nearest_uid_cache.get(parent)
+        if parent_uid is None:
+            parent_uid = ''
+            visited = []
+            ancestor = parent
+            while ancestor != '':
+                ancestor = self._map_path(ancestor) or ancestor
+                visited.append(ancestor)
+                uid = self.path_uids.get(ancestor)
+                if uid is not None:
+                    parent_uid = uid
+                    break
+                ancestor, _ = tixi_helper.split_parent_child_path(ancestor)
+
+            self._nearest_uid_cache[parent] = parent_uid
+            for path in visited:
+                self._cache_dependents.setdefault(path, []).append(parent)
+
+        return parent_uid, elem
+
     def register_all_uids(self, tixi_handle):
         """
-        Gets all elements with uiDs and registers them
+        Gets all elements with uiDs and registers them.
+        The paths of all elements are stored in the map of element paths to uIDs in the same traversal.
         :param tixi_handle:
         """
 
         self.invalid_uids = []
         self.empty_uid_paths = []
         self.uids = set()
+        self._next_suffix = {}
+        self.path_uids = {}
+        self._nearest_uid_cache = {}
+        self._cache_dependents = {}
+        self._path_uids_handle = weakref.ref(tixi_handle)
 
         logging.info("Registering all uIDs")
-        paths = tixi_helper.resolve_xpaths(tixi_handle, "/cpacs//*[@uID]")
-        for elem in paths:
-            uid = tixi_handle.getTextAttribute(elem, "uID")
+        for element, elem in tixi_helper.iter_element_paths(tixi_handle):
+            uid = element.get('uID')
+            if uid is None:
+                self.path_uids[elem] = None
+                continue
+
+            uid = sys.intern(uid)
+            self.path_uids[elem] = uid
             if uid == "":
                 self.empty_uid_paths.append(elem)
             else:
@@ -65,35 +315,47 @@ class UIDManager(object):
 
         self.invalid_uids = list(sorted(set(self.invalid_uids)))
 
-    def __fix_duplicate_uid(self, tixi_handle, uid):
+    @staticmethod
+    def __closest_uid_path(sorted_uid_paths, document_order, text_path):
+        """
+        Returns the uid path sharing the longest common prefix with text_path.
+        On ties, the uid path appearing first in the document is returned.
+        """
+        # the longest common prefix is shared with one of the sorted neighbours of text_path
+        pos = bisect.bisect_left(sorted_uid_paths, text_path)
+        neighbours = sorted_uid_paths[max(pos - 1, 0):pos + 1]
+        prefix = max((os.path.commonprefix([uid_path, text_path]) for uid_path in neighbours), key=len)
+
+        # all uid paths starting with this prefix form a contiguous range in sorted order
+        candidates = []
+        for uid_path in sorted_uid_paths[bisect.bisect_left(sorted_uid_paths, prefix):]:
+            if not uid_path.startswith(prefix):
+                break
+            candidates.append(uid_path)
+        return min(candidates, key=document_order.get)
+
+    def __fix_duplicate_uid(self, tixi_handle, uid, uid_paths, text_paths_match_uid):
         """
         Fixed a duplicate uid in the cpacs file
 
         :param tixi_handle: Handle to cpacs file
         :param uid: possibly duplicate uid
+        :param uid_paths: paths of all elements with this uid in document order
+        :param text_paths_match_uid: paths of all elements referencing this uid
         """
-        uid_paths = (tixi_helper.resolve_xpaths(tixi_handle, "//*[@uID='%s']" % uid))
         if len(uid_paths) <= 1:
             return
 
-        text_paths_match_uid = (tixi_helper.resolve_xpaths(tixi_handle, "//*[text()='%s']" % uid))
-
-        uid_map = {}
+        uid_map = OrderedDict()
         for uid_path in uid_paths:
             uid_map[uid_path] = []
 
         # for each of the text nodes, select those uid that has the longest parent node
         # map these text_node -> uid node
+        sorted_uid_paths = sorted(uid_paths)
+        document_order = dict((uid_path, i) for i, uid_path in enumerate(uid_paths))
         for text_node_path in text_paths_match_uid:
-
-            longest_str = ""
-            longest_uid_path = ""
-            for uid_path in uid_paths:
-                substring = os.path.commonprefix([uid_path, text_node_path])
-                if len(substring) > len(longest_str):
-                    longest_str = substring
-                    longest_uid_path = uid_path
-
+            longest_uid_path = self.__closest_uid_path(sorted_uid_paths, document_order, text_node_path)
             uid_map[longest_uid_path].append(text_node_path)
 
         for uid_path, text_paths in uid_map.items():
@@ -101,6 +363,7 @@ class UIDManager(object):
             logging.info ("Renaming duplicate uid='%s' to '%s'" % (uid, new_uid))
             tixi_handle.removeAttribute(uid_path, "uID")
             tixi_handle.addTextAttribute(uid_path, "uID", new_uid)
+            self.set_uid_path(uid_path, new_uid)
             for text_path in text_paths:
                 tixi_handle.updateTextElement(text_path, new_uid)
 
@@ -116,11 +379,16 @@ class UIDManager(object):
             logging.info('Replacing empty uid with "%s"' % new_uid)
             tixi_handle.removeAttribute(elem, "uID")
             tixi_handle.addTextAttribute(elem, "uID", new_uid)
+            self.set_uid_path(elem, new_uid)
 
         if len(self.invalid_uids) > 0:
             logging.warning("There are duplicate uIDs in the data set!")
-        for uid in self.invalid_uids:
-            self.__fix_duplicate_uid(tixi_handle, uid)
+
+            # owners and references of all duplicate uids are collected in one pass.
+            # Renaming a duplicate neither moves elements nor touches references of other duplicates.
+            owners, references = tixi_helper.find_uid_owners_and_references(tixi_handle, self.invalid_uids)
+            for uid in self.invalid_uids:
+                self.__fix_duplicate_uid(tixi_handle, uid, owners[uid], references[uid])
 
         if len(self.invalid_uids) > 0 or len(self.empty_uid_paths) > 0:
             return True
@@ -0,0 +1,66 @@
+import os
+
+from tixi3 import tixi3wrapper
+
+from cpacs2to3.api import convert, ConversionOptions
+
+
+def _without_timestamps(xml):
+    return [line for line in xml.decode("utf-8").splitlines() if "<timestamp>" not in line]
+
+
+def test_convert_in_memory():
+    "the library api must convert a document without writing files"
+
+    file_name = "tests/TestData/simpletest.cpacs.xml"
+    with open(file_name, "rb") as f:
+        document = f.read()
+
+    converted, report = convert(document, "3.1", ConversionOptions(fix_errors=True))
+
+    assert not os.path.exists(file_name + ".fixed")
+    assert report.target_version == "3.1"
+    assert report.source_version.startswith("2")
+
+    result = tixi3wrapper.Tixi3()
+    result.openString(converted.decode("utf-8"))
+    result.schemaValidateFromFile("tests/TestData/cpacs_3.1.0.xsd")
+    assert result.getTextElement("/cpacs/header/cpacsVersion") == "3.1"
+
+
+def test_convert_with_memory_budget():
+    "freeing the cpacs 2 document and the tigl handles early must not change the result"
+
+    with open("tests/TestData/simpletest.cpacs.xml", "rb") as f:
+        document = f.read()
+
+    converted, _ = convert(document, "3.1", ConversionOptions(fix_errors=True))
+    converted_with_budget, _ = convert(document, "3.1", ConversionOptions(fix_errors=True, memory_budget=1024))
+    assert _without_timestamps(converted_with_budget) == _without_timestamps(converted)
+
+
+def test_geometry_cache_does_not_change_the_result(tmp_path):
+    "conversions with a cold and a warm geometry cache must give the same document as without cache"
+
+    with open("tests/TestData/guidecurves.cpacs.xml", "rb") as f:
+        document = f.read()
+
+    converted, _ = convert(document, "3.1", ConversionOptions(fix_errors=True))
+    options = ConversionOptions(fix_errors=True, cache_dir=str(tmp_path / "cache"))
+    converted_cold, _ = convert(document, "3.1", options)
+    converted_warm, _ = convert(document, "3.1", options)
+
+    assert _without_timestamps(converted_cold) == _without_timestamps(converted)
+    assert _without_timestamps(converted_warm) == _without_timestamps(converted)
+
+
+def test_parallel_geometry_conversion_does_not_change_the_result():
+    "converting the configurations in worker processes must give the same document as in a single process"
+
+    with open("tests/TestData/twoconfigurations.cpacs.xml", "rb") as f:
+        document = f.read()
+
+    converted, _ = convert(document, "3.1", ConversionOptions(fix_errors=True, geometry_jobs=1))
+    converted_in_parallel, _ = convert(document, "3.1", ConversionOptions(fix_errors=True, geometry_jobs=2))
+
+    assert _without_timestamps(converted_in_parallel) == _without_timestamps(converted)
@@ -0,0 +1,65 @@
+import argparse
+import os
+
+from cpacs2to3 import batch
+from cpacs2to3.batch import output_paths, run_batch
+
+
+def test_output_paths_keep_file_names():
+    assert output_paths(["a/wing.xml", "b/fuselage.xml"], "out") == [os.path.join("out", "wing.xml"),
+                                                                     os.path.join("out", "fuselage.xml")]
+
+
+def test_output_paths_of_files_with_the_same_name():
+    "files with the same name must not overwrite each other"
+
+    files = [os.path.join("models", "a", "aircraft.xml"), os.path.join("models", "b", "c", "aircraft.xml")]
+    assert output_paths(files, "out") == [os.path.join("out", "a", "aircraft.xml"),
+                                          os.path.join("out", "b", "c", "aircraft.xml")]
+
+
+def _batch_args(input_files, output_dir, jobs, geometry_jobs=1):
+    return argparse.Namespace(input_files=input_files, manifest=None, output_dir=output_dir, jobs=jobs,
+                              fix_errors=True, target_version="3.1", configurations=None,
+                              geometry_jobs=geometry_jobs, cache_dir=None, cache_size=1024, element_index=False,
+                              streaming=False, memory_budget=None)
+
+
+def test_run_batch_reports_failed_files(tmp_path):
+    "a file that cannot be converted must be reported without stopping the conversion of the other files"
+
+    malformed_file = tmp_path / "malformed.cpacs.xml"
+    malformed_file.write_text("<cpacs><header>")
+    input_files = ["tests/TestData/simpletest.cpacs.xml", "tests/TestData/guidecurves.cpacs.xml",
+                   str(malformed_file)]
+    output_dir = tmp_path / "out"
+
+    assert run_batch(_batch_args(input_files, str(output_dir), jobs=2)) == 1
+    assert (output_dir / "simpletest.cpacs.xml").exists()
+    assert (output_dir / "guidecurves.cpacs.xml").exists()
+    assert not (output_dir / "malformed.cpacs.xml").exists()
+
+    assert run_batch(_batch_args(input_files[:2], str(tmp_path / "out2"), jobs=2)) == 0
+
+
+def test_convert_job_catches_system_exit(monkeypatch):
+    "a conversion calling sys.exit must not terminate the worker process"
+
+    def convert_file(input_file, output_file, args, version_updater):
+        raise SystemExit(2)
+
+    monkeypatch.setattr(batch, "convert_file", convert_file)
+    input_file, error, _ = batch._convert_job(("in.xml", "out.xml"))
+    assert input_file == "in.xml"
+    assert error == "SystemExit: 2"
+
+
+def test_run_batch_with_parallel_geometry_conversion(tmp_path):
+    "batch workers must not fail, if the geometry of each file should be converted by several processes as well"
+
+    input_files = ["tests/TestData/twoconfigurations.cpacs.xml", "tests/TestData/simpletest.cpacs.xml"]
+    output_dir = tmp_path / "out"
+
+    assert run_batch(_batch_args(input_files, str(output_dir), jobs=2, geometry_jobs=2)) == 0
+    assert (output_dir / "twoconfigurations.cpacs.xml").exists()
+    assert (output_dir / "simpletest.cpacs.xml").exists()
@@ -0,0 +1,63 @@
+from cpacs2to3 import tixi_helper
+from cpacs2to3.tixi_helper import IndexedTixi
+
+XPATHS = [
+    '//transformation',
+    '//section/elements/element|//positioning',
+    '//lowerShell|//upperShell|//cell',
+    '//material',
+    '//wing/segments/segment',
+]
+
+
+def test_index_matches_tixi(simple_test):
+    "the element index must return the same paths as TiXI"
+
+    tixi = simple_test.new_cpacs_file
+    indexed = IndexedTixi(tixi)
+
+    for xpath in XPATHS:
+        assert tixi_helper.resolve_xpaths(indexed, xpath) == tixi_helper.resolve_xpaths(tixi, xpath)
+
+
+def test_index_is_patched(simple_test):
+    "the element index must follow insertions, renames and removals"
+
+    tixi = simple_test.new_cpacs_file
+    indexed = IndexedTixi(tixi)
+    tixi_helper.resolve_xpaths(indexed, '//transformation')
+
+    fuselage = '/cpacs/vehicles/aircraft/model/fuselages/fuselage'
+    indexed.createElementAtIndex(fuselage, 'transformation', 1)
+    indexed.addTextElement(fuselage + '/transformation[1]', 'scaling', '')
+    indexed.renameElement(fuselage + '/sections/section[2]', 'transformation', 'transformationRenamed')
+    indexed.removeElement(fuselage + '/sections/section[3]/transformation')
+    assert indexed.element_index is not None
+
+    for xpath in XPATHS + ['//transformation/scaling', '//transformationRenamed']:
+        assert tixi_helper.resolve_xpaths(indexed, xpath) == tixi_helper.resolve_xpaths(tixi, xpath)
+
+
+def test_index_is_not_rebuilt(simple_test, monkeypatch):
+    "patched changes must not rebuild the index"
+
+    tixi = simple_test.new_cpacs_file
+    indexed = IndexedTixi(tixi)
+    tixi_helper.resolve_xpaths(indexed, '//transformation')
+    index = indexed.element_index
+
+    def parse(*args):
+        raise AssertionError("the index was rebuilt")
+
+    monkeypatch.setattr(tixi_helper.ElementTree, 'fromstring', parse)
+
+    fuselage = '/cpacs/vehicles/aircraft/model/fuselages/fuselage'
+    for i in range(3):
+        indexed.createElement(fuselage, 'transformation')
+        assert tixi_helper.resolve_xpaths(indexed, '//fuselage/transformation') == \
+            tixi_helper.resolve_xpaths(tixi, '//fuselage/transformation')
+        indexed.removeElement(fuselage + '/transformation[1]')
+        assert tixi_helper.resolve_xpaths(indexed, '//fuselage/transformation') == \
+            tixi_helper.resolve_xpaths(tixi, '//fuselage/transformation')
+
+    assert indexed.element_index is index
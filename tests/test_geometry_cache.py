@@ -0,0 +1,25 @@
+import os
+import time
+
+from cpacs2to3.geometry_cache import GeometryCache, STALE_TMP_AGE
+
+
+def test_evict_removes_stale_temporary_files(tmp_path):
+    "temporary files of crashed conversions must not stay in the cache forever"
+
+    cache = GeometryCache(str(tmp_path))
+    cache.geometry_key = "key"
+    cache.get_or_compute("point", [0.5], lambda: [1., 2., 3.])
+
+    stale_file = tmp_path / "stale.tmp"
+    stale_file.write_text("[1.0,")
+    stale_time = time.time() - 2 * STALE_TMP_AGE
+    os.utime(str(stale_file), (stale_time, stale_time))
+    recent_file = tmp_path / "recent.tmp"
+    recent_file.write_text("[1.0,")
+
+    cache.evict()
+
+    assert not stale_file.exists()
+    assert recent_file.exists()
+    assert len(list(tmp_path.glob("*.json"))) == 1
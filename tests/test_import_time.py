@@ -0,0 +1,39 @@
+import subprocess
+import sys
+
+import pytest
+
+# modules of the geometry stack, that must only be loaded by the geometric conversion
+HEAVY_MODULES = ['numpy', 'tigl', 'tigl3', 'OCC']
+
+# import time budget of each entry point in seconds
+IMPORT_TIME_BUDGET = 0.5
+
+ENTRY_POINTS = [
+    'cpacs2to3.cpacs_converter',
+    'cpacs2to3.tools.fix_errors',
+    'cpacs2to3.api',
+    'cpacs2to3.batch',
+    'cpacs2to3.streaming',
+]
+
+IMPORT_SCRIPT = """
+import sys, time
+start = time.time()
+import {module}
+print(time.time() - start)
+print(','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+@pytest.mark.parametrize('module', ENTRY_POINTS)
+def test_import_is_lightweight(module):
+    "importing an entry point must neither load the geometry stack nor exceed the import time budget"
+
+    script = IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', script], universal_newlines=True)
+    lines = output.splitlines()
+    duration, loaded = float(lines[-2]), lines[-1]
+
+    assert loaded == ''
+    assert duration < IMPORT_TIME_BUDGET
@@ -0,0 +1,54 @@
+from cpacs2to3 import profiling
+from cpacs2to3.tixi_helper import TixiProxy
+
+
+class _Handle(object):
+    def checkElement(self, path):
+        return path == '/cpacs'
+
+
+class _Wrapper(TixiProxy):
+    def find(self, path):
+        return self.checkElement(path)
+
+
+def test_profiling_disabled():
+    "without an active profiler, handles must not be wrapped"
+
+    handle = _Handle()
+    assert profiling.wrap(handle, 'tixi3') is handle
+    with profiling.stage('pass'):
+        pass
+
+
+def test_profile_counts_calls_per_stage():
+    profiler = profiling.start()
+    try:
+        handle = profiling.wrap(_Handle(), 'tixi3')
+        with profiling.stage('upgrade'):
+            with profiling.stage('pass'):
+                assert handle.checkElement('/cpacs')
+                assert not handle.checkElement('/cpacs/header')
+    finally:
+        assert profiling.stop() is profiler
+
+    report = profiler.report()
+    assert report['calls']['tixi3.checkElement']['calls'] == 2
+    assert [stage['stage'] for stage in report['stages']] == ['upgrade/pass', 'upgrade']
+    assert report['stages'][0]['library_calls'] == 2
+
+
+def test_profile_counts_only_library_calls():
+    "methods of wrappers around the library handle must not be counted as library calls"
+
+    profiler = profiling.start()
+    try:
+        handle = profiling.wrap(_Wrapper(_Handle()), 'tixi3')
+        assert handle.find('/cpacs')
+        assert handle.checkElement('/cpacs')
+    finally:
+        profiling.stop()
+
+    report = profiler.report()
+    assert 'tixi3.find' not in report['calls']
+    assert report['calls']['tixi3.checkElement']['calls'] == 1
@@ -0,0 +1,65 @@
+import os
+import signal
+import time
+
+import pytest
+
+from cpacs2to3.serve import WorkerPool, JobTimeoutError, JobError
+
+
+def _pid_job(delay):
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _failing_job():
+    raise ValueError("invalid document")
+
+
+def test_worker_pool_recycles_workers():
+    "a worker must be replaced after max_jobs_per_worker jobs"
+
+    pool = WorkerPool(1, _pid_job, max_jobs_per_worker=2)
+    try:
+        pids = [pool.submit((0,)) for _ in range(4)]
+    finally:
+        pool.close()
+
+    assert pids[0] == pids[1]
+    assert pids[2] == pids[3]
+    assert pids[1] != pids[2]
+
+
+def test_worker_pool_timeout_and_errors():
+    "jobs exceeding the timeout must not block the pool"
+
+    pool = WorkerPool(1, _pid_job)
+    try:
+        with pytest.raises(JobTimeoutError):
+            pool.submit((10,), timeout=0.5)
+        assert pool.submit((0,), timeout=5) > 0
+    finally:
+        pool.close()
+
+    pool = WorkerPool(1, _failing_job)
+    try:
+        with pytest.raises(JobError):
+            pool.submit(())
+    finally:
+        pool.close()
+
+
+def test_worker_pool_replaces_dead_workers():
+    "a worker, that died between two jobs, must be replaced"
+
+    pool = WorkerPool(1, _pid_job)
+    try:
+        pid = pool.submit((0,), timeout=5)
+        os.kill(pid, signal.SIGKILL)
+        time.sleep(0.5)
+
+        with pytest.raises(JobError):
+            pool.submit((0,), timeout=5)
+        assert pool.submit((0,), timeout=5) not in (pid, None)
+    finally:
+        pool.close()
@@ -0,0 +1,57 @@
+from xml.etree import ElementTree
+
+from tixi3 import tixi3wrapper
+
+from cpacs2to3 import tixi_helper
+from cpacs2to3.cpacs_converter import upgrade_2_to_3, upgrade_3_to_31
+from cpacs2to3.streaming import stream_upgrade
+
+
+def test_streaming_matches_tixi(simple_test, tmp_path):
+    "the streaming upgrade must produce the same structure as the TiXI based upgrade"
+
+    tixi = simple_test.new_cpacs_file
+    upgrade_2_to_3(tixi, simple_test)
+
+    cpacs30_file = str(tmp_path / "cpacs30.xml")
+    streamed_file = str(tmp_path / "streamed.xml")
+    tixi.save(cpacs30_file)
+
+    stream_upgrade(cpacs30_file, streamed_file, "3.1")
+    upgrade_3_to_31(tixi, simple_test)
+
+    streamed = tixi3wrapper.Tixi3()
+    streamed.open(streamed_file)
+    streamed.schemaValidateFromFile("tests/TestData/cpacs_3.1.0.xsd")
+
+    assert streamed.getTextElement("/cpacs/header/cpacsVersion") == "3.1"
+    for xpath in ['//controlParameter', '//doubleSidedExtrusion', '//material/isotropicProperties',
+                  '//material/orthotropicSolidProperties', '//stringer/refPoint', '//stringer/angle']:
+        assert tixi_helper.resolve_xpaths(streamed, xpath) == tixi_helper.resolve_xpaths(tixi, xpath)
+
+
+def test_streaming_keeps_comments_and_namespaces(simple_test, tmp_path):
+    "comments and namespace prefixed attributes inside buffered subtrees must be kept"
+
+    tixi = simple_test.new_cpacs_file
+    upgrade_2_to_3(tixi, simple_test)
+
+    document = tixi.exportDocumentAsString()
+    document = document.replace('<material uID="aluminium2024">', '<material uID="aluminium2024"><!-- aluminium -->', 1)
+    document = document.replace('<stringer>', '<stringer xsi:nil="false">', 1)
+
+    cpacs30_file = str(tmp_path / "cpacs30.xml")
+    streamed_file = str(tmp_path / "streamed.xml")
+    with open(cpacs30_file, "w") as f:
+        f.write(document)
+
+    stream_upgrade(cpacs30_file, streamed_file, "3.1")
+
+    parser = ElementTree.XMLParser(target=ElementTree.TreeBuilder(insert_comments=True))
+    root = ElementTree.parse(streamed_file, parser).getroot()
+
+    material = root.find("vehicles/materials/material[@uID='aluminium2024']")
+    assert [child.text for child in material if child.tag is ElementTree.Comment] == [" aluminium "]
+
+    xsi_nil = "{http://www.w3.org/2001/XMLSchema-instance}nil"
+    assert [stringer.get(xsi_nil) for stringer in root.iter("stringer") if xsi_nil in stringer.attrib] == ["false"]
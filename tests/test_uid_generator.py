@@ -0,0 +1,26 @@
+from cpacs2to3 import tixi_helper
+from cpacs2to3.uid_generator import uid_manager
+
+
+def test_uid_paths_follow_structural_changes(simple_test):
+    "renamed, swapped and removed elements must be re-keyed in the map of element paths"
+
+    tixi = simple_test.new_cpacs_file
+    fuselage = '/cpacs/vehicles/aircraft/model/fuselages/fuselage'
+    sections = fuselage + '/sections'
+    uid_manager.register_all_uids(tixi)
+
+    # warm the cache of the nearest parent uIDs
+    uid_manager.next_parent_uid(tixi, sections + '/section[2]/transformation/scaling/x')
+
+    uid_manager.rename_element(tixi, fuselage, 'sections', 'sectionList')
+    uid_manager.swap_elements(tixi, fuselage + '/sectionList/section[3]', 'name', 'transformation')
+    uid_manager.remove_element(tixi, fuselage + '/sectionList/section[1]')
+    uid_manager.rename_element(tixi, fuselage + '/sectionList', 'section', 'renamedSection')
+    path_uids = dict(uid_manager.path_uids)
+
+    for path in tixi_helper.resolve_xpaths(tixi, '//transformation/*'):
+        assert uid_manager.next_parent_uid(tixi, path) == tixi_helper.next_parent_uid(tixi, path)
+
+    uid_manager.register_all_uids(tixi)
+    assert path_uids == uid_manager.path_uids